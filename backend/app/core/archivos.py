@@ -0,0 +1,222 @@
+"""
+Almacen de archivos por contenido (fotos de tareas, PDFs de auditoria, imagenes de facturas).
+
+Los binarios se guardan en disco y no en Postgres: cada archivo vive bajo su sha256
+(<raiz>/ab/cd/abcd...), asi el mismo contenido se guarda una sola vez. La escritura es
+atomica (temporal en el mismo directorio + os.replace) y la BD solo guarda el hash.
+Las descargas salen directo del archivo, con el hash como ETag y soporte de Range.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from .config import settings
+
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_RE = re.compile(r"^data:(?P<tipo>[\w.+-]+/[\w.+-]+)?(?:;[\w-]+=[^;,]*)*;base64,", re.IGNORECASE)
+
+# Bloque de lectura para respuestas parciales (Range)
+TAMANO_BLOQUE = 64 * 1024
+
+
+class AlmacenArchivos(ABC):
+    """Interfaz del almacen de archivos: se guarda por contenido y se ubica por hash"""
+
+    @abstractmethod
+    def guardar(self, contenido: bytes) -> str:
+        """Guarda el contenido (si no existe ya) y retorna su hash"""
+
+    @abstractmethod
+    def ruta(self, hash_archivo: str) -> str:
+        """Ruta local para servir el archivo"""
+
+    @abstractmethod
+    def leer(self, hash_archivo: str) -> bytes:
+        """Contenido completo del archivo"""
+
+    @abstractmethod
+    def eliminar(self, hash_archivo: str) -> None:
+        """Borra el archivo (no falla si ya no existe)"""
+
+    @abstractmethod
+    def listar(self) -> Iterator[Tuple[str, float]]:
+        """(hash, fecha de modificacion) de todos los archivos guardados"""
+
+
+class AlmacenLocal(AlmacenArchivos):
+    """Almacen en el filesystem local (un volumen del contenedor)"""
+
+    def __init__(self, raiz: str):
+        self.raiz = os.path.abspath(raiz)
+
+    def ruta(self, hash_archivo: str) -> str:
+        if not HASH_RE.match(hash_archivo or ""):
+            raise ValueError(f"Hash de archivo invalido: {hash_archivo!r}")
+        return os.path.join(self.raiz, hash_archivo[:2], hash_archivo[2:4], hash_archivo)
+
+    def guardar(self, contenido: bytes) -> str:
+        hash_archivo = hashlib.sha256(contenido).hexdigest()
+        destino = self.ruta(hash_archivo)
+        if os.path.exists(destino):
+            # Ya estaba: se actualiza la fecha para que la limpieza de huerfanos no lo borre
+            # mientras la fila que lo referencia todavia no se confirmo
+            os.utime(destino)
+            return hash_archivo
+
+        directorio = os.path.dirname(destino)
+        os.makedirs(directorio, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=directorio, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(contenido)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temporal, 0o644)
+            os.replace(temporal, destino)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except FileNotFoundError:
+                pass
+            raise
+        return hash_archivo
+
+    def leer(self, hash_archivo: str) -> bytes:
+        with open(self.ruta(hash_archivo), "rb") as f:
+            return f.read()
+
+    def eliminar(self, hash_archivo: str) -> None:
+        try:
+            os.unlink(self.ruta(hash_archivo))
+        except FileNotFoundError:
+            pass
+
+    def listar(self) -> Iterator[Tuple[str, float]]:
+        for directorio, _, archivos in os.walk(self.raiz):
+            for nombre in archivos:
+                if HASH_RE.match(nombre):
+                    try:
+                        yield nombre, os.stat(os.path.join(directorio, nombre)).st_mtime
+                    except FileNotFoundError:
+                        continue
+
+
+_almacen: Optional[AlmacenArchivos] = None
+
+
+def get_almacen() -> AlmacenArchivos:
+    global _almacen
+    if _almacen is None:
+        _almacen = AlmacenLocal(settings.ARCHIVOS_DIR)
+    return _almacen
+
+
+def decodificar_data_url(valor: str) -> Tuple[bytes, Optional[str]]:
+    """(bytes, content_type) de un data URL base64 (o de base64 plano). ValueError si es invalido"""
+    valor = (valor or "").strip()
+    content_type = None
+    encabezado = DATA_URL_RE.match(valor)
+    if encabezado:
+        content_type = encabezado.group("tipo")
+        valor = valor[encabezado.end():]
+    try:
+        contenido = base64.b64decode(valor, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Imagen base64 invalida")
+    if not contenido:
+        raise ValueError("Imagen vacia")
+    return contenido, content_type
+
+
+def _rango(encabezado: Optional[str], tamano: int) -> Optional[Tuple[int, int]]:
+    """(inicio, fin) inclusivos de un header Range de un solo rango; None si no aplica"""
+    if not encabezado or not encabezado.startswith("bytes=") or "," in encabezado:
+        return None
+    inicio_txt, _, fin_txt = encabezado[6:].strip().partition("-")
+    try:
+        if inicio_txt == "":
+            sufijo = int(fin_txt)
+            inicio, fin = max(tamano - sufijo, 0), tamano - 1
+        else:
+            inicio = int(inicio_txt)
+            fin = min(int(fin_txt), tamano - 1) if fin_txt else tamano - 1
+    except ValueError:
+        return None
+    if inicio < 0 or inicio >= tamano or fin < inicio:
+        raise HTTPException(
+            status_code=416, detail="Rango no satisfacible",
+            headers={"Content-Range": f"bytes */{tamano}"},
+        )
+    return inicio, fin
+
+
+def _leer_rango(ruta: str, inicio: int, fin: int) -> Iterator[bytes]:
+    with open(ruta, "rb") as f:
+        f.seek(inicio)
+        restante = fin - inicio + 1
+        while restante > 0:
+            bloque = f.read(min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+def respuesta_archivo(
+    request: Request,
+    hash_archivo: str,
+    media_type: str,
+    filename: str,
+    disposicion: str = "inline",
+) -> Response:
+    """
+    Sirve un archivo del almacen sin pasar por memoria: FileResponse completo, 206 con un
+    Range, o 304 si el cliente ya tiene esa version (ETag = hash del contenido).
+    """
+    ruta = get_almacen().ruta(hash_archivo)
+    try:
+        tamano = os.stat(ruta).st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    etag = f'"{hash_archivo}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"{disposicion}; filename={filename}",
+    }
+
+    etags_cliente = [e.strip().removeprefix("W/") for e in request.headers.get("if-none-match", "").split(",")]
+    if etag in etags_cliente or "*" in etags_cliente:
+        return Response(status_code=304, headers=headers)
+
+    rango = None
+    if request.headers.get("if-range", etag) == etag:
+        rango = _rango(request.headers.get("range"), tamano)
+    if rango is None:
+        return FileResponse(ruta, media_type=media_type, headers=headers)
+
+    inicio, fin = rango
+    headers.update({
+        "Content-Range": f"bytes {inicio}-{fin}/{tamano}",
+        "Content-Length": str(fin - inicio + 1),
+    })
+    return StreamingResponse(_leer_rango(ruta, inicio, fin), status_code=206, media_type=media_type, headers=headers)
+
+
+def huerfanos(referenciados: set, gracia_segundos: int) -> Iterator[str]:
+    """Hashes guardados que ninguna fila referencia y que no se tocaron en `gracia_segundos`"""
+    limite = time.time() - gracia_segundos
+    for hash_archivo, modificado in get_almacen().listar():
+        if hash_archivo not in referenciados and modificado < limite:
+            yield hash_archivo
@@ -0,0 +1,287 @@
+"""
+Indice en memoria del catalogo de productos (items_central) para el typeahead.
+
+Guarda codigo, nombre, marca, costo, habilitado y stock por deposito en columnas compactas
+(listas de str internadas, array('d'), bytearray) mas un indice invertido de trigramas
+(trigrama -> array('I') de posiciones). Una tarea periodica lo refresca en forma incremental:
+compara un md5 por fila y solo trae de la BD los productos que cambiaron. Cada refresco arma
+un indice nuevo y lo reemplaza de una vez, asi las busquedas nunca ven un estado a medias.
+"""
+import heapq
+import json
+import math
+import sys
+import time
+from array import array
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from .database import SessionDux
+from .scheduler import periodica
+from .texto import tokens_busqueda
+
+# Tope de productos y depositos en memoria (acota la RAM del proceso)
+MAX_ITEMS = 200_000
+MAX_DEPOSITOS = 64
+
+# Firma de una fila: si cambia, el producto se vuelve a leer
+FIRMA_SQL = "md5(concat_ws('|', item, marca_nombre, costo, habilitado, stock::text))"
+
+
+def texto_item(cod_item: str, item: Optional[str], marca: Optional[str]) -> str:
+    """Texto normalizado de busqueda (mismo criterio que ITEM_TEXTO_SQL en routes/items.py)"""
+    return f"{item or ''} {marca or ''} {cod_item or ''}".lower()
+
+
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _cantidad(deposito: dict, *claves: str) -> float:
+    """Primer valor numerico entre las claves de una entrada de stock (NaN si ninguno)"""
+    for clave in claves:
+        try:
+            return float(deposito[clave])
+        except (KeyError, ValueError, TypeError):
+            continue
+    return math.nan
+
+
+def stock_por_deposito(stock) -> dict:
+    """{nombre_deposito: (stock_real, stock_disponible)} desde el JSON de items_central"""
+    if isinstance(stock, str):
+        stock = json.loads(stock)
+    resultado = {}
+    for deposito in stock if isinstance(stock, list) else []:
+        if not isinstance(deposito, dict) or not deposito.get("nombre"):
+            continue
+        disponible = _cantidad(deposito, "stock_disponible", "ctd_disponible")
+        resultado[deposito["nombre"]] = (
+            _cantidad(deposito, "stock_real", "ctd_real"),
+            0.0 if math.isnan(disponible) else disponible,
+        )
+    return resultado
+
+
+def entradas_stock(stock: dict) -> list:
+    """
+    Stock por deposito en el formato de ItemSearch; lo usan tanto el indice en memoria
+    como la busqueda en la BD, asi las dos devuelven los mismos campos
+    """
+    return [
+        {
+            "nombre": nombre,
+            "stock_real": None if math.isnan(real) else real,
+            "stock_disponible": disponible,
+        }
+        for nombre, (real, disponible) in sorted(stock.items())
+    ]
+
+
+class IndiceCatalogo:
+    """Snapshot inmutable del catalogo; se reemplaza entero en cada refresco"""
+    __slots__ = (
+        "codigos", "nombres", "marcas", "costos", "habilitados", "firmas", "textos",
+        "depositos", "stock", "stock_real", "posicion", "trigramas",
+        "construido_en", "duracion_ms", "modo", "bytes_aprox",
+    )
+
+    def __init__(self, filas: list, depositos: list, modo: str, inicio: float):
+        """filas: tuplas (cod_item, item, marca, costo, habilitado, firma, {deposito: (real, disponible)})"""
+        self.depositos = depositos[:MAX_DEPOSITOS]
+        columna = {nombre: j for j, nombre in enumerate(self.depositos)}
+        ancho = len(self.depositos)
+
+        self.codigos, self.nombres, self.marcas, self.firmas, self.textos = [], [], [], [], []
+        self.costos = array("d")
+        self.habilitados = bytearray()
+        self.stock = array("d", [math.nan]) * (len(filas) * ancho)
+        self.stock_real = array("d", [math.nan]) * (len(filas) * ancho)
+        for i, (cod_item, item, marca, costo, habilitado, firma, stock) in enumerate(filas):
+            self.codigos.append(cod_item)
+            self.nombres.append(item or "")
+            self.marcas.append(sys.intern(marca) if marca else None)
+            self.firmas.append(firma)
+            self.textos.append(texto_item(cod_item, item, marca))
+            self.costos.append(costo)
+            self.habilitados.append(1 if habilitado else 0)
+            for nombre, (real, disponible) in stock.items():
+                j = columna.get(nombre)
+                if j is not None:
+                    self.stock[i * ancho + j] = disponible
+                    self.stock_real[i * ancho + j] = real
+        self.posicion = {cod: i for i, cod in enumerate(self.codigos)}
+
+        # Indice invertido: trigrama -> posiciones (ordenadas) de los productos que lo contienen
+        postings = {}
+        for i, texto in enumerate(self.textos):
+            for trigrama in _trigramas(texto):
+                postings.setdefault(trigrama, []).append(i)
+        self.trigramas = {t: array("I", p) for t, p in postings.items()}
+
+        self.modo = modo
+        self.construido_en = datetime.now()
+        self.duracion_ms = round((time.monotonic() - inicio) * 1000)
+        self.bytes_aprox = (
+            sum(sys.getsizeof(a) for a in self.trigramas.values()) + sys.getsizeof(self.trigramas)
+            + sum(sys.getsizeof(t) for t in self.textos) + sum(sys.getsizeof(n) for n in self.nombres)
+            + sum(sys.getsizeof(c) for c in self.codigos) + sys.getsizeof(self.posicion)
+            + sys.getsizeof(self.costos) + sys.getsizeof(self.habilitados) + sys.getsizeof(self.stock)
+            + sys.getsizeof(self.stock_real)
+        )
+
+    def fila(self, i: int) -> tuple:
+        ancho = len(self.depositos)
+        stock = {
+            self.depositos[j]: (self.stock_real[i * ancho + j], self.stock[i * ancho + j])
+            for j in range(ancho) if not math.isnan(self.stock[i * ancho + j])
+        }
+        return (self.codigos[i], self.nombres[i], self.marcas[i], self.costos[i],
+                bool(self.habilitados[i]), self.firmas[i], stock)
+
+    def item(self, i: int) -> dict:
+        """Producto en el formato de ItemSearch (stock como lista de depositos)"""
+        _, nombre, marca, costo, habilitado, _, stock = self.fila(i)
+        return {
+            "cod_item": self.codigos[i],
+            "item": nombre,
+            "marca_nombre": marca,
+            "costo": costo if not math.isnan(costo) else None,
+            "habilitado": habilitado,
+            "stock": entradas_stock(stock),
+        }
+
+    def buscar(self, q: str, limit: int) -> List[int]:
+        """Posiciones de los productos que contienen todas las palabras de q, por relevancia"""
+        texto = q.strip()
+        exacto = self.posicion.get(texto)
+        if exacto is not None and " " not in texto:
+            return [exacto]
+
+        tokens = tokens_busqueda(texto)
+        if not tokens:
+            return []
+
+        # Candidatos: interseccion de las listas de trigramas (empezando por la mas corta)
+        listas = [self.trigramas.get(t, ()) for token in tokens for t in _trigramas(token)]
+        if listas:
+            listas.sort(key=len)
+            candidatos = set(listas[0])
+            for lista in listas[1:]:
+                if not candidatos:
+                    break
+                candidatos.intersection_update(lista)
+        else:
+            candidatos = range(len(self.textos))  # solo palabras de 1-2 letras
+
+        busqueda = " ".join(tokens)
+        resultados = []
+        for i in candidatos:
+            texto_i = self.textos[i]
+            if not all(token in texto_i for token in tokens):
+                continue
+            if self.codigos[i].lower().startswith(busqueda):
+                prioridad = 2
+            elif texto_i.startswith(busqueda):
+                prioridad = 1
+            else:
+                prioridad = 0
+            inicios = sum(1 for token in tokens if texto_i.startswith(token) or f" {token}" in texto_i)
+            resultados.append((-prioridad, -inicios, self.nombres[i], i))
+        return [r[3] for r in heapq.nsmallest(limit, resultados)]
+
+    def estado(self) -> dict:
+        return {
+            "items": len(self.codigos),
+            "depositos": len(self.depositos),
+            "trigramas": len(self.trigramas),
+            "bytes_aprox": self.bytes_aprox,
+            "construido_en": self.construido_en.isoformat(),
+            "duracion_ms": self.duracion_ms,
+            "modo": self.modo,
+        }
+
+
+_indice: Optional[IndiceCatalogo] = None
+
+
+def get_indice() -> Optional[IndiceCatalogo]:
+    """Indice vigente (None hasta que termine la primera carga)"""
+    return _indice
+
+
+def _costo(valor) -> float:
+    try:
+        return float(valor) if valor else math.nan
+    except (ValueError, TypeError):
+        return math.nan
+
+
+def _filas_db(rows) -> list:
+    return [
+        (r.cod_item, r.item, r.marca_nombre, _costo(r.costo), r.habilitado == "S", r.firma,
+         stock_por_deposito(r.stock))
+        for r in rows
+    ]
+
+
+def _depositos(filas: list) -> list:
+    return sorted({nombre for fila in filas for nombre in fila[6]})
+
+
+def construir_indice(db) -> IndiceCatalogo:
+    """Carga completa desde items_central"""
+    inicio = time.monotonic()
+    rows = db.execute(text(f"""
+        SELECT cod_item, item, marca_nombre, costo, habilitado, stock, {FIRMA_SQL} AS firma
+        FROM items_central
+        ORDER BY cod_item
+        LIMIT :limite
+    """), {"limite": MAX_ITEMS}).fetchall()
+    filas = _filas_db(rows)
+    return IndiceCatalogo(filas, _depositos(filas), "completo", inicio)
+
+
+def actualizar_indice(db, indice: IndiceCatalogo) -> IndiceCatalogo:
+    """Refresco incremental: solo se leen las filas cuya firma cambio"""
+    inicio = time.monotonic()
+    firmas = dict(db.execute(text(f"""
+        SELECT cod_item, {FIRMA_SQL} FROM items_central ORDER BY cod_item LIMIT :limite
+    """), {"limite": MAX_ITEMS}).fetchall())
+
+    cambiados = [
+        cod for cod, firma in firmas.items()
+        if cod not in indice.posicion or indice.firmas[indice.posicion[cod]] != firma
+    ]
+    eliminados = len(indice.posicion) - sum(1 for cod in indice.posicion if cod in firmas)
+    if not cambiados and not eliminados:
+        return indice
+
+    nuevas = {}
+    if cambiados:
+        rows = db.execute(text(f"""
+            SELECT cod_item, item, marca_nombre, costo, habilitado, stock, {FIRMA_SQL} AS firma
+            FROM items_central
+            WHERE cod_item = ANY(:codigos)
+        """), {"codigos": cambiados}).fetchall()
+        nuevas = {fila[0]: fila for fila in _filas_db(rows)}
+
+    filas = [
+        nuevas.get(cod) or indice.fila(indice.posicion[cod])
+        for cod in sorted(firmas) if cod in nuevas or cod in indice.posicion
+    ]
+    return IndiceCatalogo(filas, _depositos(filas), "incremental", inicio)
+
+
+@periodica("catalogo_items", cada_segundos=300, demora_inicial=5)
+def refrescar_catalogo() -> dict:
+    """Carga el catalogo la primera vez y luego lo actualiza en forma incremental"""
+    global _indice
+    db = SessionDux()
+    try:
+        _indice = construir_indice(db) if _indice is None else actualizar_indice(db, _indice)
+    finally:
+        db.close()
+    return _indice.estado()
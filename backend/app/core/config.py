@@ -17,6 +17,9 @@ class Settings(BaseSettings):
     # External APIs
     VENDEDORES_API_URL: str = "http://localhost:8011/vendedores-api"
 
+    # Almacen de archivos (fotos, PDFs, imagenes de facturas): ver core/archivos.py
+    ARCHIVOS_DIR: str = "/app/data/archivos"
+
     # CORS
     CORS_ORIGINS: list = ["*"]
 
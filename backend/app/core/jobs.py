@@ -0,0 +1,77 @@
+"""
+Registro en memoria de trabajos en segundo plano.
+
+Los procesos largos (cierres de mes, recalculos masivos) corren fuera del request
+con BackgroundTasks y reportan su avance aca; el frontend consulta el estado por id.
+El registro vive en el proceso de la API (un solo worker de uvicorn).
+"""
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional
+
+# Cantidad maxima de trabajos terminados que se conservan para consulta
+MAX_JOBS_TERMINADOS = 100
+
+ESTADOS_ACTIVOS = ("pendiente", "en_proceso")
+
+_jobs = {}
+_lock = threading.Lock()
+
+
+def crear_job(tipo: str, **datos) -> dict:
+    """Registra un trabajo nuevo en estado pendiente y lo retorna"""
+    ahora = datetime.now()
+    job = {
+        "id": uuid.uuid4().hex,
+        "tipo": tipo,
+        "estado": "pendiente",
+        "progreso": 0,
+        "mensaje": None,
+        "resultado": None,
+        "error": None,
+        "created_at": ahora,
+        "updated_at": ahora,
+        **datos,
+    }
+    with _lock:
+        _purgar_terminados()
+        _jobs[job["id"]] = job
+    return dict(job)
+
+
+def actualizar_job(job_id: str, **campos):
+    """Actualiza estado, progreso, mensaje o resultado de un trabajo"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job.update(campos)
+        job["updated_at"] = datetime.now()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Copia del estado actual de un trabajo (None si no existe)"""
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def buscar_job_activo(tipo: str, **datos) -> Optional[dict]:
+    """Trabajo pendiente o en proceso del mismo tipo y datos (para no lanzar duplicados)"""
+    with _lock:
+        for job in _jobs.values():
+            if job["tipo"] != tipo or job["estado"] not in ESTADOS_ACTIVOS:
+                continue
+            if all(job.get(k) == v for k, v in datos.items()):
+                return dict(job)
+    return None
+
+
+def _purgar_terminados():
+    terminados = sorted(
+        (j for j in _jobs.values() if j["estado"] not in ESTADOS_ACTIVOS),
+        key=lambda j: j["updated_at"],
+    )
+    for job in terminados[:max(0, len(terminados) - MAX_JOBS_TERMINADOS)]:
+        del _jobs[job["id"]]
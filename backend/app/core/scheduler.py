@@ -0,0 +1,94 @@
+"""
+Tareas periodicas dentro del proceso de la API.
+
+Los modulos registran funciones sincronicas con @periodica; el lifespan de main.py
+las arranca al iniciar y las cancela al detener. Cada ejecucion corre en un thread
+(no bloquea el event loop) y abre sus propias sesiones de BD.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+_registradas = []
+_corriendo = []
+_estado = {}
+
+# Las tareas nocturnas se programan en hora Argentina (el servidor puede estar en UTC)
+ARGENTINA_TZ = timezone(timedelta(hours=-3))
+
+
+def periodica(nombre: str, cada_segundos: int, demora_inicial: int = 60):
+    """Registra una funcion para ejecutarse cada `cada_segundos` (la primera vez tras `demora_inicial`)"""
+    def decorador(funcion: Callable):
+        _registradas.append((nombre, funcion, cada_segundos, demora_inicial))
+        _estado[nombre] = {
+            "cada_segundos": cada_segundos,
+            "ultima_ejecucion": None,
+            "duracion_ms": None,
+            "resultado": None,
+            "error": None,
+        }
+        return funcion
+    return decorador
+
+
+def segundos_hasta_hora(hora: int) -> int:
+    """Segundos hasta la proxima `hora`:00 (hora Argentina); demora_inicial de las tareas nocturnas"""
+    ahora = datetime.now(ARGENTINA_TZ)
+    proxima = ahora.replace(hour=hora, minute=0, second=0, microsecond=0)
+    if proxima <= ahora:
+        proxima += timedelta(days=1)
+    return int((proxima - ahora).total_seconds())
+
+
+def ejecutar_ahora(nombre: str):
+    """Ejecuta una tarea registrada en el thread actual y registra su resultado"""
+    for registrada, funcion, _, _ in _registradas:
+        if registrada == nombre:
+            return _ejecutar(nombre, funcion)
+    raise KeyError(nombre)
+
+
+def estado_tareas(nombre: Optional[str] = None) -> dict:
+    """Ultima ejecucion, duracion y resultado/error de las tareas registradas"""
+    if nombre:
+        return dict(_estado.get(nombre) or {})
+    return {k: dict(v) for k, v in _estado.items()}
+
+
+def iniciar_tareas_periodicas():
+    """Crea un loop asyncio por tarea registrada (llamar desde el lifespan)"""
+    for nombre, funcion, cada_segundos, demora_inicial in _registradas:
+        _corriendo.append(asyncio.create_task(_loop(nombre, funcion, cada_segundos, demora_inicial)))
+
+
+async def detener_tareas_periodicas():
+    for tarea in _corriendo:
+        tarea.cancel()
+    await asyncio.gather(*_corriendo, return_exceptions=True)
+    _corriendo.clear()
+
+
+def _ejecutar(nombre: str, funcion: Callable):
+    inicio = time.monotonic()
+    estado = _estado[nombre]
+    try:
+        resultado = funcion()
+        estado.update(resultado=resultado, error=None)
+        return resultado
+    except Exception as e:
+        estado.update(error=str(e))
+        print(f"Error en tarea periodica {nombre}: {e}")
+    finally:
+        estado.update(
+            ultima_ejecucion=datetime.now(),
+            duracion_ms=round((time.monotonic() - inicio) * 1000),
+        )
+
+
+async def _loop(nombre: str, funcion: Callable, cada_segundos: int, demora_inicial: int):
+    await asyncio.sleep(demora_inicial)
+    while True:
+        await asyncio.to_thread(_ejecutar, nombre, funcion)
+        await asyncio.sleep(cada_segundos)
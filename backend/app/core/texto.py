@@ -0,0 +1,12 @@
+"""Utilidades de texto compartidas por las busquedas (LIKE / pg_trgm)"""
+import re
+
+
+def escapar_like(valor: str) -> str:
+    """Escapa los comodines de LIKE para buscar el texto literal"""
+    return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def tokens_busqueda(valor: str) -> list:
+    """Palabras de una busqueda en minusculas (letras y digitos, sin signos)"""
+    return re.findall(r"[^\W_]+", valor.lower())
@@ -2,9 +2,9 @@ from .employee import Employee, Sucursal
 from .ventas_perdidas import VentaPerdida
 from .auditoria import EvaluacionAuditoria
 from .tareas import TareaSucursal
-from .deposito import Deposito, AjusteStock
+from .deposito import Deposito, AjusteStock, StockDeposito, StockDepositoFirma
 from .vencimientos import ProductoVencimiento
-from .recontactos import ClienteRecontacto, RegistroContacto
+from .recontactos import ClienteRecontacto, RegistroContacto, ContadorRecontactos
 from .auditoria_mensual import AuditoriaMensual
 from .facturas import FacturaProveedor, ProveedorCustom
 from .conteo_stock import ConteoStock, ProductoConteo
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Index
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -6,6 +6,9 @@ from ..core.database import BaseAnexa
 class AuditoriaMensual(BaseAnexa):
     """Puntajes mensuales de auditoria por sucursal - BD mi_sucursal"""
     __tablename__ = "auditoria_mensual"
+    __table_args__ = (
+        Index("idx_audit_mensual_unique", "sucursal_id", "periodo", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sucursal_id = Column(Integer, nullable=False, index=True)
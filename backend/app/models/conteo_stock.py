@@ -8,6 +8,7 @@ El campo fecha_conteo registra el momento exacto del conteo (importante para ges
 """
 
 from sqlalchemy import Column, Integer, String, Text, DateTime, Numeric, ForeignKey
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -49,6 +50,9 @@ class ConteoStock(BaseAnexa):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+    # Productos del conteo (para cargarlos en lote con selectinload en los listados)
+    productos = relationship("ProductoConteo", order_by="ProductoConteo.id", lazy="select")
+
 
 class ProductoConteo(BaseAnexa):
     """
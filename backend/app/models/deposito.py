@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Index
 from sqlalchemy.sql import func
 from ..core.database import Base
 
@@ -39,3 +39,44 @@ class AjusteStock(Base):
     costo = Column(String(50))  # Costo del ajuste (string por formato español)
     mes_importacion = Column(String(7))  # YYYY-MM del mes importado
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class StockDeposito(Base):
+    """
+    Stock normalizado por producto y deposito (una fila por cod_item + deposito_id)
+
+    Se arma a partir del JSON items_central.stock con una tarea periodica
+    (routes/items.py: refrescar_stock_depositos). Solo se reescriben los productos
+    cuyo JSON cambio (firma md5, en stock_depositos_firmas) y, de esos, las filas
+    con valores distintos.
+    """
+    __tablename__ = "stock_depositos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cod_item = Column(String(100), nullable=False)
+    deposito_id = Column(Integer, nullable=False, index=True)  # FK a depositos.id
+    deposito_nombre = Column(String(200))  # Nombre tal como figura en el JSON
+    stock_real = Column(Numeric)
+    stock_disponible = Column(Numeric)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_stock_depositos_item_deposito", "cod_item", "deposito_id", unique=True),
+        # Stock negativo por deposito (auditoria)
+        Index(
+            "ix_stock_depositos_negativo", "deposito_id", "cod_item",
+            postgresql_where=stock_disponible < 0,
+        ),
+    )
+
+
+class StockDepositoFirma(Base):
+    """
+    Firma (md5 del JSON items_central.stock) de cada producto al ultimo refresco de
+    stock_depositos. Va aparte porque un producto puede no tener filas en stock_depositos
+    (ningun deposito del JSON existe) y aun asi no debe volver a procesarse si no cambio.
+    """
+    __tablename__ = "stock_depositos_firmas"
+
+    cod_item = Column(String(100), primary_key=True)
+    firma = Column(String(32), nullable=False)
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Date, Numeric
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -29,7 +30,9 @@ class FacturaProveedor(BaseAnexa):
     proveedor_nombre = Column(String(255), nullable=False)  # nombre desnormalizado
 
     numero_factura = Column(String(50), nullable=True)
-    imagen_base64 = Column(Text, nullable=True)
+    imagen_base64 = deferred(Column(Text, nullable=True))  # Solo imagenes previas al almacen de archivos
+    imagen_hash = Column(String(64), nullable=True, index=True)  # sha256 en core/archivos.py
+    imagen_content_type = Column(String(100), nullable=True)
 
     # Inconsistencia para auditoria
     tiene_inconsistencia = Column(Boolean, default=False)
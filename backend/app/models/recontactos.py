@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -50,6 +50,17 @@ class ClienteRecontacto(BaseAnexa):
     importado = Column(Boolean, default=False)
     mes_importacion = Column(String(7), nullable=True)
 
+    __table_args__ = (
+        # Clave de merge de la importacion: un cliente general por (sucursal, nombre normalizado)
+        Index(
+            "uq_recontacto_sucursal_nombre",
+            sucursal_id,
+            func.lower(func.btrim(cliente_nombre)),
+            unique=True,
+            postgresql_where=text("COALESCE(tipo_servicio, 'general') = 'general'"),
+        ),
+    )
+
 
 class RegistroContacto(BaseAnexa):
     """Tabla para registrar contactos realizados a clientes - BD mi_sucursal"""
@@ -67,3 +78,28 @@ class RegistroContacto(BaseAnexa):
     notas = Column(Text, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ContadorRecontactos(BaseAnexa):
+    """
+    Contadores de recontactos por (sucursal, tipo de servicio, dia, estado) - BD mi_sucursal
+
+    Se actualizan en la misma transaccion que los cambios de estado, contactos e importaciones.
+    - delta_clientes: variacion neta de clientes en ese estado ese dia (la suma historica = clientes actuales)
+    - contactados: clientes distintos contactados por primera vez ese dia
+    - contactados_semana: clientes contactados por primera vez en la semana, imputados a ese dia
+    """
+    __tablename__ = "recontactos_contadores"
+    __table_args__ = (
+        UniqueConstraint('sucursal_id', 'tipo_servicio', 'fecha', 'estado', name='uq_recontactos_contador'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    sucursal_id = Column(Integer, nullable=False, index=True)
+    tipo_servicio = Column(String(30), nullable=False, default="general")
+    fecha = Column(Date, nullable=False)
+    estado = Column(String(30), nullable=False)
+
+    delta_clientes = Column(Integer, nullable=False, default=0)
+    contactados = Column(Integer, nullable=False, default=0)
+    contactados_semana = Column(Integer, nullable=False, default=0)
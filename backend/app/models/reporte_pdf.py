@@ -6,6 +6,7 @@ Almacena reportes PDF de auditoria por sucursal y periodo.
 Subida manual por ahora, preparado para descarga automatica futura.
 """
 from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Text
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -20,7 +21,8 @@ class ReporteAuditoriaPDF(BaseAnexa):
 
     filename = Column(String(255), nullable=False)
     content_type = Column(String(100), nullable=False, default="application/pdf")
-    pdf_data = Column(LargeBinary, nullable=False)
+    pdf_data = deferred(Column(LargeBinary, nullable=True))  # Solo PDFs previos al almacen de archivos
+    archivo_hash = Column(String(64), nullable=True, index=True)  # sha256 en core/archivos.py
     tamano_bytes = Column(Integer, nullable=False)
 
     uploaded_by = Column(Integer, nullable=False)
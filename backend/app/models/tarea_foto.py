@@ -3,6 +3,7 @@ Modelo: Fotos de Tareas Completadas
 Base de datos: mi_sucursal (anexa)
 """
 from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -15,6 +16,7 @@ class TareaFoto(BaseAnexa):
     tarea_id = Column(Integer, nullable=False, unique=True, index=True)
     filename = Column(String(255), nullable=False)
     content_type = Column(String(100), nullable=False)
-    foto_data = Column(LargeBinary, nullable=False)
+    foto_data = deferred(Column(LargeBinary, nullable=True))  # Solo fotos previas al almacen de archivos
+    archivo_hash = Column(String(64), nullable=True, index=True)  # sha256 en core/archivos.py
     subido_por = Column(Integer, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
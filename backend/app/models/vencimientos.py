@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, Numeric, Index, text
 from sqlalchemy.sql import func
 from ..core.database import BaseAnexa
 
@@ -6,6 +6,15 @@ from ..core.database import BaseAnexa
 class ProductoVencimiento(BaseAnexa):
     """Tabla para productos proximos a vencer o vencidos"""
     __tablename__ = "productos_vencimientos"
+    __table_args__ = (
+        # Productos activos (los que pueden vencer): resumen, listados por fecha y transicion periodica
+        Index(
+            "ix_prod_venc_activos",
+            "sucursal_id",
+            "fecha_vencimiento",
+            postgresql_where=text("estado IN ('proximo', 'vencido')"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sucursal_id = Column(Integer, nullable=False, index=True)
@@ -44,6 +53,9 @@ class ProductoVencimiento(BaseAnexa):
     sucursal_origen_id = Column(Integer, nullable=True)
     sucursal_origen_nombre = Column(String(100), nullable=True)
 
+    # Ventas detectadas en facturas: ultimo dia ya revisado para este lote
+    ventas_revisadas_hasta = Column(Date, nullable=True)
+
     # Origen de datos
     importado = Column(Boolean, default=False)  # True si vino de CSV
     mes_importacion = Column(String(7), nullable=True)  # YYYY-MM
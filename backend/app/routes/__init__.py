@@ -8,6 +8,7 @@ from .tareas import router as tareas_router
 from .ajustes_stock import router as ajustes_stock_router
 from .pedidosya import router as pedidosya_router
 from .vencimientos import router as vencimientos_router
+from .vencimientos_rotacion import router as vencimientos_rotacion_router
 from .recontactos import router as recontactos_router
 # Rutas para BD Anexa (mi_sucursal)
 from .sugerencias import router as sugerencias_router
@@ -15,7 +16,9 @@ from .descargos import router as descargos_router
 from .auditoria_mensual import router as auditoria_mensual_router
 from .facturas import router as facturas_router
 from .conteo_stock import router as conteo_stock_router
+from .conteo_seleccion import router as conteo_seleccion_router
 from .tareas_resumen import router as tareas_resumen_router
 from .encargos import router as encargos_router
 from .clientes import router as clientes_router
 from .astra import router as astra_router
+from .archivos import router as archivos_router
@@ -0,0 +1,144 @@
+"""
+Rutas: Almacen de archivos
+Base de datos: mi_sucursal (anexa)
+
+Migracion de los binarios que todavia viven en filas de Postgres (tareas_fotos.foto_data,
+reportes_auditoria_pdf.pdf_data, facturas_proveedores.imagen_base64) al almacen de archivos
+(core/archivos.py), y limpieza de archivos que ya nadie referencia. Ambas son tareas periodicas;
+la migracion avanza por lotes y vacia la columna original de cada fila migrada.
+
+Endpoints:
+- GET  /api/archivos/estado  - Pendientes de migrar y ultima ejecucion de las tareas (solo encargados)
+- POST /api/archivos/migrar  - Migrar ahora (solo encargados)
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..core.archivos import get_almacen, decodificar_data_url, huerfanos
+from ..core.database import get_db_anexa, SessionAnexa
+from ..core.scheduler import periodica, ejecutar_ahora, estado_tareas
+from ..core.security import get_current_user, es_encargado
+from ..models.employee import Employee
+from ..models.facturas import FacturaProveedor
+from ..models.reporte_pdf import ReporteAuditoriaPDF
+from ..models.tarea_foto import TareaFoto
+
+router = APIRouter(prefix="/api/archivos", tags=["archivos"])
+
+# Filas por commit durante la migracion (los PDFs pueden pesar hasta 10MB)
+MIGRACION_LOTE = 20
+# Un archivo sin referencias se borra recien pasado este tiempo (cubre subidas sin commit aun)
+GRACIA_HUERFANOS_SEGUNDOS = 24 * 3600
+
+# (tabla, modelo, columna con el binario anterior, columna con el hash)
+TABLAS_CON_ARCHIVOS = (
+    ("tareas_fotos", TareaFoto, TareaFoto.foto_data, TareaFoto.archivo_hash),
+    ("reportes_auditoria_pdf", ReporteAuditoriaPDF, ReporteAuditoriaPDF.pdf_data, ReporteAuditoriaPDF.archivo_hash),
+    ("facturas_proveedores", FacturaProveedor, FacturaProveedor.imagen_base64, FacturaProveedor.imagen_hash),
+)
+
+
+def migrar_archivos(db: Session, lote: int = MIGRACION_LOTE) -> dict:
+    """Mueve al almacen los binarios guardados en filas y deja en la fila solo el hash"""
+    almacen = get_almacen()
+    resultado = {}
+    for tabla, modelo, datos, columna_hash in TABLAS_CON_ARCHIVOS:
+        migrados = invalidos = 0
+        ultimo_id = 0
+        while True:
+            filas = db.query(modelo.id, datos).filter(
+                columna_hash.is_(None),
+                datos.isnot(None),
+                modelo.id > ultimo_id,
+            ).order_by(modelo.id).limit(lote).all()
+            if not filas:
+                break
+
+            cambios = []
+            for fila_id, contenido in filas:
+                ultimo_id = fila_id
+                valores = {"id": fila_id, datos.key: None}
+                if modelo is FacturaProveedor:
+                    try:
+                        contenido, content_type = decodificar_data_url(contenido)
+                    except ValueError:
+                        invalidos += 1  # queda en la columna original
+                        continue
+                    valores["imagen_content_type"] = content_type
+                valores[columna_hash.key] = almacen.guardar(bytes(contenido))
+                cambios.append(valores)
+
+            if cambios:
+                db.execute(update(modelo), cambios)
+            db.commit()
+            migrados += len(cambios)
+        resultado[tabla] = {"migrados": migrados, "invalidos": invalidos}
+    return resultado
+
+
+def pendientes_migracion(db: Session) -> dict:
+    return {
+        tabla: db.query(modelo.id).filter(columna_hash.is_(None), datos.isnot(None)).count()
+        for tabla, modelo, datos, columna_hash in TABLAS_CON_ARCHIVOS
+    }
+
+
+@periodica("archivos_migrar_blobs", cada_segundos=3600, demora_inicial=120)
+def migrar_archivos_pendientes() -> dict:
+    """Migra los binarios que quedan en la BD (no hace nada cuando ya no hay)"""
+    db = SessionAnexa()
+    try:
+        return migrar_archivos(db)
+    finally:
+        db.close()
+
+
+@periodica("archivos_limpiar_huerfanos", cada_segundos=24 * 3600, demora_inicial=1800)
+def limpiar_archivos_huerfanos() -> int:
+    """Borra del almacen los archivos que ya no referencia ninguna fila"""
+    db = SessionAnexa()
+    try:
+        referenciados = set()
+        for _, _, _, columna_hash in TABLAS_CON_ARCHIVOS:
+            referenciados.update(h for (h,) in db.query(columna_hash).filter(columna_hash.isnot(None)).distinct())
+    finally:
+        db.close()
+
+    almacen = get_almacen()
+    borrados = 0
+    for hash_archivo in list(huerfanos(referenciados, GRACIA_HUERFANOS_SEGUNDOS)):
+        almacen.eliminar(hash_archivo)
+        borrados += 1
+    return borrados
+
+
+# === Endpoints ===
+
+@router.get("/estado")
+async def estado_archivos(
+    current_user: Employee = Depends(get_current_user),
+    db_anexa: Session = Depends(get_db_anexa),
+):
+    """Filas con binarios aun en la BD y estado de las tareas del almacen (solo encargados)"""
+    if not es_encargado(current_user):
+        raise HTTPException(status_code=403, detail="Solo encargados pueden ver el estado del almacen")
+    return {
+        "pendientes": pendientes_migracion(db_anexa),
+        "migracion": estado_tareas("archivos_migrar_blobs"),
+        "limpieza": estado_tareas("archivos_limpiar_huerfanos"),
+    }
+
+
+@router.post("/migrar")
+def forzar_migracion_archivos(
+    current_user: Employee = Depends(get_current_user),
+):
+    """Migra en el momento los binarios pendientes (solo encargados)"""
+    if not es_encargado(current_user):
+        raise HTTPException(status_code=403, detail="Solo encargados pueden migrar archivos")
+    resultado = ejecutar_ahora("archivos_migrar_blobs")
+    estado = estado_tareas("archivos_migrar_blobs")
+    if estado.get("error"):
+        raise HTTPException(status_code=500, detail=f"Error al migrar archivos: {estado['error']}")
+    return {"success": True, "resultado": resultado}
@@ -3,29 +3,112 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List, Optional
 from ..core.database import get_db
-from ..core.security import get_current_user
+from ..core.security import get_current_user, es_encargado
 from ..models.employee import Employee, SucursalInfo
 from ..models.auditoria import EvaluacionAuditoria
-from ..schemas.auditoria import EvaluacionResponse, StockNegativoItem
+from ..schemas.auditoria import EvaluacionResponse, StockNegativoItem, StockNegativoSucursal
+from .items import deposito_de_sucursal
 
 router = APIRouter(prefix="/api/auditoria", tags=["auditoria"])
 
+# costo de items_central es varchar: solo se valoriza si tiene formato numerico
+COSTO_SQL = r"CASE WHEN trim(i.costo) ~ '^-?[0-9]+(\.[0-9]+)?$' THEN trim(i.costo)::numeric END"
+
+
+def contar_stock_negativo(db: Session, deposito_id: int) -> int:
+    """Productos con stock disponible negativo en el deposito (indice parcial de stock_depositos)"""
+    return db.execute(text("""
+        SELECT COUNT(*)
+        FROM stock_depositos
+        WHERE deposito_id = :deposito_id AND stock_disponible < 0
+    """), {"deposito_id": deposito_id}).scalar() or 0
+
 
 @router.get("/stock-negativo", response_model=List[StockNegativoItem])
 async def get_stock_negativo(
+    sucursal_id: Optional[int] = Query(None, description="ID de sucursal (solo para encargados)"),
+    limit: int = Query(500, ge=1, le=5000),
     current_user: Employee = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Obtener productos con stock negativo de la sucursal.
-    TODO: Conectar con sistema de compras cuando esté disponible.
+    Obtener productos con stock negativo en el deposito de la sucursal, valorizados a costo
+    y ordenados por valorizacion (los de mayor impacto primero).
+    Lee stock_depositos por su indice parcial (stock_disponible < 0), sin parsear el JSON de stock.
     """
-    if not current_user.sucursal_id:
+    target_sucursal = current_user.sucursal_id
+    if sucursal_id and es_encargado(current_user):
+        target_sucursal = sucursal_id
+    if not target_sucursal:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
-    # Por ahora retorna datos de ejemplo
-    # Cuando esté el sistema de compras, se conectará a esa BD
-    return []
+    deposito = deposito_de_sucursal(db, target_sucursal)
+    if not deposito:
+        return []
+
+    rows = db.execute(text(f"""
+        SELECT
+            s.cod_item,
+            COALESCE(i.item, s.cod_item) AS item_nombre,
+            i.marca_nombre,
+            s.stock_disponible,
+            {COSTO_SQL} AS costo
+        FROM stock_depositos s
+        LEFT JOIN items_central i ON i.cod_item = s.cod_item
+        WHERE s.deposito_id = :deposito_id AND s.stock_disponible < 0
+        ORDER BY s.stock_disponible * COALESCE({COSTO_SQL}, 0), s.stock_disponible, s.cod_item
+        LIMIT :limit
+    """), {"deposito_id": deposito[0], "limit": limit}).fetchall()
+
+    return [
+        StockNegativoItem(
+            cod_item=r.cod_item,
+            item_nombre=r.item_nombre,
+            marca=r.marca_nombre,
+            stock_actual=float(r.stock_disponible),
+            costo=float(r.costo) if r.costo is not None else None,
+            valorizacion=round(float(r.stock_disponible * r.costo), 2) if r.costo is not None else None,
+        )
+        for r in rows
+    ]
+
+
+@router.get("/stock-negativo/resumen", response_model=List[StockNegativoSucursal])
+async def get_stock_negativo_resumen(
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Productos, unidades y valorizacion del stock negativo de cada sucursal (solo encargados)"""
+    if not es_encargado(current_user):
+        raise HTTPException(status_code=403, detail="Solo encargados pueden ver todas las sucursales")
+
+    rows = db.execute(text(f"""
+        SELECT
+            su.id AS sucursal_id,
+            su.nombre AS sucursal_nombre,
+            s.deposito_id,
+            COUNT(*) AS productos,
+            SUM(-s.stock_disponible) AS unidades,
+            SUM(-s.stock_disponible * COALESCE({COSTO_SQL}, 0)) AS valorizacion
+        FROM stock_depositos s
+        JOIN sucursales su ON su.deposito_id = s.deposito_id
+        LEFT JOIN items_central i ON i.cod_item = s.cod_item
+        WHERE s.stock_disponible < 0
+        GROUP BY su.id, su.nombre, s.deposito_id
+        ORDER BY valorizacion DESC, productos DESC
+    """)).fetchall()
+
+    return [
+        StockNegativoSucursal(
+            sucursal_id=r.sucursal_id,
+            sucursal_nombre=r.sucursal_nombre,
+            deposito_id=r.deposito_id,
+            productos=r.productos,
+            unidades=float(r.unidades or 0),
+            valorizacion=round(float(r.valorizacion or 0), 2),
+        )
+        for r in rows
+    ]
 
 
 @router.get("/pilares", response_model=List[EvaluacionResponse])
@@ -120,9 +203,11 @@ async def get_resumen_auditoria(
                 "periodo": row.periodo,
             }
 
+    deposito = deposito_de_sucursal(db, current_user.sucursal_id)
+
     return {
         "pilares": pilares,
-        "stock_negativo_count": 0,  # TODO: Conectar con compras
+        "stock_negativo_count": contar_stock_negativo(db, deposito[0]) if deposito else 0,
     }
 
 
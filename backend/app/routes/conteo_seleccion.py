@@ -0,0 +1,244 @@
+"""
+Rutas: Seleccion de productos para conteos ciclicos
+Base de datos: dux_integrada (DUX) + mi_sucursal (anexa)
+
+Puntua todos los productos del deposito de cada sucursal segun el riesgo de que su stock
+este mal: ajustes manuales (ajustes_stock), diferencias en conteos anteriores, stock negativo
+y velocidad de venta. El calculo es vectorizado (NumPy, productos x sucursales), corre de
+noche y queda en memoria; la propuesta para la proxima tarea de conteo es instantanea.
+
+Endpoints:
+- GET  /api/control-stock/seleccion/propuesta - Top-N productos a contar en la sucursal
+- POST /api/control-stock/seleccion/recalcular - Recalcular ahora (solo encargados)
+"""
+from datetime import datetime, date, timedelta
+from typing import Optional
+import threading
+
+import numpy as np
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionDux, SessionAnexa
+from ..core.scheduler import periodica, ejecutar_ahora, estado_tareas, segundos_hasta_hora
+from ..core.security import get_current_user, require_supervisor, es_encargado
+from ..models.employee import Employee, SucursalInfo
+from .items import clave_sucursal, stock_por_sucursal
+from .vencimientos_rotacion import ventas_items_por_sucursal, VENTANA_VELOCIDAD_DIAS
+
+router = APIRouter(prefix="/api/control-stock/seleccion", tags=["control-stock-conteo"])
+
+# Historia considerada para ajustes manuales y conteos anteriores
+VENTANA_AJUSTES_DIAS = 180
+VENTANA_CONTEOS_DIAS = 365
+# Un producto contado hace menos de estos dias pierde prioridad (proporcionalmente)
+DIAS_SIN_RECONTAR = 30
+# Candidatos guardados por sucursal (la propuesta toma los primeros N)
+MAX_CANDIDATOS = 500
+
+# Peso de cada senal en el puntaje (cada senal normalizada a 0..1 dentro de la sucursal)
+PESOS_RIESGO = {
+    "ajustes": 0.25,          # cantidad de ajustes manuales
+    "valor_ajustes": 0.20,    # unidades ajustadas * costo
+    "diferencias": 0.25,      # proporcion de conteos anteriores con diferencia
+    "stock_negativo": 0.15,
+    "rotacion": 0.15,         # velocidad de venta * costo
+}
+
+# Ultimo calculo: {"calculado_en": datetime, "por_sucursal": {sucursal_id: [candidato]}}
+_propuestas = {"calculado_en": None, "por_sucursal": {}}
+# Evita dos calculos iniciales simultaneos (varios requests antes del primer calculo)
+_calculo_inicial_lock = threading.Lock()
+
+
+def _normalizar(matriz: np.ndarray) -> np.ndarray:
+    """log1p y escala 0..1 por columna (sucursal), para que ninguna senal domine por magnitud"""
+    valores = np.log1p(np.clip(matriz, 0, None))
+    maximo = valores.max(axis=0, keepdims=True)
+    return np.divide(valores, maximo, out=np.zeros_like(valores), where=maximo > 0)
+
+
+def calcular_candidatos_conteo(db_dux: Session, db_anexa: Session, hoy: date) -> dict:
+    """Candidatos a contar por sucursal, ordenados por puntaje de riesgo"""
+    sucursales = db_dux.query(SucursalInfo).filter(SucursalInfo.deposito_id.isnot(None)).all()
+    if not sucursales:
+        return {}
+    sucursal_ids = [s.id for s in sucursales]
+    col = {sid: j for j, sid in enumerate(sucursal_ids)}
+    col_deposito = {s.deposito_id: col[s.id] for s in sucursales}
+    claves = {s.id: clave_sucursal(s.nombre) for s in sucursales}
+
+    # Universo: productos habilitados con stock en el deposito de cada sucursal
+    items = db_dux.execute(text("""
+        SELECT cod_item, item, costo, stock
+        FROM items_central
+        WHERE habilitado = 'S'
+    """)).fetchall()
+    if not items:
+        return {}
+    fila = {r.cod_item: i for i, r in enumerate(items)}
+    forma = (len(items), len(sucursal_ids))
+
+    costo = np.zeros(len(items))
+    stock = np.zeros(forma)
+    presente = np.zeros(forma, dtype=bool)
+    for i, r in enumerate(items):
+        try:
+            costo[i] = float(r.costo) if r.costo else 0
+        except (ValueError, TypeError):
+            pass
+        for sid, cantidad in stock_por_sucursal(r.stock, claves).items():
+            stock[i, col[sid]] = cantidad
+            presente[i, col[sid]] = True
+
+    # Ajustes manuales por deposito
+    ajustes = np.zeros(forma)
+    unidades_ajustadas = np.zeros(forma)
+    for r in db_dux.execute(text("""
+        SELECT deposito_id, cod_item, COUNT(*) AS ajustes, SUM(ABS(cantidad)) AS unidades
+        FROM ajustes_stock
+        WHERE fecha >= :desde AND deposito_id = ANY(:depositos)
+        GROUP BY deposito_id, cod_item
+    """), {"desde": hoy - timedelta(days=VENTANA_AJUSTES_DIAS), "depositos": list(col_deposito)}):
+        i = fila.get(r.cod_item)
+        if i is not None:
+            ajustes[i, col_deposito[r.deposito_id]] = r.ajustes
+            unidades_ajustadas[i, col_deposito[r.deposito_id]] = r.unidades or 0
+
+    # Conteos anteriores (Anexa): proporcion con diferencia y ultimo conteo
+    contados = np.zeros(forma)
+    con_diferencia = np.zeros(forma)
+    dias_desde_conteo = np.full(forma, np.inf)
+    for r in db_anexa.execute(text("""
+        SELECT c.sucursal_id, p.cod_item,
+               COUNT(p.stock_real) AS contados,
+               COUNT(*) FILTER (WHERE p.diferencia <> 0) AS con_diferencia,
+               MAX(c.fecha_conteo) AS ultimo_conteo
+        FROM productos_conteo p
+        JOIN conteos_stock c ON c.id = p.conteo_id
+        WHERE c.estado <> 'borrador' AND c.fecha_conteo >= :desde
+        GROUP BY c.sucursal_id, p.cod_item
+    """), {"desde": hoy - timedelta(days=VENTANA_CONTEOS_DIAS)}):
+        i = fila.get(r.cod_item)
+        j = col.get(r.sucursal_id)
+        if i is None or j is None:
+            continue
+        contados[i, j] = r.contados
+        con_diferencia[i, j] = r.con_diferencia
+        if r.ultimo_conteo:
+            dias_desde_conteo[i, j] = (hoy - r.ultimo_conteo.date()).days
+
+    # Velocidad de venta (unidades/dia) desde facturas
+    velocidad = np.zeros(forma)
+    desde_ventas = hoy - timedelta(days=VENTANA_VELOCIDAD_DIAS)
+    for (sid, cod), unidades in ventas_items_por_sucursal(db_dux, None, desde_ventas).items():
+        i = fila.get(cod)
+        if i is not None and sid in col:
+            velocidad[i, col[sid]] = max(unidades, 0) / VENTANA_VELOCIDAD_DIAS
+
+    # Puntaje: productos x sucursales en una sola pasada
+    tasa_diferencias = np.divide(con_diferencia, contados, out=np.zeros(forma), where=contados > 0)
+    puntaje = (
+        PESOS_RIESGO["ajustes"] * _normalizar(ajustes)
+        + PESOS_RIESGO["valor_ajustes"] * _normalizar(unidades_ajustadas * costo[:, None])
+        + PESOS_RIESGO["diferencias"] * tasa_diferencias
+        + PESOS_RIESGO["stock_negativo"] * (stock < 0)
+        + PESOS_RIESGO["rotacion"] * _normalizar(velocidad * costo[:, None])
+    )
+    puntaje *= np.clip(dias_desde_conteo / DIAS_SIN_RECONTAR, 0, 1)
+    puntaje[~presente] = 0
+
+    por_sucursal = {}
+    for sid, j in col.items():
+        columna = puntaje[:, j]
+        candidatos = np.nonzero(columna > 0)[0]
+        orden = candidatos[np.argsort(-columna[candidatos], kind="stable")][:MAX_CANDIDATOS]
+        por_sucursal[sid] = [
+            {
+                "cod_item": items[i].cod_item,
+                "nombre": items[i].item,
+                "precio": float(costo[i]),
+                "stock_sistema": round(float(stock[i, j]), 2),
+                "puntaje": round(float(columna[i]), 4),
+                "ajustes": int(ajustes[i, j]),
+                "conteos_con_diferencia": int(con_diferencia[i, j]),
+                "conteos": int(contados[i, j]),
+                "velocidad_venta": round(float(velocidad[i, j]), 3),
+                "dias_desde_conteo": None if np.isinf(dias_desde_conteo[i, j]) else int(dias_desde_conteo[i, j]),
+            }
+            for i in orden
+        ]
+    return por_sucursal
+
+
+@periodica("conteo_seleccion_riesgo", cada_segundos=24 * 3600, demora_inicial=segundos_hasta_hora(3))
+def recalcular_candidatos_conteo() -> int:
+    """Recalcula los candidatos de todas las sucursales cada noche (fuera de los requests)"""
+    db_dux = SessionDux()
+    db_anexa = SessionAnexa()
+    try:
+        por_sucursal = calcular_candidatos_conteo(db_dux, db_anexa, date.today())
+    finally:
+        db_dux.close()
+        db_anexa.close()
+    _propuestas.update(calculado_en=datetime.now(), por_sucursal=por_sucursal)
+    return sum(len(c) for c in por_sucursal.values())
+
+
+def calcular_si_vacio():
+    """Primer calculo tras iniciar el proceso (sin esperar a la noche), solo si aun no hay propuestas"""
+    if not _calculo_inicial_lock.acquire(blocking=False):
+        return
+    try:
+        if _propuestas["calculado_en"] is None:
+            ejecutar_ahora("conteo_seleccion_riesgo")
+    finally:
+        _calculo_inicial_lock.release()
+
+
+# === Endpoints ===
+
+@router.get("/propuesta")
+async def propuesta_conteo(
+    background_tasks: BackgroundTasks,
+    limite: int = Query(30, ge=1, le=MAX_CANDIDATOS),
+    sucursal_id: Optional[int] = Query(None, description="ID de sucursal (solo para encargados)"),
+    current_user: Employee = Depends(get_current_user),
+):
+    """Productos sugeridos para la proxima tarea de conteo (enviar sus cod_items a POST /tareas)"""
+    require_supervisor(current_user)
+
+    target_sucursal = current_user.sucursal_id
+    if sucursal_id and es_encargado(current_user):
+        target_sucursal = sucursal_id
+    if not target_sucursal:
+        raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
+
+    # Recien iniciado el proceso todavia no hay calculo: se arranca en segundo plano
+    # (una sola vez) en lugar de esperar a la corrida nocturna
+    calculando = _propuestas["calculado_en"] is None
+    if calculando:
+        background_tasks.add_task(calcular_si_vacio)
+
+    candidatos = _propuestas["por_sucursal"].get(target_sucursal, [])
+    return {
+        "sucursal_id": target_sucursal,
+        "calculado_en": _propuestas["calculado_en"].isoformat() if _propuestas["calculado_en"] else None,
+        "calculando": calculando,
+        "productos": candidatos[:limite],
+    }
+
+
+@router.post("/recalcular")
+def forzar_recalculo_seleccion(
+    current_user: Employee = Depends(get_current_user),
+):
+    """Recalcula los candidatos en el momento (solo encargados)"""
+    if not es_encargado(current_user):
+        raise HTTPException(status_code=403, detail="Solo encargados pueden recalcular")
+    total = ejecutar_ahora("conteo_seleccion_riesgo")
+    estado = estado_tareas("conteo_seleccion_riesgo")
+    if estado.get("error"):
+        raise HTTPException(status_code=500, detail=f"Error al calcular candidatos: {estado['error']}")
+    return {"success": True, "candidatos": total}
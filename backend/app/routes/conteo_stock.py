@@ -3,10 +3,10 @@ Rutas: Conteos de Stock
 Base de datos: mi_sucursal (anexa) + dux_integrada (DUX)
 
 Endpoints:
-- POST /api/control-stock/tareas - Crear tarea de conteo con productos
+- POST /api/control-stock/tareas - Crear tarea de conteo con productos (snapshot de stock desde items_central)
 - GET  /api/control-stock/conteo/{tareaId} - Obtener conteo por tarea
-- PUT  /api/control-stock/conteo/{conteoId}/producto/{productoId} - Actualizar un producto
-- PUT  /api/control-stock/conteo/{conteoId}/guardar - Guardar borrador (batch)
+- PUT  /api/control-stock/conteo/{conteoId}/producto/{productoId} - Actualizar un producto (agregados incrementales)
+- PUT  /api/control-stock/conteo/{conteoId}/guardar - Guardar borrador (batch, un solo UPDATE)
 - POST /api/control-stock/conteo/{conteoId}/enviar - Enviar para revision
 - PUT  /api/control-stock/conteo/{conteoId}/revisar - Aprobar/rechazar
 - PUT  /api/control-stock/conteo/{conteoId}/cerrar - Cerrar desde auditoria (completa tarea)
@@ -14,18 +14,19 @@ Endpoints:
 - GET  /api/control-stock/auditoria/conteos - Listar conteos
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import text, update, insert, delete
 from typing import List, Optional
 from datetime import datetime, date
 from pydantic import BaseModel
 
 from ..core.database import get_db, get_db_anexa
 from ..core.security import get_current_user, require_supervisor
-from ..models.employee import Employee
+from ..models.employee import Employee, SucursalInfo
 from ..models.tareas import TareaSucursal
 from ..models.conteo_stock import ConteoStock, ProductoConteo
+from .items import clave_sucursal, stock_por_sucursal
 
 router = APIRouter(prefix="/api/control-stock", tags=["control-stock-conteo"])
 
@@ -33,17 +34,20 @@ router = APIRouter(prefix="/api/control-stock", tags=["control-stock-conteo"])
 # === Schemas ===
 
 class ProductoTareaCreate(BaseModel):
+    # Nombre, precio y stock se toman de items_central; los del cliente solo
+    # se usan si el cod_item no existe alli (compatibilidad con clientes viejos)
     cod_item: str
-    nombre: str
-    precio: float
-    stock_sistema: float
+    nombre: Optional[str] = None
+    precio: Optional[float] = None
+    stock_sistema: Optional[float] = None
 
 
 class TareaConteoCreate(BaseModel):
     titulo: str
     descripcion: Optional[str] = None
     fecha_vencimiento: str  # YYYY-MM-DD
-    productos: List[ProductoTareaCreate]
+    cod_items: List[str] = []
+    productos: List[ProductoTareaCreate] = []
 
 
 class ProductoUpdate(BaseModel):
@@ -63,33 +67,119 @@ class RevisarConteoRequest(BaseModel):
 
 # === Helpers ===
 
-def get_employee_nombre(db: Session, employee_id: int) -> str:
-    query = text("SELECT nombre, apellido FROM employees WHERE id = :id")
-    result = db.execute(query, {"id": employee_id}).fetchone()
-    if result:
-        return f"{result.nombre or ''} {result.apellido or ''}".strip() or "Usuario"
-    return "Usuario"
+def get_employee_nombres(db: Session, employee_ids) -> dict:
+    """Nombres de varios empleados en una sola consulta: {id: nombre}"""
+    ids = list({i for i in employee_ids if i})
+    if not ids:
+        return {}
+    rows = db.execute(
+        text("SELECT id, nombre, apellido FROM employees WHERE id = ANY(:ids)"),
+        {"ids": ids}
+    ).fetchall()
+    return {r.id: f"{r.nombre or ''} {r.apellido or ''}".strip() or "Usuario" for r in rows}
+
+
+def snapshot_productos(db_dux: Session, sucursal_id: int, productos: List[ProductoTareaCreate]) -> list:
+    """Nombre, costo y stock del deposito de la sucursal para todos los productos,
+    con una sola consulta a items_central. Lanza 400 si algun cod_item no se puede resolver."""
+    cod_items = list(dict.fromkeys(p.cod_item for p in productos))
+    rows = db_dux.execute(
+        text("SELECT cod_item, item, costo, stock FROM items_central WHERE cod_item = ANY(:cod_items)"),
+        {"cod_items": cod_items}
+    ).fetchall()
+    items = {r.cod_item: r for r in rows}
+    claves = {s.id: clave_sucursal(s.nombre) for s in db_dux.query(SucursalInfo).all()}
+    enviados = {p.cod_item: p for p in productos}
+
+    resultado = []
+    faltantes = []
+    for cod_item in cod_items:
+        item = items.get(cod_item)
+        if item:
+            try:
+                precio = float(item.costo) if item.costo else 0
+            except (ValueError, TypeError):
+                precio = 0
+            stock = stock_por_sucursal(item.stock, claves).get(sucursal_id, 0)
+            resultado.append({
+                "cod_item": cod_item,
+                "nombre": item.item,
+                "precio": precio,
+                "stock_sistema": round(stock),
+            })
+            continue
+        p = enviados[cod_item]
+        if p.nombre is None or p.precio is None or p.stock_sistema is None:
+            faltantes.append(cod_item)
+            continue
+        resultado.append({
+            "cod_item": cod_item,
+            "nombre": p.nombre,
+            "precio": p.precio,
+            "stock_sistema": p.stock_sistema,
+        })
+
+    if faltantes:
+        raise HTTPException(status_code=400, detail=f"Productos no encontrados: {', '.join(faltantes)}")
+    return resultado
 
 
 def recalculate_conteo(db_anexa: Session, conteo: ConteoStock):
-    """Recalcula los agregados del conteo basandose en los productos"""
-    productos = db_anexa.query(ProductoConteo).filter(
-        ProductoConteo.conteo_id == conteo.id
-    ).all()
-
-    conteo.total_productos = len(productos)
-    conteo.productos_contados = sum(1 for p in productos if p.stock_real is not None)
-    conteo.productos_con_diferencia = sum(
-        1 for p in productos if p.diferencia is not None and p.diferencia != 0
-    )
-    conteo.valorizacion_diferencia = sum(
-        float(p.diferencia * p.precio) for p in productos
-        if p.diferencia is not None
+    """Recalcula los agregados del conteo con una sola consulta de agregacion sobre sus productos"""
+    db_anexa.flush()
+    result = db_anexa.execute(text("""
+        SELECT
+            COUNT(*) AS total_productos,
+            COUNT(stock_real) AS productos_contados,
+            COUNT(*) FILTER (WHERE diferencia <> 0) AS productos_con_diferencia,
+            COALESCE(SUM(diferencia * precio), 0) AS valorizacion_diferencia
+        FROM productos_conteo
+        WHERE conteo_id = :conteo_id
+    """), {"conteo_id": conteo.id}).fetchone()
+
+    conteo.total_productos = result.total_productos
+    conteo.productos_contados = result.productos_contados
+    conteo.productos_con_diferencia = result.productos_con_diferencia
+    conteo.valorizacion_diferencia = float(result.valorizacion_diferencia)
+
+
+def aplicar_delta_conteo(
+    db_anexa: Session, conteo_id: int, precio,
+    stock_real_anterior: Optional[int], diferencia_anterior: Optional[int],
+    stock_real_nuevo: Optional[int], diferencia_nueva: Optional[int],
+    fecha_conteo: Optional[datetime] = None,
+):
+    """Ajusta los agregados del conteo por el cambio de un solo producto (tiempo constante).
+    El incremento es atomico en la BD, asi dos tablets contando a la vez no se pisan."""
+    def contado(stock_real):
+        return 1 if stock_real is not None else 0
+
+    def con_diferencia(diferencia):
+        return 1 if diferencia else 0
+
+    valores = {
+        "productos_contados": ConteoStock.productos_contados
+        + contado(stock_real_nuevo) - contado(stock_real_anterior),
+        "productos_con_diferencia": ConteoStock.productos_con_diferencia
+        + con_diferencia(diferencia_nueva) - con_diferencia(diferencia_anterior),
+        "valorizacion_diferencia": ConteoStock.valorizacion_diferencia
+        + ((diferencia_nueva or 0) - (diferencia_anterior or 0)) * precio,
+    }
+    if fecha_conteo:
+        valores["fecha_conteo"] = fecha_conteo
+    db_anexa.execute(
+        update(ConteoStock).where(ConteoStock.id == conteo_id).values(**valores)
+        .execution_options(synchronize_session=False)
     )
 
 
-def build_conteo_response(conteo: ConteoStock, productos: list, db_dux: Session) -> dict:
-    """Construye la respuesta JSON del conteo con nombres de empleados"""
+def build_conteo_response(
+    conteo: ConteoStock, productos: Optional[list], db_dux: Session, nombres: Optional[dict] = None
+) -> dict:
+    """Construye la respuesta JSON del conteo con nombres de empleados.
+    nombres: {employee_id: nombre} ya resuelto en lote (listados); productos=None omite el detalle."""
+    if nombres is None:
+        nombres = get_employee_nombres(db_dux, [conteo.empleado_id, conteo.revisado_por])
     return {
         "id": conteo.id,
         "tarea_id": conteo.tarea_id,
@@ -97,13 +187,13 @@ def build_conteo_response(conteo: ConteoStock, productos: list, db_dux: Session)
         "fecha_conteo": conteo.fecha_conteo.isoformat() if conteo.fecha_conteo else None,
         "estado": conteo.estado,
         "empleado_id": conteo.empleado_id,
-        "empleado_nombre": get_employee_nombre(db_dux, conteo.empleado_id),
+        "empleado_nombre": nombres.get(conteo.empleado_id, "Usuario"),
         "revisado_por": conteo.revisado_por,
-        "revisado_por_nombre": get_employee_nombre(db_dux, conteo.revisado_por) if conteo.revisado_por else None,
+        "revisado_por_nombre": nombres.get(conteo.revisado_por, "Usuario") if conteo.revisado_por else None,
         "fecha_revision": conteo.fecha_revision.isoformat() if conteo.fecha_revision else None,
         "comentarios_auditor": conteo.comentarios_auditor,
         "valorizacion_diferencia": float(conteo.valorizacion_diferencia or 0),
-        "productos": [
+        "productos": None if productos is None else [
             {
                 "id": p.id,
                 "cod_item": p.cod_item,
@@ -134,13 +224,15 @@ async def crear_tarea_conteo(
     db_dux: Session = Depends(get_db),
     db_anexa: Session = Depends(get_db_anexa)
 ):
-    """Crear tarea de control de stock con productos (solo encargados)"""
+    """Crear tarea de control de stock con productos (solo encargados).
+    Basta con enviar cod_items: nombre, costo y stock del deposito se resuelven en el servidor."""
     require_supervisor(current_user)
 
     if not current_user.sucursal_id:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
-    if not data.productos:
+    productos = data.productos + [ProductoTareaCreate(cod_item=c) for c in data.cod_items]
+    if not productos:
         raise HTTPException(status_code=400, detail="Debe incluir al menos un producto")
 
     # Crear TareaSucursal en BD DUX
@@ -149,6 +241,9 @@ async def crear_tarea_conteo(
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha invalido. Use YYYY-MM-DD")
 
+    # Snapshot del stock del deposito al momento de crear la tarea
+    productos = snapshot_productos(db_dux, current_user.sucursal_id, productos)
+
     tarea = TareaSucursal(
         sucursal_id=current_user.sucursal_id,
         categoria="CONTROL Y GESTION DE STOCK",
@@ -159,46 +254,50 @@ async def crear_tarea_conteo(
         fecha_vencimiento=fecha_venc,
         estado="pendiente"
     )
-    db_dux.add(tarea)
-    db_dux.commit()
-    db_dux.refresh(tarea)
 
-    # Crear ConteoStock en BD Anexa
+    # Unidad compensada entre las dos BD: la tarea de DUX se confirma recien
+    # cuando el conteo quedo guardado en Anexa; si DUX falla al final, se borra el conteo.
+    conteo = None
     try:
+        db_dux.add(tarea)
+        db_dux.flush()  # obtiene tarea.id sin confirmar
+
         conteo = ConteoStock(
             tarea_id=tarea.id,
             sucursal_id=current_user.sucursal_id,
             empleado_id=current_user.id,
             estado="borrador",
-            total_productos=len(data.productos),
+            total_productos=len(productos),
         )
         db_anexa.add(conteo)
-        db_anexa.commit()
-        db_anexa.refresh(conteo)
-
-        # Crear ProductoConteo por cada producto
-        productos_db = []
-        for p in data.productos:
-            producto = ProductoConteo(
-                conteo_id=conteo.id,
-                cod_item=p.cod_item,
-                nombre=p.nombre,
-                precio=p.precio,
-                stock_sistema=p.stock_sistema,
+        db_anexa.flush()
+
+        # Todos los productos en un solo INSERT multi-fila; RETURNING trae los ids
+        productos_db = db_anexa.execute(
+            insert(ProductoConteo).values([
+                {"conteo_id": conteo.id, **p} for p in productos
+            ]).returning(
+                ProductoConteo.id, ProductoConteo.cod_item, ProductoConteo.nombre,
+                ProductoConteo.precio, ProductoConteo.stock_sistema, ProductoConteo.stock_real,
+                ProductoConteo.diferencia, ProductoConteo.observaciones,
             )
-            db_anexa.add(producto)
-            productos_db.append(producto)
-
+        ).fetchall()
         db_anexa.commit()
-        for p in productos_db:
-            db_anexa.refresh(p)
-
     except Exception as e:
-        # Si falla Anexa, eliminar la tarea de DUX
-        db_dux.delete(tarea)
-        db_dux.commit()
+        db_anexa.rollback()
+        db_dux.rollback()
         raise HTTPException(status_code=500, detail=f"Error al crear conteo: {str(e)}")
 
+    try:
+        db_dux.commit()
+    except Exception as e:
+        db_dux.rollback()
+        # Compensar: el conteo ya confirmado en Anexa apunta a una tarea que no existe
+        db_anexa.execute(delete(ProductoConteo).where(ProductoConteo.conteo_id == conteo.id))
+        db_anexa.execute(delete(ConteoStock).where(ConteoStock.id == conteo.id))
+        db_anexa.commit()
+        raise HTTPException(status_code=500, detail=f"Error al crear tarea: {str(e)}")
+
     return build_conteo_response(conteo, productos_db, db_dux)
 
 
@@ -257,11 +356,14 @@ async def actualizar_producto(
     producto = db_anexa.query(ProductoConteo).filter(
         ProductoConteo.id == producto_id,
         ProductoConteo.conteo_id == conteo_id
-    ).first()
+    ).with_for_update().first()
 
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado en este conteo")
 
+    stock_real_anterior = producto.stock_real
+    diferencia_anterior = producto.diferencia
+
     # Actualizar campos
     if "stock_real" in data:
         stock_real = data["stock_real"]
@@ -274,20 +376,26 @@ async def actualizar_producto(
     if "observaciones" in data:
         producto.observaciones = data["observaciones"]
 
-    # Recalcular agregados y setear fecha_conteo
-    recalculate_conteo(db_anexa, conteo)
-    conteo.fecha_conteo = datetime.now()
-
-    db_anexa.commit()
-    db_anexa.refresh(producto)
+    # Agregados incrementales (solo cambia esta fila) y fecha_conteo.
+    # guardar_borrador y enviar_conteo los reconcilian con el recalculo completo.
+    fecha_conteo = datetime.now()
+    aplicar_delta_conteo(
+        db_anexa, conteo.id, producto.precio,
+        stock_real_anterior, diferencia_anterior,
+        producto.stock_real, producto.diferencia,
+        fecha_conteo=fecha_conteo,
+    )
 
-    return {
+    respuesta = {
         "id": producto.id,
         "stock_real": producto.stock_real,
         "diferencia": producto.diferencia,
         "observaciones": producto.observaciones,
-        "fecha_conteo": conteo.fecha_conteo.isoformat(),
+        "fecha_conteo": fecha_conteo.isoformat(),
     }
+    db_anexa.commit()
+
+    return respuesta
 
 
 # 4. Guardar borrador (batch)
@@ -314,20 +422,35 @@ async def guardar_borrador(
     if conteo.estado != "borrador":
         raise HTTPException(status_code=400, detail="Solo se puede guardar en estado borrador")
 
-    # Actualizar cada producto
-    for prod_update in data.productos:
-        producto = db_anexa.query(ProductoConteo).filter(
-            ProductoConteo.id == prod_update.id,
-            ProductoConteo.conteo_id == conteo_id
-        ).first()
-
-        if producto:
-            producto.stock_real = prod_update.stock_real
-            producto.observaciones = prod_update.observaciones
-            if prod_update.stock_real is not None:
-                producto.diferencia = prod_update.stock_real - producto.stock_sistema
-            else:
-                producto.diferencia = None
+    # Actualizar todos los productos en un solo UPDATE; la misma sentencia devuelve
+    # las filas actualizadas (RETURNING) junto con el resto de los productos del conteo
+    productos = db_anexa.execute(text("""
+        WITH datos AS (
+            SELECT * FROM unnest(CAST(:ids AS int[]), CAST(:stocks AS int[]), CAST(:observaciones AS text[]))
+                AS d(id, stock_real, observaciones)
+        ),
+        actualizados AS (
+            UPDATE productos_conteo p
+            SET stock_real = d.stock_real,
+                observaciones = d.observaciones,
+                diferencia = d.stock_real - p.stock_sistema
+            FROM datos d
+            WHERE p.id = d.id AND p.conteo_id = :conteo_id
+            RETURNING p.id, p.cod_item, p.nombre, p.precio, p.stock_sistema,
+                      p.stock_real, p.diferencia, p.observaciones
+        )
+        SELECT * FROM actualizados
+        UNION ALL
+        SELECT id, cod_item, nombre, precio, stock_sistema, stock_real, diferencia, observaciones
+        FROM productos_conteo
+        WHERE conteo_id = :conteo_id AND id NOT IN (SELECT id FROM actualizados)
+        ORDER BY id
+    """), {
+        "conteo_id": conteo_id,
+        "ids": [p.id for p in data.productos],
+        "stocks": [p.stock_real for p in data.productos],
+        "observaciones": [p.observaciones for p in data.productos],
+    }).fetchall()
 
     # Recalcular agregados
     recalculate_conteo(db_anexa, conteo)
@@ -336,12 +459,6 @@ async def guardar_borrador(
     conteo.fecha_conteo = datetime.now()
 
     db_anexa.commit()
-    db_anexa.refresh(conteo)
-
-    # Retornar conteo completo
-    productos = db_anexa.query(ProductoConteo).filter(
-        ProductoConteo.conteo_id == conteo.id
-    ).all()
 
     return build_conteo_response(conteo, productos, db_dux)
 
@@ -534,11 +651,13 @@ async def resumen_auditoria(
 async def listar_conteos_auditoria(
     estado: Optional[str] = None,
     mes: Optional[str] = None,  # YYYY-MM
+    resumen: bool = Query(False, description="Omitir el detalle de productos (vista general)"),
     current_user: Employee = Depends(get_current_user),
     db_dux: Session = Depends(get_db),
     db_anexa: Session = Depends(get_db_anexa)
 ):
-    """Listar conteos con filtros para auditoria"""
+    """Listar conteos con filtros para auditoria.
+    Productos en una sola consulta IN (selectinload) y nombres de empleados en una sola consulta a DUX."""
     if not current_user.sucursal_id:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
@@ -558,13 +677,15 @@ async def listar_conteos_auditoria(
         except ValueError:
             pass
 
-    conteos = query.order_by(ConteoStock.fecha_conteo.desc().nullslast()).limit(50).all()
+    if not resumen:
+        query = query.options(selectinload(ConteoStock.productos))
 
-    result = []
-    for conteo in conteos:
-        productos = db_anexa.query(ProductoConteo).filter(
-            ProductoConteo.conteo_id == conteo.id
-        ).all()
-        result.append(build_conteo_response(conteo, productos, db_dux))
+    conteos = query.order_by(ConteoStock.fecha_conteo.desc().nullslast()).limit(50).all()
 
-    return result
+    nombres = get_employee_nombres(
+        db_dux, [c.empleado_id for c in conteos] + [c.revisado_por for c in conteos]
+    )
+    return [
+        build_conteo_response(conteo, None if resumen else conteo.productos, db_dux, nombres)
+        for conteo in conteos
+    ]
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, or_
 from typing import List, Optional
 from ..core.database import get_db, get_db_anexa
 from ..core.security import get_current_user, es_encargado
+from ..core.archivos import get_almacen, decodificar_data_url, respuesta_archivo
 from ..models.employee import Employee, SucursalInfo
 from ..models.facturas import FacturaProveedor, ProveedorCustom, SolicitudNotaCredito
 from ..models.descargos import DescargoAuditoria
@@ -16,6 +19,31 @@ from ..schemas.facturas import (
 router = APIRouter(prefix="/api/facturas", tags=["facturas"])
 
 
+# Tamaño maximo de la imagen de una factura (tipos admitidos: ver tipo_imagen_factura)
+MAX_IMAGEN_FACTURA_BYTES = 5 * 1024 * 1024
+# Algunos navegadores no informan el tipo de estos archivos: se deduce de la extension
+EXTENSIONES_IMAGEN_FACTURA = {".heic": "image/heic", ".heif": "image/heif"}
+
+# Indica si la factura tiene imagen sin leer la columna (diferida) con el base64 anterior
+TIENE_IMAGEN = or_(
+    FacturaProveedor.imagen_hash.isnot(None),
+    FacturaProveedor.imagen_base64.isnot(None),
+).label("tiene_imagen")
+
+
+def get_factura_permitida(db_anexa: Session, factura_id: int, current_user: Employee):
+    """(factura, tiene_imagen) si existe y el usuario puede verla"""
+    fila = db_anexa.query(FacturaProveedor, TIENE_IMAGEN).filter(FacturaProveedor.id == factura_id).first()
+    if not fila:
+        raise HTTPException(status_code=404, detail="Factura no encontrada")
+
+    # Solo puede ver su propia sucursal (o encargado puede ver todas)
+    factura, tiene_imagen = fila
+    if not es_encargado(current_user) and factura.sucursal_id != current_user.sucursal_id:
+        raise HTTPException(status_code=403, detail="Sin permiso para ver esta factura")
+    return factura, tiene_imagen
+
+
 @router.get("/proveedores/buscar", response_model=List[ProveedorSearchResult])
 async def buscar_proveedores(
     q: str = "",
@@ -98,6 +126,15 @@ async def crear_factura(
     if not current_user.sucursal_id:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
+    # Clientes anteriores mandan la imagen como data URL: se decodifica y va al almacen
+    imagen_hash, imagen_content_type = None, None
+    if data.imagen_base64:
+        try:
+            contenido, imagen_content_type = decodificar_data_url(data.imagen_base64)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        imagen_hash = get_almacen().guardar(contenido)
+
     factura = FacturaProveedor(
         sucursal_id=current_user.sucursal_id,
         employee_id=current_user.id,
@@ -105,18 +142,33 @@ async def crear_factura(
         proveedor_custom_id=data.proveedor_custom_id,
         proveedor_nombre=data.proveedor_nombre,
         numero_factura=data.numero_factura,
-        imagen_base64=data.imagen_base64,
+        imagen_hash=imagen_hash,
+        imagen_content_type=imagen_content_type,
         tiene_inconsistencia=data.tiene_inconsistencia,
         detalle_inconsistencia=data.detalle_inconsistencia,
         observaciones=data.observaciones,
         fecha_factura=data.fecha_factura,
     )
 
+    # flush: id y fecha_registro vuelven en el RETURNING del INSERT (sin refresh de la fila)
     db_anexa.add(factura)
-    db_anexa.commit()
-    db_anexa.refresh(factura)
+    db_anexa.flush()
 
-    # Si tiene inconsistencia, crear descargo automatico en auditoria
+    employee_nombre = f"{current_user.nombre} {current_user.apellido or ''}".strip()
+    respuesta = {
+        "id": factura.id,
+        "sucursal_id": factura.sucursal_id,
+        "employee_id": factura.employee_id,
+        "proveedor_nombre": factura.proveedor_nombre,
+        "numero_factura": factura.numero_factura,
+        "tiene_inconsistencia": factura.tiene_inconsistencia,
+        "fecha_factura": str(factura.fecha_factura) if factura.fecha_factura else None,
+        "fecha_registro": str(factura.fecha_registro),
+        "employee_nombre": employee_nombre,
+        "tiene_imagen": imagen_hash is not None,
+    }
+
+    # Si tiene inconsistencia, crear descargo automatico en auditoria (en la misma transaccion)
     if data.tiene_inconsistencia and data.detalle_inconsistencia:
         descargo = DescargoAuditoria(
             sucursal_id=current_user.sucursal_id,
@@ -129,21 +181,9 @@ async def crear_factura(
             referencia_id=factura.id,
         )
         db_anexa.add(descargo)
-        db_anexa.commit()
-
-    employee_nombre = f"{current_user.nombre} {current_user.apellido or ''}".strip()
 
-    return {
-        "id": factura.id,
-        "sucursal_id": factura.sucursal_id,
-        "employee_id": factura.employee_id,
-        "proveedor_nombre": factura.proveedor_nombre,
-        "numero_factura": factura.numero_factura,
-        "tiene_inconsistencia": factura.tiene_inconsistencia,
-        "fecha_factura": str(factura.fecha_factura) if factura.fecha_factura else None,
-        "fecha_registro": str(factura.fecha_registro),
-        "employee_nombre": employee_nombre,
-    }
+    db_anexa.commit()
+    return respuesta
 
 
 @router.get("/{factura_id}")
@@ -153,14 +193,8 @@ async def obtener_factura(
     db_dux: Session = Depends(get_db),
     db_anexa: Session = Depends(get_db_anexa),
 ):
-    """Obtener una factura con su imagen"""
-    factura = db_anexa.query(FacturaProveedor).filter(FacturaProveedor.id == factura_id).first()
-    if not factura:
-        raise HTTPException(status_code=404, detail="Factura no encontrada")
-
-    # Solo puede ver su propia sucursal (o encargado puede ver todas)
-    if not es_encargado(current_user) and factura.sucursal_id != current_user.sucursal_id:
-        raise HTTPException(status_code=403, detail="Sin permiso para ver esta factura")
+    """Obtener una factura (la imagen se descarga aparte, de GET /{factura_id}/imagen)"""
+    factura, tiene_imagen = get_factura_permitida(db_anexa, factura_id, current_user)
 
     employee_nombre = ""
     emp = db_dux.query(Employee).filter(Employee.id == factura.employee_id).first()
@@ -185,10 +219,76 @@ async def obtener_factura(
         "observaciones": factura.observaciones,
         "fecha_factura": str(factura.fecha_factura) if factura.fecha_factura else None,
         "fecha_registro": str(factura.fecha_registro),
-        "imagen_base64": factura.imagen_base64,
+        "tiene_imagen": bool(tiene_imagen),
     }
 
 
+@router.get("/{factura_id}/imagen")
+async def obtener_imagen_factura(
+    factura_id: int,
+    request: Request,
+    current_user: Employee = Depends(get_current_user),
+    db_anexa: Session = Depends(get_db_anexa),
+):
+    """Imagen de la factura en binario (con ETag: el navegador la revalida sin volver a bajarla)"""
+    factura, tiene_imagen = get_factura_permitida(db_anexa, factura_id, current_user)
+    if not tiene_imagen:
+        raise HTTPException(status_code=404, detail="La factura no tiene imagen")
+
+    # Imagen anterior al almacen de archivos: se decodifica una sola vez y se migra
+    if not factura.imagen_hash:
+        try:
+            contenido, content_type = decodificar_data_url(factura.imagen_base64)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="La imagen de la factura no es valida")
+        factura.imagen_hash = get_almacen().guardar(contenido)
+        factura.imagen_content_type = content_type
+        factura.imagen_base64 = None
+        db_anexa.commit()
+
+    content_type = factura.imagen_content_type or "image/jpeg"
+    extension = content_type.split("/")[-1]
+    return respuesta_archivo(request, factura.imagen_hash, content_type, f"factura_{factura.id}.{extension}")
+
+
+def tipo_imagen_factura(archivo: UploadFile) -> Optional[str]:
+    """Content type del archivo si se admite como imagen de factura (cualquier imagen salvo SVG,
+    que puede llevar scripts y se sirve inline, o PDF); None si no se admite"""
+    content_type = (archivo.content_type or "").lower()
+    if content_type in ("", "application/octet-stream"):
+        extension = os.path.splitext(archivo.filename or "")[1].lower()
+        content_type = EXTENSIONES_IMAGEN_FACTURA.get(extension, content_type)
+    if content_type == "application/pdf" or (content_type.startswith("image/") and content_type != "image/svg+xml"):
+        return content_type
+    return None
+
+
+@router.put("/{factura_id}/imagen")
+async def subir_imagen_factura(
+    factura_id: int,
+    imagen: UploadFile = File(...),
+    current_user: Employee = Depends(get_current_user),
+    db_anexa: Session = Depends(get_db_anexa),
+):
+    """Adjuntar o reemplazar la imagen de una factura (archivo binario, multipart)"""
+    factura, _ = get_factura_permitida(db_anexa, factura_id, current_user)
+
+    content_type = tipo_imagen_factura(imagen)
+    if not content_type:
+        raise HTTPException(status_code=400, detail="Solo se permiten imagenes o PDF")
+    contenido = await imagen.read()
+    if not contenido:
+        raise HTTPException(status_code=400, detail="El archivo esta vacio")
+    if len(contenido) > MAX_IMAGEN_FACTURA_BYTES:
+        raise HTTPException(status_code=400, detail="La imagen no puede superar 5MB")
+
+    factura.imagen_hash = get_almacen().guardar(contenido)
+    factura.imagen_content_type = content_type
+    factura.imagen_base64 = None
+    db_anexa.commit()
+    return {"ok": True, "id": factura.id, "tiene_imagen": True}
+
+
 @router.get("/")
 async def listar_facturas(
     current_user: Employee = Depends(get_current_user),
@@ -207,10 +307,13 @@ async def listar_facturas(
     if not target_sucursal and not es_encargado(current_user):
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
-    query = db_anexa.query(FacturaProveedor)
+    # imagen_base64 es diferida: el listado no trae imagenes, solo si hay una
+    query = db_anexa.query(FacturaProveedor, TIENE_IMAGEN)
     if target_sucursal:
         query = query.filter(FacturaProveedor.sucursal_id == target_sucursal)
-    facturas = query.order_by(FacturaProveedor.fecha_registro.desc()).limit(100).all()
+    filas = query.order_by(FacturaProveedor.fecha_registro.desc()).limit(100).all()
+    facturas = [f for f, _ in filas]
+    tiene_imagen = {f.id: bool(t) for f, t in filas}
 
     # Obtener nombres de empleados
     employee_ids = list(set(f.employee_id for f in facturas))
@@ -242,6 +345,7 @@ async def listar_facturas(
             "fecha_factura": str(f.fecha_factura) if f.fecha_factura else None,
             "fecha_registro": str(f.fecha_registro),
             "employee_nombre": employee_map.get(f.employee_id, ""),
+            "tiene_imagen": tiene_imagen[f.id],
         }
         for f in facturas
     ]
@@ -1,100 +1,441 @@
-from fastapi import APIRouter, Depends, Query
+import threading
+import time
+from collections import OrderedDict
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, text
-from typing import List
-from ..core.database import get_db
+from sqlalchemy import text
+from typing import List, Optional
+from ..core.database import get_db, SessionDux
 from ..core.security import get_current_user
+from ..core.texto import escapar_like, tokens_busqueda
+from ..core.catalogo import get_indice, entradas_stock, stock_por_deposito
+from ..core.scheduler import periodica, estado_tareas
 from ..models.employee import Employee
-from ..schemas.ventas_perdidas import ItemSearch
+from ..schemas.ventas_perdidas import ItemSearch, ItemBatchRequest, ItemBatch, ItemBatchResponse
+from .ajustes_stock import normalize_deposito_name
 
 router = APIRouter(prefix="/api/items", tags=["items"])
 
 
+# ===== Stock por deposito (JSON de items_central) =====
+
+def clave_sucursal(nombre: str) -> str:
+    """Nombre de sucursal normalizado para reconocer su deposito en el JSON de stock"""
+    return (nombre or "").upper().replace("SUCURSAL", "").strip()
+
+
+def stock_por_sucursal(depositos, claves: dict) -> dict:
+    """Suma el stock disponible de cada deposito a la sucursal cuyo nombre contiene.
+    claves: {sucursal_id: clave_sucursal(nombre)}. Gana la coincidencia mas larga,
+    para no confundir BELGRANO con BELGRANO SUR."""
+    stock = {}
+    for deposito in depositos or []:
+        nombre = (deposito.get("nombre") or "").upper()
+        candidatas = [(len(c), sid) for sid, c in claves.items() if c and c in nombre]
+        if not candidatas:
+            continue
+        sucursal_id = max(candidatas)[1]
+        try:
+            cantidad = float(deposito.get("stock_disponible") or deposito.get("ctd_disponible") or 0)
+        except (ValueError, TypeError):
+            continue
+        stock[sucursal_id] = stock.get(sucursal_id, 0) + cantidad
+    return stock
+
+
+# ===== Stock normalizado (tabla stock_depositos) =====
+
+def _numero_json(*claves: str) -> str:
+    """Primer valor numerico valido entre las claves del elemento JSON `e` (NULL si ninguno)"""
+    casos = " ".join(
+        f"WHEN trim(e->>'{c}') ~ '^-?[0-9]+(\\.[0-9]+)?$' THEN trim(e->>'{c}')::numeric" for c in claves
+    )
+    return f"CASE {casos} END"
+
+
+def _nombre_deposito_sql(columna: str) -> str:
+    """Mismo criterio que normalize_deposito_name (mayusculas, sin prefijo 'DEPOSITO ')"""
+    return f"regexp_replace(upper(trim({columna})), '^DEPOSITO ', '')"
+
+
+def sincronizar_stock_depositos(db: Session) -> dict:
+    """
+    Vuelca el JSON items_central.stock a stock_depositos (cod_item, deposito_id).
+    Solo procesa los productos cuyo JSON cambio desde el ultimo refresco (firma md5 en
+    stock_depositos_firmas) y, de esos, solo escribe las filas con valores distintos.
+    No hace commit.
+    """
+    db.execute(text("""
+        CREATE TEMP TABLE _stock_cambiados ON COMMIT DROP AS
+        SELECT i.cod_item,
+               md5(i.stock::text) AS firma,
+               CASE WHEN jsonb_typeof(i.stock::jsonb) = 'array' THEN i.stock::jsonb ELSE '[]'::jsonb END AS stock
+        FROM items_central i
+        LEFT JOIN stock_depositos_firmas f ON f.cod_item = i.cod_item
+        WHERE f.firma IS DISTINCT FROM md5(i.stock::text)
+    """))
+
+    db.execute(text(f"""
+        CREATE TEMP TABLE _stock_nuevo ON COMMIT DROP AS
+        SELECT DISTINCT ON (c.cod_item, d.id)
+               c.cod_item,
+               d.id AS deposito_id,
+               e->>'nombre' AS deposito_nombre,
+               {_numero_json("stock_real", "ctd_real")} AS stock_real,
+               {_numero_json("stock_disponible", "ctd_disponible")} AS stock_disponible
+        FROM _stock_cambiados c
+        CROSS JOIN LATERAL jsonb_array_elements(c.stock) e
+        JOIN depositos d ON {_nombre_deposito_sql("d.deposito")} = {_nombre_deposito_sql("e->>'nombre'")}
+        ORDER BY c.cod_item, d.id
+    """))
+
+    escritas = db.execute(text("""
+        INSERT INTO stock_depositos
+            (cod_item, deposito_id, deposito_nombre, stock_real, stock_disponible, updated_at)
+        SELECT cod_item, deposito_id, deposito_nombre, stock_real, stock_disponible, now()
+        FROM _stock_nuevo
+        ON CONFLICT (cod_item, deposito_id) DO UPDATE SET
+            deposito_nombre = EXCLUDED.deposito_nombre,
+            stock_real = EXCLUDED.stock_real,
+            stock_disponible = EXCLUDED.stock_disponible,
+            updated_at = CASE
+                WHEN (stock_depositos.stock_real, stock_depositos.stock_disponible)
+                     IS DISTINCT FROM (EXCLUDED.stock_real, EXCLUDED.stock_disponible)
+                THEN now() ELSE stock_depositos.updated_at
+            END
+        WHERE (stock_depositos.deposito_nombre, stock_depositos.stock_real, stock_depositos.stock_disponible)
+              IS DISTINCT FROM (EXCLUDED.deposito_nombre, EXCLUDED.stock_real, EXCLUDED.stock_disponible)
+    """)).rowcount
+
+    # Depositos que ya no figuran en el JSON del producto, y productos que ya no existen
+    borradas = db.execute(text("""
+        DELETE FROM stock_depositos s
+        USING _stock_cambiados c
+        WHERE s.cod_item = c.cod_item
+          AND NOT EXISTS (
+              SELECT 1 FROM _stock_nuevo n
+              WHERE n.cod_item = s.cod_item AND n.deposito_id = s.deposito_id
+          )
+    """)).rowcount
+    borradas += db.execute(text("""
+        DELETE FROM stock_depositos s
+        WHERE NOT EXISTS (SELECT 1 FROM items_central i WHERE i.cod_item = s.cod_item)
+    """)).rowcount
+
+    # Firma por producto (tenga o no filas), para no reprocesarlo hasta que cambie su JSON
+    productos = db.execute(text("""
+        INSERT INTO stock_depositos_firmas (cod_item, firma)
+        SELECT DISTINCT ON (cod_item) cod_item, firma FROM _stock_cambiados
+        ON CONFLICT (cod_item) DO UPDATE SET firma = EXCLUDED.firma
+    """)).rowcount
+    db.execute(text("""
+        DELETE FROM stock_depositos_firmas f
+        WHERE NOT EXISTS (SELECT 1 FROM items_central i WHERE i.cod_item = f.cod_item)
+    """))
+    return {"productos_cambiados": productos, "filas_escritas": escritas, "filas_borradas": borradas}
+
+
+# Deposito de cada sucursal: {sucursal_id: (deposito_id, nombre normalizado) | None}
+_depositos_sucursal = {}
+
+
+@periodica("stock_depositos", cada_segundos=600, demora_inicial=30)
+def refrescar_stock_depositos() -> dict:
+    """Mantiene stock_depositos al dia con items_central"""
+    db = SessionDux()
+    try:
+        resultado = sincronizar_stock_depositos(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    _depositos_sucursal.clear()
+    if resultado["filas_escritas"] or resultado["filas_borradas"]:
+        invalidar_cache_items()
+    return resultado
+
+
+def deposito_de_sucursal(db: Session, sucursal_id: Optional[int]) -> Optional[tuple]:
+    """(deposito_id, nombre normalizado) del deposito de la sucursal, o None si no tiene"""
+    if not sucursal_id:
+        return None
+    if sucursal_id not in _depositos_sucursal:
+        row = db.execute(text("""
+            SELECT d.id, d.deposito
+            FROM sucursales s
+            JOIN depositos d ON d.id = s.deposito_id
+            WHERE s.id = :sucursal_id
+        """), {"sucursal_id": sucursal_id}).fetchone()
+        _depositos_sucursal[sucursal_id] = (row.id, normalize_deposito_name(row.deposito or "")) if row else None
+    return _depositos_sucursal[sucursal_id]
+
+
+def filtrar_stock_deposito(stock: list, deposito: Optional[tuple]) -> list:
+    """Deja solo la entrada del deposito indicado (todas si deposito es None)"""
+    if deposito is None:
+        return stock
+    return [d for d in stock if normalize_deposito_name(d["nombre"]) == deposito[1]]
+
+
+# ===== Cache de productos resueltos por codigo (batch y stock por producto) =====
+
+# Tiempo de vida y tamaño maximo del cache (LRU)
+CACHE_ITEMS_TTL_SEGUNDOS = 120
+CACHE_ITEMS_MAX = 5000
+# Codigos por request en POST /batch
+MAX_ITEMS_BATCH = 500
+
+# {cod_item: (guardado_en, producto | None)}; None recuerda que el codigo no existe
+_cache_items = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def invalidar_cache_items():
+    with _cache_lock:
+        _cache_items.clear()
+
+
+def resolver_items(db: Session, cod_items: List[str]) -> dict:
+    """
+    {cod_item: producto | None} con datos de items_central y stock de todos los depositos.
+    Lo que no esta en cache se trae en una sola consulta (= ANY) y queda cacheado.
+    """
+    ahora = time.monotonic()
+    resultado, faltantes = {}, []
+    with _cache_lock:
+        for cod in cod_items:
+            entrada = _cache_items.get(cod)
+            if entrada and ahora - entrada[0] < CACHE_ITEMS_TTL_SEGUNDOS:
+                _cache_items.move_to_end(cod)
+                resultado[cod] = entrada[1]
+            else:
+                faltantes.append(cod)
+    if not faltantes:
+        return resultado
+
+    rows = db.execute(text("""
+        SELECT
+            i.cod_item,
+            i.item,
+            i.marca_nombre,
+            i.costo,
+            i.habilitado,
+            COALESCE(
+                json_agg(json_build_object(
+                    'deposito_id', s.deposito_id,
+                    'nombre', s.deposito_nombre,
+                    'stock_real', s.stock_real,
+                    'stock_disponible', s.stock_disponible
+                ) ORDER BY s.deposito_nombre) FILTER (WHERE s.deposito_id IS NOT NULL),
+                '[]'
+            ) AS stock
+        FROM items_central i
+        LEFT JOIN stock_depositos s ON s.cod_item = i.cod_item
+        WHERE i.cod_item = ANY(:cod_items)
+        GROUP BY i.cod_item, i.item, i.marca_nombre, i.costo, i.habilitado
+    """), {"cod_items": faltantes}).fetchall()
+
+    nuevos = {cod: None for cod in faltantes}
+    for row in rows:
+        nuevos[row.cod_item] = {
+            "cod_item": row.cod_item,
+            "item": row.item,
+            "marca_nombre": row.marca_nombre,
+            "costo": row.costo,
+            "habilitado": row.habilitado == "S",
+            "stock": row.stock,
+        }
+    with _cache_lock:
+        for cod, producto in nuevos.items():
+            _cache_items[cod] = (ahora, producto)
+            _cache_items.move_to_end(cod)
+        while len(_cache_items) > CACHE_ITEMS_MAX:
+            _cache_items.popitem(last=False)
+    resultado.update(nuevos)
+    return resultado
+
+
+def _stock_de_deposito(stock: list, deposito_id: Optional[int]) -> list:
+    if deposito_id is None:
+        return list(stock)
+    return [d for d in stock if d["deposito_id"] == deposito_id]
+
+
+def _costo_float(costo) -> Optional[float]:
+    try:
+        return float(costo) if costo else None
+    except (ValueError, TypeError):
+        return None
+
+
+# Texto de busqueda de un item: debe coincidir con el indice ix_items_central_busqueda_trgm
+# (scripts/create_tables.sql) para que el planner lo use
+ITEM_TEXTO_SQL = "lower(coalesce(item, '') || ' ' || coalesce(marca_nombre, '') || ' ' || coalesce(cod_item, ''))"
+
+# Palabras de la busqueda que se exigen (el resto solo suma por similitud)
+MAX_TOKENS_BUSQUEDA = 5
+
+
+def item_search_from_row(row, deposito: Optional[tuple] = None) -> ItemSearch:
+    # Parsear costo (varchar con formato decimal estándar, ej: "15864.6")
+    costo = None
+    if row.costo:
+        try:
+            costo = float(row.costo)
+        except (ValueError, TypeError):
+            costo = None
+
+    return ItemSearch(
+        cod_item=row.cod_item,
+        item=row.item,
+        marca_nombre=row.marca_nombre,
+        stock=filtrar_stock_deposito(entradas_stock(stock_por_deposito(row.stock)), deposito),
+        costo=costo
+    )
+
+
 @router.get("/search", response_model=List[ItemSearch])
 async def search_items(
     q: str = Query(..., min_length=2, description="Término de búsqueda"),
     limit: int = Query(20, ge=1, le=50),
+    todos_depositos: bool = Query(False, description="Stock de todos los depositos (por defecto solo el de la sucursal)"),
     current_user: Employee = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Buscar productos en items_central.
-    Retorna código, nombre, marca y stock por sucursal.
+    Retorna código, nombre, marca y stock del deposito de la sucursal del usuario
+    (de todos los depositos con todos_depositos=true o si el usuario no tiene sucursal).
+    Un código exacto se resuelve directo; si no, todas las palabras deben aparecer en
+    nombre/marca/código (o parecerse, por pg_trgm) y se ordena por relevancia.
+    Se sirve desde el indice en memoria del catalogo cuando esta cargado.
     """
-    search_term = f"%{q.upper()}%"
+    texto = q.strip()
+    deposito = None if todos_depositos else deposito_de_sucursal(db, current_user.sucursal_id)
+
+    # Indice en memoria (core/catalogo.py): sin ida a la BD. Si no hay coincidencias
+    # (o el indice aun no cargo) se sigue con la BD, que ademas tolera errores de tipeo.
+    indice = get_indice()
+    if indice is not None:
+        posiciones = indice.buscar(texto, limit)
+        if posiciones:
+            items = [indice.item(i) for i in posiciones]
+            for item in items:
+                item["stock"] = filtrar_stock_deposito(item["stock"], deposito)
+            return [ItemSearch(**item) for item in items]
+
+    # Camino rapido: codigo exacto (lector de codigo de barras, codigo tipeado)
+    if texto and " " not in texto:
+        exacto = db.execute(text("""
+            SELECT cod_item, item, marca_nombre, stock, costo
+            FROM items_central
+            WHERE cod_item = :codigo
+        """), {"codigo": texto}).fetchone()
+        if exacto:
+            return [item_search_from_row(exacto, deposito)]
 
-    # Query a items_central
-    query = text("""
+    tokens = tokens_busqueda(texto)[:MAX_TOKENS_BUSQUEDA]
+    if not tokens:
+        return []
+
+    busqueda = " ".join(tokens)
+    params = {"q": busqueda, "prefijo": f"{escapar_like(busqueda)}%", "limit": limit}
+    condiciones = []
+    for i, token in enumerate(tokens):
+        params[f"t{i}"] = f"%{escapar_like(token)}%"
+        condiciones.append(f"{ITEM_TEXTO_SQL} LIKE :t{i}")
+
+    query = text(f"""
         SELECT
             cod_item,
             item,
             marca_nombre,
             stock,
-            costo
+            costo,
+            CASE
+                WHEN lower(cod_item) LIKE :prefijo THEN 2
+                WHEN lower(item) LIKE :prefijo THEN 1
+                ELSE 0
+            END + word_similarity(:q, {ITEM_TEXTO_SQL}) AS relevancia
         FROM items_central
-        WHERE
-            UPPER(item) LIKE :search
-            OR UPPER(cod_item) LIKE :search
-            OR UPPER(marca_nombre) LIKE :search
-        ORDER BY item
+        WHERE ({" AND ".join(condiciones)})
+           OR :q <% {ITEM_TEXTO_SQL}
+        ORDER BY relevancia DESC, item
         LIMIT :limit
     """)
 
-    results = db.execute(query, {"search": search_term, "limit": limit}).fetchall()
-
-    items = []
-    for row in results:
-        # Parsear el JSON de stock si existe
-        stock_data = row.stock if row.stock else []
-
-        # Parsear costo (varchar con formato decimal estándar, ej: "15864.6")
-        costo = None
-        if row.costo:
-            try:
-                costo = float(row.costo)
-            except (ValueError, TypeError):
-                costo = None
-
-        items.append(ItemSearch(
-            cod_item=row.cod_item,
-            item=row.item,
-            marca_nombre=row.marca_nombre,
-            stock=stock_data,
-            costo=costo
-        ))
-
-    return items
+    results = db.execute(query, params).fetchall()
+    return [item_search_from_row(row, deposito) for row in results]
 
 
 @router.get("/stock/{cod_item}")
 async def get_item_stock(
     cod_item: str,
+    todos_depositos: bool = Query(False, description="Stock de todos los depositos (por defecto solo el de la sucursal)"),
     current_user: Employee = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Obtener stock detallado de un producto específico"""
-    query = text("""
-        SELECT
-            cod_item,
-            item,
-            marca_nombre,
-            stock,
-            costo,
-            habilitado
-        FROM items_central
-        WHERE cod_item = :cod_item
-    """)
+    """Obtener stock detallado de un producto específico (desde stock_depositos)"""
+    producto = resolver_items(db, [cod_item])[cod_item]
 
-    result = db.execute(query, {"cod_item": cod_item}).fetchone()
-
-    if not result:
+    if not producto:
         return {"error": "Producto no encontrado"}
 
+    deposito = None if todos_depositos else deposito_de_sucursal(db, current_user.sucursal_id)
+    return {
+        **producto,
+        "stock": _stock_de_deposito(producto["stock"], deposito[0] if deposito else None),
+    }
+
+
+@router.post("/batch", response_model=ItemBatchResponse)
+async def get_items_batch(
+    data: ItemBatchRequest,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Resolver muchos productos por codigo en un solo request: nombre, marca, costo,
+    habilitado y stock (del deposito indicado, del de la sucursal del usuario por defecto,
+    o de todos con todos_depositos=true). Los codigos inexistentes vuelven en no_encontrados.
+    """
+    cod_items = list(dict.fromkeys(c.strip() for c in data.cod_items if c and c.strip()))
+    if len(cod_items) > MAX_ITEMS_BATCH:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_ITEMS_BATCH} códigos por consulta")
+
+    deposito_id = data.deposito_id
+    if deposito_id is None and not data.todos_depositos:
+        deposito = deposito_de_sucursal(db, current_user.sucursal_id)
+        deposito_id = deposito[0] if deposito else None
+
+    productos = resolver_items(db, cod_items)
+    items, no_encontrados = [], []
+    for cod in cod_items:
+        producto = productos.get(cod)
+        if not producto:
+            no_encontrados.append(cod)
+            continue
+        items.append(ItemBatch(
+            cod_item=producto["cod_item"],
+            item=producto["item"],
+            marca_nombre=producto["marca_nombre"],
+            costo=_costo_float(producto["costo"]),
+            habilitado=producto["habilitado"],
+            stock=_stock_de_deposito(producto["stock"], deposito_id),
+        ))
+    return ItemBatchResponse(items=items, no_encontrados=no_encontrados)
+
+
+@router.get("/catalogo/estado")
+async def estado_catalogo(
+    current_user: Employee = Depends(get_current_user),
+):
+    """Tamaño, tiempo de armado y ultimo refresco del indice en memoria del catalogo"""
+    indice = get_indice()
     return {
-        "cod_item": result.cod_item,
-        "item": result.item,
-        "marca_nombre": result.marca_nombre,
-        "stock": result.stock or [],
-        "costo": result.costo,
-        "habilitado": result.habilitado == "S"
+        "cargado": indice is not None,
+        "indice": indice.estado() if indice else None,
+        "tarea": estado_tareas("catalogo_items"),
     }
@@ -3,21 +3,30 @@ Endpoints para gestion de recontacto de clientes
 
 Los clientes se pueden importar desde un sistema externo o registrar manualmente.
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func as sql_func
+from sqlalchemy import text, literal, literal_column, or_, func as sql_func
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from datetime import datetime, date, timedelta
+import codecs
 import csv
 import io
+import itertools
+import re
 
-from ..core.database import get_db, get_db_anexa
+from ..core.database import get_db, get_db_anexa, SessionAnexa, SessionDux
+from ..core.texto import escapar_like, tokens_busqueda
+from ..core.scheduler import periodica, segundos_hasta_hora
+from ..core.jobs import crear_job, actualizar_job, get_job, buscar_job_activo
 from ..core.security import get_current_user, es_encargado, es_admin_o_superior
 from ..models.employee import Employee, SucursalInfo
 from ..models.recontactos import ClienteRecontacto, RegistroContacto
 from ..schemas.recontactos import (
     ClienteRecontactoCreate,
     ClienteRecontactoResponse,
+    ClienteRecontactoBusqueda,
     RegistroContactoCreate,
     RegistroContactoResponse,
     RecontactosResumen,
@@ -61,6 +70,298 @@ def parse_date(date_str: str) -> Optional[date]:
             continue
     return None
 
+def sumar_contadores(db_anexa: Session, deltas: list):
+    """
+    Acumula deltas en recontactos_contadores (sin commit: va en la transaccion del llamador).
+    Cada delta es un dict con sucursal_id, tipo_servicio, estado y opcionalmente
+    fecha, delta_clientes, contactados y contactados_semana.
+    """
+    hoy = date.today()
+    params = [
+        {
+            "sucursal_id": d["sucursal_id"],
+            "tipo_servicio": d.get("tipo_servicio") or "general",
+            "fecha": d.get("fecha") or hoy,
+            "estado": d.get("estado") or "pendiente",
+            "delta_clientes": d.get("delta_clientes", 0),
+            "contactados": d.get("contactados", 0),
+            "contactados_semana": d.get("contactados_semana", 0),
+        }
+        for d in deltas
+    ]
+    if not params:
+        return
+    db_anexa.execute(text("""
+        INSERT INTO recontactos_contadores
+            (sucursal_id, tipo_servicio, fecha, estado, delta_clientes, contactados, contactados_semana)
+        VALUES
+            (:sucursal_id, :tipo_servicio, :fecha, :estado, :delta_clientes, :contactados, :contactados_semana)
+        ON CONFLICT (sucursal_id, tipo_servicio, fecha, estado) DO UPDATE SET
+            delta_clientes = recontactos_contadores.delta_clientes + EXCLUDED.delta_clientes,
+            contactados = recontactos_contadores.contactados + EXCLUDED.contactados,
+            contactados_semana = recontactos_contadores.contactados_semana + EXCLUDED.contactados_semana
+    """), params)
+
+def buscar_cliente_por_nombre(db_anexa: Session, sucursal_id: int, nombre: str) -> Optional[ClienteRecontacto]:
+    """Cliente general de la sucursal con el mismo nombre normalizado (clave de uq_recontacto_sucursal_nombre)"""
+    return db_anexa.query(ClienteRecontacto).filter(
+        ClienteRecontacto.sucursal_id == sucursal_id,
+        sql_func.lower(sql_func.btrim(ClienteRecontacto.cliente_nombre)) == sql_func.lower(sql_func.btrim(nombre or "")),
+        sql_func.coalesce(ClienteRecontacto.tipo_servicio, "general") == "general",
+    ).first()
+
+def contar_cambio_estado(db_anexa: Session, cliente: ClienteRecontacto, estado_anterior: Optional[str]):
+    """Registra en los contadores el paso de un cliente de estado_anterior a su estado actual"""
+    estado_anterior = estado_anterior or "pendiente"
+    estado_nuevo = cliente.estado or "pendiente"
+    if estado_anterior == estado_nuevo:
+        return
+    base = {"sucursal_id": cliente.sucursal_id, "tipo_servicio": cliente.tipo_servicio}
+    sumar_contadores(db_anexa, [
+        {**base, "estado": estado_anterior, "delta_clientes": -1},
+        {**base, "estado": estado_nuevo, "delta_clientes": 1},
+    ])
+
+def activar_recordatorios_vencidos(db_anexa: Session, sucursal_id: Optional[int] = None):
+    """Pasa a 'recordatorio' los clientes con recordatorio vencido y ajusta los contadores"""
+    sucursal_sql = "AND sucursal_id = :sucursal_id" if sucursal_id else ""
+    cambios = db_anexa.execute(text(f"""
+        WITH previo AS (
+            SELECT id, sucursal_id, COALESCE(tipo_servicio, 'general') AS tipo_servicio, estado
+            FROM clientes_recontacto
+            WHERE recordatorio_activo = true
+              AND recordatorio_fecha_proximo <= CURRENT_DATE
+              AND estado != 'recordatorio'
+              {sucursal_sql}
+            FOR UPDATE
+        ), actualizado AS (
+            UPDATE clientes_recontacto cr
+            SET estado = 'recordatorio'
+            FROM previo
+            WHERE cr.id = previo.id
+            RETURNING previo.sucursal_id, previo.tipo_servicio, previo.estado
+        )
+        SELECT sucursal_id, tipo_servicio, estado, COUNT(*)
+        FROM actualizado
+        GROUP BY sucursal_id, tipo_servicio, estado
+    """), {"sucursal_id": sucursal_id}).fetchall()
+
+    deltas = []
+    for suc_id, tipo, estado_anterior, cantidad in cambios:
+        deltas.append({"sucursal_id": suc_id, "tipo_servicio": tipo, "estado": estado_anterior, "delta_clientes": -cantidad})
+        deltas.append({"sucursal_id": suc_id, "tipo_servicio": tipo, "estado": "recordatorio", "delta_clientes": cantidad})
+    sumar_contadores(db_anexa, deltas)
+    db_anexa.commit()
+
+def recalcular_contadores(db_anexa: Session, sucursal_id: Optional[int] = None):
+    """
+    Reconstruye los contadores desde clientes_recontacto y registros_contacto (sin commit).
+    Compacta el historial: deja una fila por estado con el total actual y solo los
+    contactos de la semana en curso, que es lo que consultan los resumenes.
+    """
+    hoy = date.today()
+    inicio_semana = hoy - timedelta(days=hoy.weekday())
+    sucursal_sql = "WHERE sucursal_id = :sucursal_id" if sucursal_id else ""
+    params = {"sucursal_id": sucursal_id, "hoy": hoy, "inicio_semana": inicio_semana}
+
+    # Bloquea las escrituras de sumar_contadores hasta el commit: esperan y suman sus deltas
+    # sobre los contadores ya reconstruidos (sin chocar con uq_recontactos_contador)
+    db_anexa.execute(text("LOCK TABLE recontactos_contadores IN SHARE ROW EXCLUSIVE MODE"))
+    db_anexa.execute(text(f"DELETE FROM recontactos_contadores {sucursal_sql}"), params)
+    db_anexa.execute(text(f"""
+        INSERT INTO recontactos_contadores
+            (sucursal_id, tipo_servicio, fecha, estado, delta_clientes, contactados, contactados_semana)
+        SELECT sucursal_id, tipo_servicio, fecha, estado,
+               SUM(delta_clientes), SUM(contactados), SUM(contactados_semana)
+        FROM (
+            -- Foto actual de clientes por estado
+            SELECT sucursal_id, COALESCE(tipo_servicio, 'general') AS tipo_servicio,
+                   CAST(:hoy AS DATE) AS fecha, COALESCE(estado, 'pendiente') AS estado,
+                   COUNT(*) AS delta_clientes, 0 AS contactados, 0 AS contactados_semana
+            FROM clientes_recontacto
+            {sucursal_sql}
+            GROUP BY 1, 2, 3, 4
+
+            UNION ALL
+
+            -- Contactos de la semana: cada cliente cuenta una vez por dia y una vez en la semana
+            SELECT cr.sucursal_id, COALESCE(cr.tipo_servicio, 'general'),
+                   c.dia, COALESCE(cr.estado, 'pendiente'),
+                   0, COUNT(*), COUNT(*) FILTER (WHERE c.dia = c.primer_dia)
+            FROM (
+                SELECT DISTINCT
+                    cliente_recontacto_id,
+                    DATE(fecha_contacto) AS dia,
+                    MIN(DATE(fecha_contacto)) OVER (PARTITION BY cliente_recontacto_id) AS primer_dia
+                FROM registros_contacto
+                WHERE fecha_contacto >= :inicio_semana
+            ) c
+            JOIN clientes_recontacto cr ON cr.id = c.cliente_recontacto_id
+            {sucursal_sql.replace("sucursal_id", "cr.sucursal_id")}
+            GROUP BY 1, 2, 3, 4
+        ) t
+        GROUP BY sucursal_id, tipo_servicio, fecha, estado
+    """), params)
+
+def inicializar_contadores():
+    """Carga inicial de recontactos_contadores si esta vacia (p. ej. recien creada por create_all)"""
+    db_anexa = SessionAnexa()
+    try:
+        if db_anexa.execute(text("SELECT 1 FROM recontactos_contadores LIMIT 1")).first() is None:
+            recalcular_contadores(db_anexa)
+            db_anexa.commit()
+    finally:
+        db_anexa.close()
+
+@periodica("recontactos_compactar_contadores", cada_segundos=24 * 3600, demora_inicial=segundos_hasta_hora(4))
+def compactar_contadores() -> bool:
+    """
+    Cada noche reconstruye los contadores: los deltas diarios de sumar_contadores se
+    pliegan en una fila por estado, asi los resumenes no suman un historial que crece
+    """
+    db_anexa = SessionAnexa()
+    try:
+        recalcular_contadores(db_anexa)
+        db_anexa.commit()
+        return True
+    except Exception:
+        db_anexa.rollback()
+        raise
+    finally:
+        db_anexa.close()
+
+def detectar_encoding_csv(stream) -> str:
+    """Detecta el encoding del archivo subido decodificandolo por bloques, sin cargarlo entero"""
+    for encoding in ['utf-8', 'latin-1', 'cp1252']:
+        stream.seek(0)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for chunk in iter(lambda: stream.read(64 * 1024), b''):
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        # utf-8-sig descarta el BOM si esta presente
+        return 'utf-8-sig' if encoding == 'utf-8' else encoding
+    raise HTTPException(status_code=400, detail="No se pudo decodificar el archivo CSV")
+
+def leer_csv_recontactos(stream):
+    """Itera las filas del CSV como dicts, salteando lineas de titulo antes del header real"""
+    header_keywords = ['cliente', 'nombre', 'codigo', 'telefono']
+    descartadas = []
+    header = None
+    for _ in range(10):
+        line = stream.readline()
+        if not line:
+            break
+        lower_line = line.lower()
+        if any(kw in lower_line for kw in header_keywords):
+            sep = ';' if ';' in line else ','
+            # A real header must have at least 3 non-empty columns
+            non_empty = [p for p in line.split(sep) if p.strip()]
+            if len(non_empty) >= 3:
+                header = line
+                break
+        descartadas.append(line)
+
+    if header is None:
+        # Sin header reconocible: se usa la primera linea, como antes
+        lineas = iter(descartadas)
+        header = next(lineas, '')
+        resto = itertools.chain(lineas, stream)
+    else:
+        resto = stream
+
+    delimiter = ';' if ';' in header else ','
+    return csv.DictReader(itertools.chain([header], resto), delimiter=delimiter)
+
+def filas_import_recontactos(csv_reader, errors: list):
+    """Normaliza cada fila del CSV y la serializa como linea CSV para COPY"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row_num, row in enumerate(csv_reader, start=1):
+        try:
+            cliente_codigo = (row.get('Codigo') or row.get('codigo') or row.get('Código') or '').strip()
+            cliente_nombre = (row.get('Nombre') or row.get('nombre') or row.get('Cliente') or '').strip()
+            telefono = (row.get('Telefono') or row.get('telefono') or row.get('Teléfono') or row.get('Numero') or row.get('numero') or '').strip()
+            email = (row.get('Email') or row.get('email') or row.get('Correo') or '').strip()
+
+            # Datos de mascota
+            mascota = (row.get('Mascota') or row.get('mascota') or row.get('Nombre Mascota') or '').strip()
+            especie = (row.get('Especie') or row.get('especie') or row.get('Tipo') or row.get('tipo') or '').strip()
+            tamano = (row.get('Tamaño') or row.get('Tamano') or row.get('tamano') or row.get('tamaño') or row.get('Talla') or '').strip()
+            marca_habitual = (row.get('Marca Habitual') or row.get('Marca') or row.get('marca') or row.get('marca_habitual') or '').strip()
+            ultimo_producto = (row.get('Ultimo Producto') or row.get('Producto') or row.get('producto') or row.get('ultimo_producto') or '').strip()
+
+            # Datos de compra
+            fecha_str = (row.get('Ultima Compra') or row.get('ultima_compra') or row.get('Fecha') or '').strip()
+            dias_str = (row.get('Dias Sin Comprar') or row.get('dias_sin_comprar') or row.get('Dias') or '').strip()
+            monto = (row.get('Monto') or row.get('monto') or row.get('Monto Ult. Compra') or row.get('Monto Ultima Compra') or '').strip()
+
+            if not cliente_nombre:
+                errors.append(f"Fila {row_num}: Nombre vacio")
+                continue
+
+            ultima_compra = parse_date(fecha_str)
+
+            try:
+                dias_sin_comprar = int(dias_str) if dias_str else None
+            except:
+                dias_sin_comprar = None
+
+        except Exception as e:
+            errors.append(f"Fila {row_num}: Error - {str(e)}")
+            continue
+
+        # Los campos vacios viajan como NULL (campo CSV sin comillas)
+        writer.writerow([
+            row_num,
+            cliente_codigo[:50] or None,
+            cliente_nombre[:300],
+            telefono[:50] or None,
+            email[:200] or None,
+            mascota[:200] or None,
+            especie[:50] or None,
+            tamano[:50] or None,
+            marca_habitual[:200] or None,
+            ultimo_producto[:500] or None,
+            ultima_compra.isoformat() if ultima_compra else None,
+            dias_sin_comprar,
+            monto[:50] or None,
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+class CopyBuffer:
+    """Adaptador file-like para COPY FROM STDIN que consume lineas de un generador bajo demanda"""
+
+    def __init__(self, lineas):
+        self._lineas = lineas
+        self._pendiente = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pendiente) < size:
+            linea = next(self._lineas, None)
+            if linea is None:
+                break
+            self._pendiente += linea
+        if size < 0:
+            size = len(self._pendiente)
+        chunk, self._pendiente = self._pendiente[:size], self._pendiente[size:]
+        return chunk
+
+# Expresiones indexadas para la busqueda (deben coincidir con los indices de
+# scripts/create_tables_mi_sucursal.sql para que el planner los use)
+BUSQUEDA_TSV_SQL = (
+    "to_tsvector('simple', coalesce(cliente_nombre, '') || ' ' || coalesce(mascota, '') || ' ' || "
+    "coalesce(cliente_codigo, '') || ' ' || regexp_replace(coalesce(cliente_telefono, ''), '[^0-9]', '', 'g'))"
+)
+BUSQUEDA_TRGM_SQL = (
+    "lower(coalesce(cliente_nombre, '') || ' ' || coalesce(mascota, '') || ' ' || "
+    "coalesce(cliente_codigo, '') || ' ' || regexp_replace(coalesce(cliente_telefono, ''), '[^0-9]', '', 'g'))"
+)
+
 SUCURSAL_NOMBRES = {
     10: "Belgrano", 15: "Contact Center", 21: "Parque"
 }
@@ -102,15 +403,7 @@ async def listar_clientes(
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
     # Activar recordatorios vencidos antes de listar
-    db_anexa.execute(text("""
-        UPDATE clientes_recontacto
-        SET estado = 'recordatorio'
-        WHERE sucursal_id = :sucursal_id
-          AND recordatorio_activo = true
-          AND recordatorio_fecha_proximo <= CURRENT_DATE
-          AND estado != 'recordatorio'
-    """), {"sucursal_id": target_sucursal})
-    db_anexa.commit()
+    activar_recordatorios_vencidos(db_anexa, target_sucursal)
 
     query = db_anexa.query(ClienteRecontacto).filter(
         ClienteRecontacto.sucursal_id == target_sucursal
@@ -175,6 +468,63 @@ async def listar_clientes(
     return result
 
 
+@router.get("/buscar", response_model=List[ClienteRecontactoBusqueda])
+async def buscar_clientes(
+    q: str = Query(..., min_length=2, description="Nombre, mascota, codigo o parte del telefono"),
+    sucursal_id: Optional[int] = Query(None, description="Limitar a una sucursal"),
+    limit: int = Query(30, ge=1, le=100),
+    current_user: Employee = Depends(get_current_user),
+    db_anexa: Session = Depends(get_db_anexa)
+):
+    """
+    Busca clientes por nombre parcial, mascota, codigo o fragmento de telefono.
+    Combina full-text por prefijos (tsvector) con similitud de trigramas (pg_trgm)
+    para tolerar errores de tipeo; resultados ordenados por relevancia.
+    """
+    if sucursal_id:
+        if not puede_ver_sucursal(current_user, sucursal_id):
+            raise HTTPException(status_code=403, detail="No tiene acceso a esa sucursal")
+        sucursales = [sucursal_id]
+    elif es_admin_o_superior(current_user):
+        sucursales = None
+    else:
+        sucursales = get_sucursales_disponibles(current_user)
+        if not sucursales:
+            raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
+
+    texto = q.strip().lower()
+    tokens = tokens_busqueda(texto)
+    if not tokens:
+        return []
+
+    # Si la busqueda es un telefono (solo digitos y separadores) se compara contra los digitos normalizados
+    digitos = re.sub(r"\D", "", texto)
+    es_telefono = len(digitos) >= 3 and not re.search(r"[^\d\s()+\-./]", texto)
+    patron = escapar_like(digitos if es_telefono else texto)
+
+    tsquery = sql_func.to_tsquery('simple', " & ".join(f"{t}:*" for t in tokens))
+    documento = literal_column(BUSQUEDA_TSV_SQL)
+    busqueda = literal_column(BUSQUEDA_TRGM_SQL)
+    relevancia = (sql_func.ts_rank(documento, tsquery) + sql_func.word_similarity(texto, busqueda)).label("relevancia")
+
+    query = db_anexa.query(ClienteRecontacto, relevancia).filter(or_(
+        documento.op("@@")(tsquery),
+        busqueda.like(f"%{patron}%"),
+        literal(texto).op("<%")(busqueda),
+    ))
+    if sucursales is not None:
+        query = query.filter(ClienteRecontacto.sucursal_id.in_(sucursales))
+
+    rows = query.order_by(relevancia.desc()).limit(limit).all()
+
+    result = []
+    for cliente, score in rows:
+        response = ClienteRecontactoBusqueda.model_validate(cliente)
+        response.relevancia = round(float(score or 0), 4)
+        result.append(response)
+    return result
+
+
 @router.post("/", response_model=ClienteRecontactoResponse)
 async def crear_cliente(
     data: ClienteRecontactoCreate,
@@ -217,7 +567,21 @@ async def crear_cliente(
         cliente.recordatorio_activo = True
 
     db_anexa.add(cliente)
-    db_anexa.commit()
+    sumar_contadores(db_anexa, [
+        {"sucursal_id": target_sucursal, "estado": "pendiente", "delta_clientes": 1}
+    ])
+    try:
+        db_anexa.commit()
+    except IntegrityError:
+        # uq_recontacto_sucursal_nombre: ya hay un cliente general con ese nombre en la sucursal
+        db_anexa.rollback()
+        existente = buscar_cliente_por_nombre(db_anexa, target_sucursal, data.cliente_nombre)
+        if not existente:
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail=f"Ya existe el cliente '{existente.cliente_nombre}' (id {existente.id}) en esta sucursal"
+        )
     db_anexa.refresh(cliente)
 
     return ClienteRecontactoResponse.model_validate(cliente)
@@ -235,20 +599,34 @@ async def registrar_contacto(
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
     # Verificar que el cliente existe (admins pueden ver cualquier sucursal)
+    # Lock de la fila del cliente: serializa contactos simultaneos para que los contadores no se dupliquen
     if es_admin_o_superior(current_user):
         cliente = db_anexa.query(ClienteRecontacto).filter(
             ClienteRecontacto.id == data.cliente_recontacto_id
-        ).first()
+        ).with_for_update().first()
     else:
         sucursales_acceso = get_sucursales_disponibles(current_user)
         cliente = db_anexa.query(ClienteRecontacto).filter(
             ClienteRecontacto.id == data.cliente_recontacto_id,
             ClienteRecontacto.sucursal_id.in_(sucursales_acceso)
-        ).first()
+        ).with_for_update().first()
 
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+    # Contactos previos del cliente hoy / esta semana (para contar clientes distintos)
+    hoy = date.today()
+    inicio_semana = hoy - timedelta(days=hoy.weekday())
+    previos = db_anexa.execute(text("""
+        SELECT
+            COUNT(*) FILTER (WHERE DATE(fecha_contacto) = :hoy),
+            COUNT(*)
+        FROM registros_contacto
+        WHERE cliente_recontacto_id = :cliente_id
+          AND fecha_contacto >= :inicio_semana
+    """), {"cliente_id": cliente.id, "hoy": hoy, "inicio_semana": inicio_semana}).fetchone()
+    estado_anterior = cliente.estado
+
     # Crear registro de contacto
     contacto = RegistroContacto(
         cliente_recontacto_id=data.cliente_recontacto_id,
@@ -281,6 +659,15 @@ async def registrar_contacto(
         cliente.recordatorio_fecha_proximo = date.today() + timedelta(days=data.recordatorio_dias)
         cliente.recordatorio_activo = True
 
+    contar_cambio_estado(db_anexa, cliente, estado_anterior)
+    sumar_contadores(db_anexa, [{
+        "sucursal_id": cliente.sucursal_id,
+        "tipo_servicio": cliente.tipo_servicio,
+        "estado": cliente.estado,
+        "contactados": 1 if not previos[0] else 0,
+        "contactados_semana": 1 if not previos[1] else 0,
+    }])
+
     db_anexa.commit()
     db_anexa.refresh(contacto)
 
@@ -330,7 +717,7 @@ async def resumen_recontactos(
     db_dux: Session = Depends(get_db),
     db_anexa: Session = Depends(get_db_anexa)
 ):
-    """Obtiene resumen de clientes a recontactar"""
+    """Obtiene resumen de clientes a recontactar (desde recontactos_contadores)"""
     target_sucursal = current_user.sucursal_id
     if sucursal_id and puede_ver_sucursal(current_user, sucursal_id):
         target_sucursal = sucursal_id
@@ -342,64 +729,34 @@ async def resumen_recontactos(
     inicio_semana = hoy - timedelta(days=hoy.weekday())
 
     # Activar recordatorios vencidos
-    db_anexa.execute(text("""
-        UPDATE clientes_recontacto
-        SET estado = 'recordatorio'
-        WHERE sucursal_id = :sucursal_id
-          AND recordatorio_activo = true
-          AND recordatorio_fecha_proximo <= CURRENT_DATE
-          AND estado != 'recordatorio'
-    """), {"sucursal_id": target_sucursal})
-    db_anexa.commit()
-
-    # Filtro tipo servicio
-    tipo_filter = tipo_servicio or "general"
-    tipo_sql = "AND (tipo_servicio = :tipo_servicio OR (tipo_servicio IS NULL AND :tipo_servicio = 'general'))"
+    activar_recordatorios_vencidos(db_anexa, target_sucursal)
 
-    # Conteos
-    result = db_anexa.execute(text(f"""
+    # Los estados se filtran por tipo de servicio; los contactados son de toda la sucursal
+    rows = db_anexa.execute(text("""
         SELECT
-            COUNT(*) as total,
-            SUM(CASE WHEN estado = 'pendiente' THEN 1 ELSE 0 END) as pendientes,
-            SUM(CASE WHEN estado = 'recuperado' THEN 1 ELSE 0 END) as recuperados,
-            SUM(CASE WHEN estado = 'no_interesado' THEN 1 ELSE 0 END) as no_interesados
-        FROM clientes_recontacto
-        WHERE sucursal_id = :sucursal_id {tipo_sql}
-    """), {"sucursal_id": target_sucursal, "tipo_servicio": tipo_filter}).fetchone()
-
-    # Contactados hoy
-    contactados_hoy = db_anexa.execute(text("""
-        SELECT COUNT(DISTINCT cliente_recontacto_id)
-        FROM registros_contacto
-        WHERE sucursal_id = :sucursal_id
-        AND DATE(fecha_contacto) = :hoy
-    """), {"sucursal_id": target_sucursal, "hoy": hoy}).fetchone()[0] or 0
-
-    # Contactados esta semana
-    contactados_semana = db_anexa.execute(text("""
-        SELECT COUNT(DISTINCT cliente_recontacto_id)
-        FROM registros_contacto
+            estado,
+            COALESCE(SUM(delta_clientes) FILTER (WHERE tipo_servicio = :tipo_servicio), 0) AS clientes,
+            COALESCE(SUM(contactados) FILTER (WHERE fecha = :hoy), 0) AS contactados_hoy,
+            COALESCE(SUM(contactados_semana) FILTER (WHERE fecha >= :inicio_semana), 0) AS contactados_semana
+        FROM recontactos_contadores
         WHERE sucursal_id = :sucursal_id
-        AND fecha_contacto >= :inicio_semana
-    """), {"sucursal_id": target_sucursal, "inicio_semana": inicio_semana}).fetchone()[0] or 0
-
-    # Por estado
-    estados_result = db_anexa.execute(text(f"""
-        SELECT estado, COUNT(*) as cantidad
-        FROM clientes_recontacto
-        WHERE sucursal_id = :sucursal_id {tipo_sql}
         GROUP BY estado
-    """), {"sucursal_id": target_sucursal, "tipo_servicio": tipo_filter}).fetchall()
+    """), {
+        "sucursal_id": target_sucursal,
+        "tipo_servicio": tipo_servicio or "general",
+        "hoy": hoy,
+        "inicio_semana": inicio_semana,
+    }).fetchall()
 
-    por_estado = {r[0]: r[1] for r in estados_result}
+    por_estado = {r.estado: r.clientes for r in rows if r.clientes > 0}
 
     return RecontactosResumen(
-        total_clientes=result[0] or 0,
-        pendientes=result[1] or 0,
-        contactados_hoy=contactados_hoy,
-        contactados_semana=contactados_semana,
-        recuperados=result[2] or 0,
-        no_interesados=result[3] or 0,
+        total_clientes=sum(por_estado.values()),
+        pendientes=por_estado.get("pendiente", 0),
+        contactados_hoy=sum(r.contactados_hoy for r in rows),
+        contactados_semana=sum(r.contactados_semana for r in rows),
+        recuperados=por_estado.get("recuperado", 0),
+        no_interesados=por_estado.get("no_interesado", 0),
         recordatorios=por_estado.get("recordatorio", 0),
         por_estado=por_estado
     )
@@ -419,84 +776,76 @@ async def resumen_recontactos_todas(
     inicio_semana = hoy - timedelta(days=hoy.weekday())
 
     # Activar recordatorios vencidos (todas las sucursales)
-    db_anexa.execute(text("""
-        UPDATE clientes_recontacto
-        SET estado = 'recordatorio'
-        WHERE recordatorio_activo = true
-          AND recordatorio_fecha_proximo <= CURRENT_DATE
-          AND estado != 'recordatorio'
-    """))
-    db_anexa.commit()
+    activar_recordatorios_vencidos(db_anexa)
 
-    # Obtener IDs de sucursales propias (excluir franquicias) desde db_dux
-    ids_propias = [r[0] for r in db_dux.execute(
-        text("SELECT id FROM sucursales WHERE codigo NOT LIKE 'FRQ%'")
-    ).fetchall()]
+    # Sucursales propias (excluir franquicias) desde db_dux, con su nombre
+    # sucursal_id en clientes_recontacto viene de current_user.sucursal_id que es sucursales.id (PK)
+    sucursales = db_dux.query(SucursalInfo).filter(
+        ~SucursalInfo.codigo.like('FRQ%')
+    ).all()
+    sucursal_map = {s.id: s.nombre for s in sucursales}
 
-    # Resumen por sucursal
     rows = db_anexa.execute(text("""
         SELECT
-            cr.sucursal_id,
-            COUNT(*) as total_clientes,
-            SUM(CASE WHEN cr.estado = 'pendiente' THEN 1 ELSE 0 END) as pendientes,
-            SUM(CASE WHEN cr.estado = 'contactado' THEN 1 ELSE 0 END) as contactados,
-            SUM(CASE WHEN cr.estado = 'recuperado' THEN 1 ELSE 0 END) as recuperados,
-            SUM(CASE WHEN cr.estado = 'no_interesado' THEN 1 ELSE 0 END) as no_interesados,
-            SUM(CASE WHEN cr.estado = 'deceso' THEN 1 ELSE 0 END) as decesos,
-            SUM(CASE WHEN cr.estado = 'recordatorio' THEN 1 ELSE 0 END) as recordatorios
-        FROM clientes_recontacto cr
-        WHERE cr.sucursal_id = ANY(:ids)
-        GROUP BY cr.sucursal_id
-        ORDER BY total_clientes DESC
-    """), {"ids": ids_propias}).fetchall()
-
-    # Contactados esta semana por sucursal
-    contactos_semana = db_anexa.execute(text("""
-        SELECT sucursal_id, COUNT(DISTINCT cliente_recontacto_id) as contactados_semana
-        FROM registros_contacto
-        WHERE fecha_contacto >= :inicio_semana
-        GROUP BY sucursal_id
-    """), {"inicio_semana": inicio_semana}).fetchall()
-
-    contactos_semana_map = {r[0]: r[1] for r in contactos_semana}
-
-    # Contactados hoy por sucursal
-    contactos_hoy = db_anexa.execute(text("""
-        SELECT sucursal_id, COUNT(DISTINCT cliente_recontacto_id) as contactados_hoy
-        FROM registros_contacto
-        WHERE DATE(fecha_contacto) = :hoy
-        GROUP BY sucursal_id
-    """), {"hoy": hoy}).fetchall()
+            sucursal_id,
+            estado,
+            COALESCE(SUM(delta_clientes), 0) AS clientes,
+            COALESCE(SUM(contactados) FILTER (WHERE fecha = :hoy), 0) AS contactados_hoy,
+            COALESCE(SUM(contactados_semana) FILTER (WHERE fecha >= :inicio_semana), 0) AS contactados_semana
+        FROM recontactos_contadores
+        WHERE sucursal_id = ANY(:ids)
+        GROUP BY sucursal_id, estado
+    """), {"ids": list(sucursal_map.keys()), "hoy": hoy, "inicio_semana": inicio_semana}).fetchall()
+
+    por_sucursal = {}
+    for r in rows:
+        resumen = por_sucursal.setdefault(r.sucursal_id, {
+            "sucursal_id": r.sucursal_id,
+            "sucursal_nombre": sucursal_map.get(r.sucursal_id, f"Sucursal {r.sucursal_id}"),
+            "total_clientes": 0,
+            "pendientes": 0,
+            "contactados": 0,
+            "recuperados": 0,
+            "no_interesados": 0,
+            "decesos": 0,
+            "recordatorios": 0,
+            "contactados_semana": 0,
+            "contactados_hoy": 0,
+        })
+        resumen["total_clientes"] += r.clientes
+        campo = {
+            "pendiente": "pendientes",
+            "contactado": "contactados",
+            "recuperado": "recuperados",
+            "no_interesado": "no_interesados",
+            "deceso": "decesos",
+            "recordatorio": "recordatorios",
+        }.get(r.estado)
+        if campo:
+            resumen[campo] += r.clientes
+        resumen["contactados_semana"] += r.contactados_semana
+        resumen["contactados_hoy"] += r.contactados_hoy
+
+    # Solo sucursales con clientes, de mayor a menor
+    resultado = [r for r in por_sucursal.values() if r["total_clientes"] > 0]
+    resultado.sort(key=lambda r: r["total_clientes"], reverse=True)
+    return resultado
+
+
+@router.post("/recalcular-contadores")
+async def recalcular_contadores_recontactos(
+    sucursal_id: Optional[int] = Query(None, description="ID de sucursal (todas si se omite)"),
+    current_user: Employee = Depends(get_current_user),
+    db_anexa: Session = Depends(get_db_anexa)
+):
+    """Reconstruye los contadores de resumen desde las tablas de origen. Solo admins."""
+    if not es_admin_o_superior(current_user):
+        raise HTTPException(status_code=403, detail="Solo administradores pueden recalcular contadores")
 
-    contactos_hoy_map = {r[0]: r[1] for r in contactos_hoy}
+    recalcular_contadores(db_anexa, sucursal_id)
+    db_anexa.commit()
 
-    # Obtener nombres de sucursales desde BD DUX
-    # sucursal_id en clientes_recontacto viene de current_user.sucursal_id que es sucursales.id (PK)
-    sucursal_ids = [row[0] for row in rows]
-    sucursal_map = {}
-    if sucursal_ids:
-        sucursales = db_dux.query(SucursalInfo).filter(
-            SucursalInfo.id.in_(sucursal_ids),
-            ~SucursalInfo.codigo.like('FRQ%')
-        ).all()
-        sucursal_map = {s.id: s.nombre for s in sucursales}
-
-    return [
-        {
-            "sucursal_id": row[0],
-            "sucursal_nombre": sucursal_map.get(row[0], f"Sucursal {row[0]}"),
-            "total_clientes": row[1] or 0,
-            "pendientes": row[2] or 0,
-            "contactados": row[3] or 0,
-            "recuperados": row[4] or 0,
-            "no_interesados": row[5] or 0,
-            "decesos": row[6] or 0,
-            "recordatorios": row[7] or 0,
-            "contactados_semana": contactos_semana_map.get(row[0], 0),
-            "contactados_hoy": contactos_hoy_map.get(row[0], 0),
-        }
-        for row in rows
-    ]
+    return {"success": True, "message": "Contadores recalculados"}
 
 
 @router.get("/exportar-csv")
@@ -504,10 +853,8 @@ async def exportar_csv(
     estado: Optional[str] = None,
     sucursal_id: Optional[int] = Query(None, description="ID de sucursal (solo para admins)"),
     current_user: Employee = Depends(get_current_user),
-    db_dux: Session = Depends(get_db),
-    db_anexa: Session = Depends(get_db_anexa)
 ):
-    """Exporta clientes a recontactar como CSV"""
+    """Exporta clientes a recontactar como CSV (streaming, una sola consulta)"""
     target_sucursal = current_user.sucursal_id
     if sucursal_id and es_admin_o_superior(current_user):
         target_sucursal = sucursal_id
@@ -515,60 +862,85 @@ async def exportar_csv(
     if not target_sucursal:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
-    query = db_anexa.query(ClienteRecontacto).filter(
-        ClienteRecontacto.sucursal_id == target_sucursal
-    )
-
+    estado_sql = ""
     if estado:
         if estado == "contactado":
-            query = query.filter(ClienteRecontacto.estado != "pendiente")
+            estado_sql = "AND cr.estado != 'pendiente'"
         else:
-            query = query.filter(ClienteRecontacto.estado == estado)
-
-    clientes = query.order_by(ClienteRecontacto.dias_sin_comprar.desc().nullslast()).all()
-
-    # Generar CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "Nombre", "Codigo", "Telefono", "Email", "Mascota", "Especie",
-        "Tamano", "Marca Habitual", "Ultimo Producto", "Ultima Compra",
-        "Dias Sin Comprar", "Monto Ultima Compra", "Estado",
-        "Cant. Contactos", "Ultimo Contacto", "Resultado", "Notas Contacto"
-    ])
+            estado_sql = "AND cr.estado = :estado"
 
-    for c in clientes:
-        # Obtener ultimo contacto
-        ultimo = db_anexa.query(RegistroContacto).filter(
-            RegistroContacto.cliente_recontacto_id == c.id
-        ).order_by(RegistroContacto.fecha_contacto.desc()).first()
-
-        writer.writerow([
-            c.cliente_nombre,
-            c.cliente_codigo or "",
-            c.cliente_telefono or "",
-            c.cliente_email or "",
-            c.mascota or "",
-            c.especie or "",
-            c.tamano or "",
-            c.marca_habitual or "",
-            c.ultimo_producto or "",
-            str(c.ultima_compra) if c.ultima_compra else "",
-            c.dias_sin_comprar or "",
-            c.monto_ultima_compra or "",
-            c.estado,
-            db_anexa.query(RegistroContacto).filter(
-                RegistroContacto.cliente_recontacto_id == c.id
-            ).count(),
-            str(ultimo.fecha_contacto) if ultimo else "",
-            ultimo.resultado if ultimo else "",
-            ultimo.notas if ultimo else "",
-        ])
+    # Historial agregado por cliente: cantidad y ultimo contacto en la misma pasada
+    query = text(f"""
+        SELECT
+            cr.cliente_nombre, cr.cliente_codigo, cr.cliente_telefono, cr.cliente_email,
+            cr.mascota, cr.especie, cr.tamano, cr.marca_habitual, cr.ultimo_producto,
+            cr.ultima_compra, cr.dias_sin_comprar, cr.monto_ultima_compra, cr.estado,
+            COALESCE(rc.cantidad, 0) AS cantidad_contactos,
+            rc.ultimo_fecha, rc.ultimo_resultado, rc.ultimo_notas
+        FROM clientes_recontacto cr
+        LEFT JOIN (
+            SELECT
+                cliente_recontacto_id,
+                COUNT(*) AS cantidad,
+                MAX(fecha_contacto) AS ultimo_fecha,
+                (array_agg(resultado ORDER BY fecha_contacto DESC))[1] AS ultimo_resultado,
+                (array_agg(notas ORDER BY fecha_contacto DESC))[1] AS ultimo_notas
+            FROM registros_contacto
+            WHERE sucursal_id = :sucursal_id
+            GROUP BY cliente_recontacto_id
+        ) rc ON rc.cliente_recontacto_id = cr.id
+        WHERE cr.sucursal_id = :sucursal_id {estado_sql}
+        ORDER BY cr.dias_sin_comprar DESC NULLS LAST
+    """)
+    params = {"sucursal_id": target_sucursal, "estado": estado}
+
+    def generar_csv():
+        # Sesion propia: la del Depends se cierra antes de que termine el streaming
+        db_anexa = SessionAnexa()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        try:
+            writer.writerow([
+                "Nombre", "Codigo", "Telefono", "Email", "Mascota", "Especie",
+                "Tamano", "Marca Habitual", "Ultimo Producto", "Ultima Compra",
+                "Dias Sin Comprar", "Monto Ultima Compra", "Estado",
+                "Cant. Contactos", "Ultimo Contacto", "Resultado", "Notas Contacto"
+            ])
+            # Cursor del lado del servidor: se leen lotes de filas, no el resultado completo
+            result = db_anexa.execute(
+                query, params, execution_options={"stream_results": True, "yield_per": 500}
+            )
+            for rows in result.partitions():
+                for r in rows:
+                    writer.writerow([
+                        r.cliente_nombre,
+                        r.cliente_codigo or "",
+                        r.cliente_telefono or "",
+                        r.cliente_email or "",
+                        r.mascota or "",
+                        r.especie or "",
+                        r.tamano or "",
+                        r.marca_habitual or "",
+                        r.ultimo_producto or "",
+                        str(r.ultima_compra) if r.ultima_compra else "",
+                        r.dias_sin_comprar or "",
+                        r.monto_ultima_compra or "",
+                        r.estado,
+                        r.cantidad_contactos,
+                        str(r.ultimo_fecha) if r.ultimo_fecha else "",
+                        r.ultimo_resultado or "",
+                        r.ultimo_notas or "",
+                    ])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        finally:
+            db_anexa.close()
 
-    from fastapi.responses import StreamingResponse
-    output.seek(0)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        generar_csv(),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=recontacto_clientes.csv"}
     )
@@ -587,6 +959,9 @@ async def importar_clientes(
     Importa clientes a recontactar desde un CSV.
     Admins pueden especificar sucursal_id para importar a cualquier sucursal.
 
+    El archivo se lee en streaming, se carga con COPY a una tabla temporal y se
+    mergea con un unico INSERT ... ON CONFLICT sobre (sucursal_id, nombre normalizado).
+
     Columnas esperadas:
     - Codigo: codigo del cliente (opcional)
     - Nombre: nombre del cliente
@@ -611,136 +986,96 @@ async def importar_clientes(
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="El archivo debe ser un CSV")
 
-
-
     errors = []
     importados = 0
     actualizados = 0
 
     try:
-        content = await file.read()
-        for encoding in ['utf-8', 'latin-1', 'cp1252']:
-            try:
-                text_content = content.decode(encoding)
-                break
-            except:
-                continue
-        else:
-            raise HTTPException(status_code=400, detail="No se pudo decodificar el archivo CSV")
-
-        # Strip BOM if present
-        text_content = text_content.lstrip('\ufeff')
-
-        # Skip title/empty lines before the actual header row
-        lines = text_content.splitlines()
-        header_idx = 0
-        header_keywords = ['cliente', 'nombre', 'codigo', 'telefono']
-        for i, line in enumerate(lines[:10]):
-            lower_line = line.lower()
-            if any(kw in lower_line for kw in header_keywords):
-                sep = ';' if ';' in line else ','
-                parts = line.split(sep)
-                # A real header must have at least 3 non-empty columns
-                non_empty = [p for p in parts if p.strip()]
-                if len(non_empty) >= 3:
-                    header_idx = i
-                    break
-        text_content = '\n'.join(lines[header_idx:])
-
-        delimiter = ';' if ';' in text_content[:500] else ','
-        csv_reader = csv.DictReader(io.StringIO(text_content), delimiter=delimiter)
-
-        row_num = 0
-        for row in csv_reader:
-            row_num += 1
-
-            try:
-                cliente_codigo = row.get('Codigo', row.get('codigo', row.get('Código', ''))).strip()
-                cliente_nombre = row.get('Nombre', row.get('nombre', row.get('Cliente', ''))).strip()
-                telefono = row.get('Telefono', row.get('telefono', row.get('Teléfono', row.get('Numero', row.get('numero', ''))))).strip()
-                email = row.get('Email', row.get('email', row.get('Correo', ''))).strip()
-
-                # Datos de mascota
-                mascota = row.get('Mascota', row.get('mascota', row.get('Nombre Mascota', ''))).strip()
-                especie = row.get('Especie', row.get('especie', row.get('Tipo', row.get('tipo', '')))).strip()
-                tamano = row.get('Tamaño', row.get('Tamano', row.get('tamano', row.get('tamaño', row.get('Talla', ''))))).strip()
-                marca_habitual = row.get('Marca Habitual', row.get('Marca', row.get('marca', row.get('marca_habitual', '')))).strip()
-                ultimo_producto = row.get('Ultimo Producto', row.get('Producto', row.get('producto', row.get('ultimo_producto', '')))).strip()
-
-                # Datos de compra
-                fecha_str = row.get('Ultima Compra', row.get('ultima_compra', row.get('Fecha', ''))).strip()
-                dias_str = row.get('Dias Sin Comprar', row.get('dias_sin_comprar', row.get('Dias', ''))).strip()
-                monto = row.get('Monto', row.get('monto', row.get('Monto Ult. Compra', row.get('Monto Ultima Compra', '')))).strip()
-
-                if not cliente_nombre:
-                    errors.append(f"Fila {row_num}: Nombre vacio")
-                    continue
-
-                ultima_compra = parse_date(fecha_str)
-
-                try:
-                    dias_sin_comprar = int(dias_str) if dias_str else None
-                except:
-                    dias_sin_comprar = None
-
-                # Verificar si ya existe
-                existente = db_anexa.query(ClienteRecontacto).filter(
-                    ClienteRecontacto.sucursal_id == target_sucursal,
-                    ClienteRecontacto.cliente_nombre == cliente_nombre
-                ).first()
-
-                if existente:
-                    # Actualizar campos existentes
-                    if telefono:
-                        existente.cliente_telefono = telefono
-                    if email:
-                        existente.cliente_email = email
-                    if mascota:
-                        existente.mascota = mascota
-                    if especie:
-                        existente.especie = especie
-                    if tamano:
-                        existente.tamano = tamano
-                    if marca_habitual:
-                        existente.marca_habitual = marca_habitual
-                    if ultimo_producto:
-                        existente.ultimo_producto = ultimo_producto
-                    if ultima_compra:
-                        existente.ultima_compra = ultima_compra
-                    if dias_sin_comprar:
-                        existente.dias_sin_comprar = dias_sin_comprar
-                    if monto:
-                        existente.monto_ultima_compra = monto
-                    actualizados += 1
-                else:
-                    # Crear nuevo
-                    cliente = ClienteRecontacto(
-                        sucursal_id=target_sucursal,
-                        cliente_codigo=cliente_codigo or None,
-                        cliente_nombre=cliente_nombre,
-                        cliente_telefono=telefono or None,
-                        cliente_email=email or None,
-                        mascota=mascota or None,
-                        especie=especie or None,
-                        tamano=tamano or None,
-                        marca_habitual=marca_habitual or None,
-                        ultimo_producto=ultimo_producto or None,
-                        ultima_compra=ultima_compra,
-                        dias_sin_comprar=dias_sin_comprar,
-                        monto_ultima_compra=monto or None,
-                        estado="pendiente",
-                        importado=True,
-                        mes_importacion=mes or datetime.now().strftime("%Y-%m")
-                    )
-                    db_anexa.add(cliente)
-                    importados += 1
-
-            except Exception as e:
-                errors.append(f"Fila {row_num}: Error - {str(e)}")
+        encoding = detectar_encoding_csv(file.file)
+        file.file.seek(0)
+        stream = io.TextIOWrapper(file.file, encoding=encoding, newline='')
+
+        db_anexa.execute(text("""
+            CREATE TEMP TABLE tmp_import_recontactos (
+                fila INTEGER,
+                cliente_codigo VARCHAR(50),
+                cliente_nombre VARCHAR(300),
+                cliente_telefono VARCHAR(50),
+                cliente_email VARCHAR(200),
+                mascota VARCHAR(200),
+                especie VARCHAR(50),
+                tamano VARCHAR(50),
+                marca_habitual VARCHAR(200),
+                ultimo_producto VARCHAR(500),
+                ultima_compra DATE,
+                dias_sin_comprar INTEGER,
+                monto_ultima_compra VARCHAR(50)
+            ) ON COMMIT DROP
+        """))
+
+        filas = filas_import_recontactos(leer_csv_recontactos(stream), errors)
+        cursor = db_anexa.connection().connection.cursor()
+        cursor.copy_expert(
+            "COPY tmp_import_recontactos FROM STDIN WITH (FORMAT csv)",
+            CopyBuffer(filas),
+        )
+        stream.detach()
+
+        # Merge: la ultima fila del archivo gana ante nombres repetidos.
+        # En conflicto solo se pisan los campos que vienen con valor.
+        result = db_anexa.execute(text("""
+            WITH upsert AS (
+                INSERT INTO clientes_recontacto (
+                    sucursal_id, cliente_codigo, cliente_nombre, cliente_telefono,
+                    cliente_email, mascota, especie, tamano, marca_habitual,
+                    ultimo_producto, ultima_compra, dias_sin_comprar,
+                    monto_ultima_compra, tipo_servicio, estado,
+                    recordatorio_activo, importado, mes_importacion
+                )
+                SELECT DISTINCT ON (lower(btrim(cliente_nombre)))
+                    :sucursal_id, cliente_codigo, cliente_nombre, cliente_telefono,
+                    cliente_email, mascota, especie, tamano, marca_habitual,
+                    ultimo_producto, ultima_compra, dias_sin_comprar,
+                    monto_ultima_compra, 'general', 'pendiente',
+                    false, true, :mes
+                FROM tmp_import_recontactos
+                ORDER BY lower(btrim(cliente_nombre)), fila DESC
+                ON CONFLICT (sucursal_id, lower(btrim(cliente_nombre)))
+                    WHERE COALESCE(tipo_servicio, 'general') = 'general'
+                DO UPDATE SET
+                    cliente_telefono = COALESCE(EXCLUDED.cliente_telefono, clientes_recontacto.cliente_telefono),
+                    cliente_email = COALESCE(EXCLUDED.cliente_email, clientes_recontacto.cliente_email),
+                    mascota = COALESCE(EXCLUDED.mascota, clientes_recontacto.mascota),
+                    especie = COALESCE(EXCLUDED.especie, clientes_recontacto.especie),
+                    tamano = COALESCE(EXCLUDED.tamano, clientes_recontacto.tamano),
+                    marca_habitual = COALESCE(EXCLUDED.marca_habitual, clientes_recontacto.marca_habitual),
+                    ultimo_producto = COALESCE(EXCLUDED.ultimo_producto, clientes_recontacto.ultimo_producto),
+                    ultima_compra = COALESCE(EXCLUDED.ultima_compra, clientes_recontacto.ultima_compra),
+                    dias_sin_comprar = COALESCE(NULLIF(EXCLUDED.dias_sin_comprar, 0), clientes_recontacto.dias_sin_comprar),
+                    monto_ultima_compra = COALESCE(EXCLUDED.monto_ultima_compra, clientes_recontacto.monto_ultima_compra),
+                    updated_at = NOW()
+                RETURNING (xmax = 0) AS insertado
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE insertado) AS importados,
+                COUNT(*) FILTER (WHERE NOT insertado) AS actualizados
+            FROM upsert
+        """), {
+            "sucursal_id": target_sucursal,
+            "mes": mes or datetime.now().strftime("%Y-%m"),
+        }).fetchone()
+        importados = result[0] or 0
+        actualizados = result[1] or 0
+
+        # Las filas actualizadas conservan su estado; solo suman las nuevas
+        sumar_contadores(db_anexa, [
+            {"sucursal_id": target_sucursal, "estado": "pendiente", "delta_clientes": importados}
+        ])
 
         db_anexa.commit()
 
     except HTTPException:
+        db_anexa.rollback()
         raise
     except Exception as e:
         db_anexa.rollback()
@@ -780,7 +1115,9 @@ async def actualizar_estado_cliente(
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+    estado_anterior = cliente.estado
     cliente.estado = estado
+    contar_cambio_estado(db_anexa, cliente, estado_anterior)
 
     # Desactivar recordatorio si el estado es definitivo (evita que se sobreescriba al listar)
     estados_definitivos = ["vendido", "recuperado", "no_interesado", "deceso"]
@@ -822,6 +1159,13 @@ async def eliminar_cliente(
         RegistroContacto.cliente_recontacto_id == cliente_id
     ).delete()
 
+    sumar_contadores(db_anexa, [{
+        "sucursal_id": cliente.sucursal_id,
+        "tipo_servicio": cliente.tipo_servicio,
+        "estado": cliente.estado,
+        "delta_clientes": -1,
+    }])
+
     db_anexa.delete(cliente)
     db_anexa.commit()
 
@@ -852,8 +1196,10 @@ async def completar_recordatorio(
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+    estado_anterior = cliente.estado
     cliente.recordatorio_activo = False
     cliente.estado = "recuperado"
+    contar_cambio_estado(db_anexa, cliente, estado_anterior)
     db_anexa.commit()
 
     return {"success": True, "message": "Recordatorio completado"}
@@ -885,124 +1231,187 @@ async def reprogramar_recordatorio(
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
     cliente.recordatorio_dias = dias
+    estado_anterior = cliente.estado
     cliente.recordatorio_fecha_proximo = date.today() + timedelta(days=dias)
     cliente.estado = "contactado"
+    contar_cambio_estado(db_anexa, cliente, estado_anterior)
     db_anexa.commit()
 
     return {"success": True, "message": "Recordatorio reprogramado"}
 
 
+# Clientes importados que se eliminan por transaccion al cerrar el mes
+LOTE_CIERRE_MES = 2000
+
+
+def ejecutar_cierre_mes(job_id: str, mes: str):
+    """
+    Trabajo en segundo plano del cierre de mes (ver cerrar_mes_recontactos).
+    Usa sesiones propias: corre despues de que el request ya respondio.
+    """
+    db_dux = SessionDux()
+    db_anexa = SessionAnexa()
+    try:
+        actualizar_job(job_id, estado="en_proceso", mensaje="Calculando avance por sucursal")
+
+        # Obtener mapeo sucursales.id -> sucursales.dux_id
+        sucursales = db_dux.query(SucursalInfo).filter(
+            ~SucursalInfo.codigo.like('FRQ%')
+        ).all()
+        id_to_dux = {s.id: s.dux_id for s in sucursales}
+        id_to_nombre = {s.id: s.nombre for s in sucursales}
+
+        # Avance de todas las sucursales en una sola consulta agrupada
+        rows = db_anexa.execute(text("""
+            SELECT
+                sucursal_id,
+                COUNT(*) as total,
+                SUM(CASE WHEN estado IN ('contactado', 'recuperado', 'no_interesado', 'deceso') THEN 1 ELSE 0 END) as gestionados
+            FROM clientes_recontacto
+            WHERE importado = true AND mes_importacion = :mes
+            GROUP BY sucursal_id
+        """), {"mes": mes}).fetchall()
+
+        detalles = []
+        dux_ids = []
+        avances = []
+        for suc_id, total, gestionados in rows:
+            avance = round((gestionados / total) * 100, 1) if total > 0 else 0
+            dux_id = id_to_dux.get(suc_id)
+            if not dux_id:
+                continue
+            dux_ids.append(dux_id)
+            avances.append(avance)
+            detalles.append({
+                "sucursal": id_to_nombre.get(suc_id, f"Suc {suc_id}"),
+                "total_clientes": total,
+                "gestionados": gestionados,
+                "avance": avance,
+            })
+
+        # Upsert en lote; puntaje_total = promedio de los puntajes cargados
+        if dux_ids:
+            db_anexa.execute(text("""
+                INSERT INTO auditoria_mensual (sucursal_id, periodo, recontactos, puntaje_total)
+                SELECT t.sucursal_id, :mes, t.avance, t.avance
+                FROM unnest(CAST(:sucursales AS INTEGER[]), CAST(:avances AS FLOAT[])) AS t(sucursal_id, avance)
+                ON CONFLICT (sucursal_id, periodo) DO UPDATE SET
+                    recontactos = EXCLUDED.recontactos,
+                    puntaje_total = (
+                        SELECT ROUND(CAST(AVG(p) AS NUMERIC), 1)
+                        FROM unnest(ARRAY[
+                            auditoria_mensual.orden_limpieza, auditoria_mensual.pedidos,
+                            auditoria_mensual.gestion_administrativa, auditoria_mensual.club_mascotera,
+                            auditoria_mensual.control_stock_caja, EXCLUDED.recontactos
+                        ]) AS p
+                    ),
+                    updated_at = NOW()
+            """), {"mes": mes, "sucursales": dux_ids, "avances": avances})
+        db_anexa.commit()
+
+        # Eliminar clientes importados del mes (y sus contactos) en lotes acotados
+        total_eliminar = db_anexa.execute(text("""
+            SELECT COUNT(*) FROM clientes_recontacto
+            WHERE importado = true AND mes_importacion = :mes
+        """), {"mes": mes}).scalar() or 0
+
+        contactos_eliminados = 0
+        clientes_eliminados = 0
+        while True:
+            ids_lote = [r[0] for r in db_anexa.execute(text("""
+                SELECT id FROM clientes_recontacto
+                WHERE importado = true AND mes_importacion = :mes
+                ORDER BY id
+                LIMIT :lote
+            """), {"mes": mes, "lote": LOTE_CIERRE_MES}).fetchall()]
+            if not ids_lote:
+                break
+
+            contactos_eliminados += db_anexa.execute(text("""
+                DELETE FROM registros_contacto WHERE cliente_recontacto_id = ANY(:ids)
+            """), {"ids": ids_lote}).rowcount
+            clientes_eliminados += db_anexa.execute(text("""
+                DELETE FROM clientes_recontacto WHERE id = ANY(:ids)
+            """), {"ids": ids_lote}).rowcount
+            db_anexa.commit()
+
+            actualizar_job(
+                job_id,
+                progreso=min(99, int(clientes_eliminados * 100 / total_eliminar)) if total_eliminar else 99,
+                mensaje=f"Eliminados {clientes_eliminados} de {total_eliminar} clientes importados",
+            )
+
+        # Borrado masivo: se reconstruyen (y compactan) los contadores
+        if clientes_eliminados:
+            recalcular_contadores(db_anexa)
+            db_anexa.commit()
+
+        actualizar_job(job_id, estado="completado", progreso=100, mensaje="Mes cerrado", resultado={
+            "success": True,
+            "mes": mes,
+            "auditorias_guardadas": len(dux_ids),
+            "clientes_eliminados": clientes_eliminados,
+            "contactos_eliminados": contactos_eliminados,
+            "detalles": detalles,
+        })
+    except Exception as e:
+        db_anexa.rollback()
+        actualizar_job(job_id, estado="error", error=str(e))
+    finally:
+        db_anexa.close()
+        db_dux.close()
+
+
 @router.post("/cerrar-mes")
 async def cerrar_mes_recontactos(
+    background_tasks: BackgroundTasks,
     mes: str = Query(..., description="Mes a cerrar en formato YYYY-MM"),
     current_user: Employee = Depends(get_current_user),
-    db_dux: Session = Depends(get_db),
-    db_anexa: Session = Depends(get_db_anexa)
 ):
     """
-    Cierra el mes de recontactos:
+    Cierra el mes de recontactos en segundo plano:
     1. Guarda el % de avance por sucursal en auditoria_mensual
-    2. Elimina los clientes importados (importado=true) de ese mes
+    2. Elimina los clientes importados (importado=true) de ese mes, en lotes
     3. NO toca los clientes creados manualmente por vendedores
+    Retorna el id del trabajo; el avance se consulta en GET /cerrar-mes/{job_id}.
     Solo admins pueden ejecutar esta accion.
     """
     if not es_admin_o_superior(current_user):
         raise HTTPException(status_code=403, detail="Solo administradores pueden cerrar el mes")
 
-    from ..models.auditoria_mensual import AuditoriaMensual
-
-    # Obtener mapeo sucursales.id -> sucursales.dux_id
-    sucursales = db_dux.query(SucursalInfo).filter(
-        ~SucursalInfo.codigo.like('FRQ%')
-    ).all()
-    id_to_dux = {s.id: s.dux_id for s in sucursales}
-
-    # Obtener resumen por sucursal de clientes importados del mes
-    rows = db_anexa.execute(text("""
-        SELECT
-            sucursal_id,
-            COUNT(*) as total,
-            SUM(CASE WHEN estado IN ('contactado', 'recuperado', 'no_interesado', 'deceso') THEN 1 ELSE 0 END) as gestionados
-        FROM clientes_recontacto
-        WHERE importado = true AND mes_importacion = :mes
-        GROUP BY sucursal_id
-    """), {"mes": mes}).fetchall()
-
-    auditorias_guardadas = 0
-    detalles = []
-
-    for row in rows:
-        suc_id = row[0]
-        total = row[1]
-        gestionados = row[2]
-        avance = round((gestionados / total) * 100, 1) if total > 0 else 0
-
-        dux_id = id_to_dux.get(suc_id)
-        if not dux_id:
-            continue
-
-        # Upsert en auditoria_mensual
-        existente = db_anexa.query(AuditoriaMensual).filter(
-            AuditoriaMensual.sucursal_id == dux_id,
-            AuditoriaMensual.periodo == mes
-        ).first()
-
-        if existente:
-            existente.recontactos = avance
-            # Recalcular puntaje_total
-            puntajes = [p for p in [
-                existente.orden_limpieza, existente.pedidos,
-                existente.gestion_administrativa, existente.club_mascotera,
-                existente.control_stock_caja, avance
-            ] if p is not None]
-            if puntajes:
-                existente.puntaje_total = round(sum(puntajes) / len(puntajes), 1)
-        else:
-            nuevo = AuditoriaMensual(
-                sucursal_id=dux_id,
-                periodo=mes,
-                recontactos=avance,
-                puntaje_total=avance,
-            )
-            db_anexa.add(nuevo)
-
-        auditorias_guardadas += 1
-        suc_nombre = next((s.nombre for s in sucursales if s.id == suc_id), f"Suc {suc_id}")
-        detalles.append({
-            "sucursal": suc_nombre,
-            "total_clientes": total,
-            "gestionados": gestionados,
-            "avance": avance,
-        })
-
-    db_anexa.commit()
+    try:
+        datetime.strptime(mes, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de mes inválido. Use YYYY-MM")
 
-    # Eliminar registros de contacto de clientes importados del mes
-    ids_importados = db_anexa.execute(text("""
-        SELECT id FROM clientes_recontacto
-        WHERE importado = true AND mes_importacion = :mes
-    """), {"mes": mes}).fetchall()
-    ids_list = [r[0] for r in ids_importados]
+    # Si ya hay un cierre en curso para ese mes, se retorna el mismo trabajo
+    job = buscar_job_activo("cierre_mes_recontactos", mes=mes)
+    if not job:
+        job = crear_job("cierre_mes_recontactos", mes=mes, creado_por=current_user.id)
+        background_tasks.add_task(ejecutar_cierre_mes, job["id"], mes)
 
-    contactos_eliminados = 0
-    clientes_eliminados = 0
+    return {"success": True, "mes": mes, "job_id": job["id"], "estado": job["estado"]}
 
-    if ids_list:
-        contactos_eliminados = db_anexa.query(RegistroContacto).filter(
-            RegistroContacto.cliente_recontacto_id.in_(ids_list)
-        ).delete(synchronize_session=False)
 
-        clientes_eliminados = db_anexa.query(ClienteRecontacto).filter(
-            ClienteRecontacto.id.in_(ids_list)
-        ).delete(synchronize_session=False)
+@router.get("/cerrar-mes/{job_id}")
+async def estado_cierre_mes(
+    job_id: str,
+    current_user: Employee = Depends(get_current_user),
+):
+    """Estado y avance de un cierre de mes. Al completarse incluye el resultado."""
+    if not es_admin_o_superior(current_user):
+        raise HTTPException(status_code=403, detail="Solo administradores pueden cerrar el mes")
 
-        db_anexa.commit()
+    job = get_job(job_id)
+    if not job or job["tipo"] != "cierre_mes_recontactos":
+        raise HTTPException(status_code=404, detail="Cierre de mes no encontrado")
 
     return {
-        "success": True,
-        "mes": mes,
-        "auditorias_guardadas": auditorias_guardadas,
-        "clientes_eliminados": clientes_eliminados,
-        "contactos_eliminados": contactos_eliminados,
-        "detalles": detalles,
+        "job_id": job["id"],
+        "mes": job["mes"],
+        "estado": job["estado"],
+        "progreso": job["progreso"],
+        "mensaje": job["mensaje"],
+        "resultado": job["resultado"],
+        "error": job["error"],
     }
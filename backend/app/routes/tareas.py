@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -6,6 +6,7 @@ from typing import List, Optional
 from datetime import date
 from ..core.database import get_db, get_db_anexa
 from ..core.security import get_current_user, require_supervisor, es_supervisor, es_encargado
+from ..core.archivos import get_almacen, respuesta_archivo
 from ..models.employee import Employee, SucursalInfo
 from ..models.tareas import TareaSucursal
 from ..models.tarea_foto import TareaFoto
@@ -303,10 +304,14 @@ async def subir_foto_tarea(
     if len(contenido) > 5 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="La imagen no puede superar 5MB")
 
+    # El binario va al almacen de archivos; la fila solo guarda el hash
+    archivo_hash = get_almacen().guardar(contenido)
+
     # Guardar o reemplazar foto existente
     foto_existente = db_anexa.query(TareaFoto).filter(TareaFoto.tarea_id == tarea_id).first()
     if foto_existente:
-        foto_existente.foto_data = contenido
+        foto_existente.foto_data = None
+        foto_existente.archivo_hash = archivo_hash
         foto_existente.filename = foto.filename or "foto.jpg"
         foto_existente.content_type = foto.content_type
         foto_existente.subido_por = current_user.id
@@ -315,7 +320,7 @@ async def subir_foto_tarea(
             tarea_id=tarea_id,
             filename=foto.filename or "foto.jpg",
             content_type=foto.content_type,
-            foto_data=contenido,
+            archivo_hash=archivo_hash,
             subido_por=current_user.id,
         )
         db_anexa.add(nueva_foto)
@@ -327,6 +332,7 @@ async def subir_foto_tarea(
 @router.get("/{tarea_id}/foto")
 async def get_foto_tarea(
     tarea_id: int,
+    request: Request,
     current_user: Employee = Depends(get_current_user),
     db_anexa: Session = Depends(get_db_anexa)
 ):
@@ -335,6 +341,10 @@ async def get_foto_tarea(
     if not foto:
         raise HTTPException(status_code=404, detail="No hay foto para esta tarea")
 
+    if foto.archivo_hash:
+        return respuesta_archivo(request, foto.archivo_hash, foto.content_type, foto.filename)
+
+    # Foto aun no migrada al almacen de archivos
     return Response(
         content=foto.foto_data,
         media_type=foto.content_type,
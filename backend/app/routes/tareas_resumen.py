@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import Optional
 from ..core.database import get_db, get_db_anexa
 from ..core.security import get_current_user, require_encargado, es_encargado
+from ..core.archivos import get_almacen, respuesta_archivo
 from ..models.employee import Employee
 from ..models.tareas_resumen import TareasResumenSemanal
 from ..models.reporte_pdf import ReporteAuditoriaPDF
@@ -158,7 +159,7 @@ async def upload_reporte_pdf(
         periodo=periodo,
         filename=archivo.filename or f"auditoria_{sucursal_id}_{periodo}.pdf",
         content_type=archivo.content_type,
-        pdf_data=contenido,
+        archivo_hash=get_almacen().guardar(contenido),
         tamano_bytes=len(contenido),
         uploaded_by=current_user.id,
         origen="manual",
@@ -174,6 +175,7 @@ async def upload_reporte_pdf(
 @router.get("/reportes-pdf/{reporte_id}")
 async def download_reporte_pdf(
     reporte_id: int,
+    request: Request,
     current_user: Employee = Depends(get_current_user),
     db_anexa: Session = Depends(get_db_anexa)
 ):
@@ -184,6 +186,10 @@ async def download_reporte_pdf(
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
 
+    if reporte.archivo_hash:
+        return respuesta_archivo(request, reporte.archivo_hash, reporte.content_type, reporte.filename)
+
+    # Reporte aun no migrado al almacen de archivos
     return Response(
         content=reporte.pdf_data,
         media_type=reporte.content_type,
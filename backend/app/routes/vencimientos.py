@@ -4,23 +4,31 @@ Endpoints para gestion de vencimientos de productos
 Los datos se pueden importar desde Google Sheets (CSV) o registrar manualmente.
 La tabla productos_vencimientos está en la BD anexa (mi_sucursal).
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, and_, or_, insert, update, cast, literal, tuple_, Numeric, func as sql_func
 from typing import List, Optional
 from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal, InvalidOperation
 import csv
 import io
 
-from ..core.database import get_db, get_db_anexa
+from ..core.database import get_db, get_db_anexa, SessionAnexa, SessionDux
+from ..core.scheduler import periodica
+from ..core.texto import escapar_like, tokens_busqueda
 from ..core.security import get_current_user, es_encargado
 from ..models.employee import Employee
 from ..models.vencimientos import ProductoVencimiento
+from .dashboard import SUCURSAL_PTO_VTA, EXCLUDED_PERSONAL
 from ..schemas.vencimientos import (
     VencimientoCreate,
     VencimientoUpdate,
     VencimientoResponse,
     VencimientoResumen,
+    VencimientoLoteRequest,
+    VencimientoLoteItemResult,
+    VencimientoLoteResult,
+    VentaDetectada,
     ImportVencimientosResult
 )
 
@@ -42,11 +50,8 @@ def parse_date(date_str: str) -> Optional[date]:
 
 ARGENTINA_TZ = timezone(timedelta(hours=-3))
 
-def calculate_dias_para_vencer(fecha_vencimiento: date) -> int:
-    """Calcula los dias que faltan para el vencimiento (hora Argentina)"""
-    today = datetime.now(ARGENTINA_TZ).date()
-    delta = fecha_vencimiento - today
-    return delta.days
+# Filas por INSERT multi-fila al importar (12 columnas -> muy por debajo de 65535 parametros)
+LOTE_INSERT_IMPORTACION = 1000
 
 
 def hoy_argentina() -> date:
@@ -54,20 +59,73 @@ def hoy_argentina() -> date:
     return datetime.now(ARGENTINA_TZ).date()
 
 
-def actualizar_vencidos(db_anexa: Session, sucursal_id: int):
-    """Marca como 'vencido' los productos con estado 'proximo' cuya fecha ya paso"""
-    hoy = hoy_argentina()
-    db_anexa.execute(
-        text("""
-            UPDATE productos_vencimientos
-            SET estado = 'vencido'
-            WHERE sucursal_id = :sucursal_id
-              AND estado = 'proximo'
-              AND fecha_vencimiento <= :hoy
-        """),
-        {"sucursal_id": sucursal_id, "hoy": hoy}
-    )
-    db_anexa.commit()
+# Estados activos: el producto sigue en la sucursal y puede vencer
+# Un 'proximo' cuya fecha ya llego es 'vencido' aunque la transicion periodica
+# todavia no lo haya escrito (ver transicionar_vencidos).
+ESTADO_EFECTIVO_SQL = "CASE WHEN estado = 'proximo' AND fecha_vencimiento <= :hoy THEN 'vencido' ELSE estado END"
+
+
+def estado_efectivo(v: ProductoVencimiento, hoy: Optional[date] = None) -> str:
+    """Estado vigente de un registro, considerando la fecha aunque no se haya persistido"""
+    hoy = hoy or hoy_argentina()
+    if v.estado == "proximo" and v.fecha_vencimiento <= hoy:
+        return "vencido"
+    return v.estado
+
+
+def filtro_estado(estado: str, hoy: date):
+    """Condicion SQL (indexable) equivalente a estado_efectivo == estado"""
+    if estado == "vencido":
+        return or_(
+            ProductoVencimiento.estado == "vencido",
+            and_(ProductoVencimiento.estado == "proximo", ProductoVencimiento.fecha_vencimiento <= hoy),
+        )
+    if estado == "proximo":
+        return and_(ProductoVencimiento.estado == "proximo", ProductoVencimiento.fecha_vencimiento > hoy)
+    return ProductoVencimiento.estado == estado
+
+
+def build_vencimiento_response(v: ProductoVencimiento, hoy: Optional[date] = None) -> VencimientoResponse:
+    """Arma la respuesta con dias para vencer y estado efectivo"""
+    hoy = hoy or hoy_argentina()
+    response = VencimientoResponse.model_validate(v)
+    response.estado = estado_efectivo(v, hoy)
+    response.dias_para_vencer = (v.fecha_vencimiento - hoy).days
+    return response
+
+
+@periodica("vencimientos_transicionar_vencidos", cada_segundos=3600)
+def transicionar_vencidos() -> int:
+    """
+    Persiste la transicion 'proximo' -> 'vencido' de todas las sucursales.
+    Corre periodicamente fuera de los requests: listar y buscar son solo lectura.
+    """
+    db_anexa = SessionAnexa()
+    try:
+        result = db_anexa.execute(
+            text("""
+                UPDATE productos_vencimientos
+                SET estado = 'vencido'
+                WHERE estado = 'proximo'
+                  AND fecha_vencimiento <= :hoy
+            """),
+            {"hoy": hoy_argentina()}
+        )
+        db_anexa.commit()
+        return result.rowcount
+    finally:
+        db_anexa.close()
+
+
+# Resumen por sucursal: {sucursal_id: (dia, resumen)}. Vale solo para ese dia y se
+# descarta en cada escritura de vencimientos de la sucursal
+_resumen_cache = {}
+
+
+def invalidar_resumen(*sucursal_ids):
+    """Descarta el resumen cacheado de las sucursales indicadas"""
+    for sucursal_id in sucursal_ids:
+        _resumen_cache.pop(sucursal_id, None)
 
 
 def get_sucursal_nombre(db_dux: Session, sucursal_id: int) -> str:
@@ -82,14 +140,40 @@ def get_sucursal_nombre(db_dux: Session, sucursal_id: int) -> str:
         return f"Sucursal {sucursal_id}"
 
 
+def get_costos_items(db_dux: Session, cod_items) -> dict:
+    """Costo unitario por cod_item desde items_central, en una sola consulta"""
+    cod_items = list(cod_items)
+    if not cod_items:
+        return {}
+    costos = {}
+    try:
+        rows = db_dux.execute(
+            text("SELECT cod_item, costo FROM items_central WHERE cod_item = ANY(:cod_items)"),
+            {"cod_items": cod_items}
+        ).fetchall()
+    except Exception:
+        return {}
+    for cod_item, costo in rows:
+        if not costo:
+            continue
+        try:
+            costos[cod_item] = float(costo)
+        except (ValueError, TypeError):
+            continue
+    return costos
+
+
 def crear_vencimiento_en_destino(
     db_anexa: Session, db_dux: Session,
     vencimiento_origen: ProductoVencimiento,
     sucursal_destino_id: int,
-    sucursal_origen_id: int
+    sucursal_origen_id: int,
+    origen_nombre: Optional[str] = None
 ):
-    """Crea un registro espejo del vencimiento en la sucursal destino"""
-    origen_nombre = get_sucursal_nombre(db_dux, sucursal_origen_id)
+    """Crea un registro espejo del vencimiento en la sucursal destino.
+    origen_nombre evita consultar DUX en cada registro cuando se crean varios."""
+    if origen_nombre is None:
+        origen_nombre = get_sucursal_nombre(db_dux, sucursal_origen_id)
 
     estado = "vencido" if vencimiento_origen.fecha_vencimiento < hoy_argentina() else "proximo"
 
@@ -112,6 +196,254 @@ def crear_vencimiento_en_destino(
     return nuevo
 
 
+ESTADOS_VENCIMIENTO = ("proximo", "vencido", "retirado", "vendido", "enviado", "archivado")
+ESTADOS_RETIRO = ("retirado", "vendido", "enviado", "archivado")
+CAMPOS_ACTUALIZABLES = (
+    "notas", "tiene_accion_comercial", "accion_comercial", "porcentaje_descuento",
+    "sucursal_destino_id", "sucursal_destino_nombre", "fecha_movimiento",
+)
+
+# Maximo de cambios por llamada a /actualizar-lote
+MAX_ITEMS_LOTE = 500
+
+
+def calcular_cambios(v: ProductoVencimiento, data: VencimientoUpdate, hoy: date):
+    """Columnas a actualizar en v segun data, y el registro nuevo de la venta parcial (si aplica).
+    No modifica v: lo usan tanto el PUT individual como la actualizacion en lote."""
+    ahora = datetime.now()
+    valores = {}
+    if data.estado is not None:
+        valores["estado"] = data.estado
+        if data.estado in ESTADOS_RETIRO:
+            valores["fecha_retiro"] = ahora
+    for campo in CAMPOS_ACTUALIZABLES:
+        valor = getattr(data, campo)
+        if valor is not None:
+            valores[campo] = valor
+
+    # Venta parcial: se vendió una parte, el resto sigue activo
+    registro_vendido = None
+    if (data.estado == "vendido"
+            and data.cantidad_vendida is not None
+            and 1 <= data.cantidad_vendida < v.cantidad):
+        def actual(campo):
+            return valores.get(campo, getattr(v, campo))
+
+        # Registro independiente para las unidades vendidas
+        registro_vendido = {
+            "sucursal_id": v.sucursal_id,
+            "employee_id": v.employee_id,
+            "cod_item": v.cod_item,
+            "producto": v.producto,
+            "cantidad": data.cantidad_vendida,
+            "precio_unitario": v.precio_unitario,
+            "valor_total": (float(v.precio_unitario) * data.cantidad_vendida
+                            if v.precio_unitario else None),
+            "fecha_vencimiento": v.fecha_vencimiento,
+            "estado": "vendido",
+            "fecha_retiro": ahora,
+            "notas": actual("notas"),
+            "importado": False,
+            "tiene_accion_comercial": actual("tiene_accion_comercial"),
+            "accion_comercial": actual("accion_comercial"),
+            "porcentaje_descuento": actual("porcentaje_descuento"),
+            "sucursal_origen_id": v.sucursal_origen_id,
+            "sucursal_origen_nombre": v.sucursal_origen_nombre,
+        }
+
+        # El registro original queda con la cantidad restante, activo (proximo o vencido según fecha)
+        cantidad_restante = v.cantidad - data.cantidad_vendida
+        valores["cantidad"] = cantidad_restante
+        if v.precio_unitario:
+            valores["valor_total"] = float(v.precio_unitario) * cantidad_restante
+        valores["estado"] = "vencido" if v.fecha_vencimiento < hoy else "proximo"
+        valores["fecha_retiro"] = None
+
+    return valores, registro_vendido
+
+
+def requiere_espejo(data: VencimientoUpdate, sucursal_id: int) -> bool:
+    """Un envio a otra sucursal crea el registro espejo en el destino"""
+    return bool(data.estado == "enviado" and data.sucursal_destino_id
+                and data.sucursal_destino_id != sucursal_id)
+
+
+def pto_vta_sucursales():
+    """Pares (nro_pto_vta, sucursal_id) como arrays paralelos, para unnest() en las consultas a facturas"""
+    ptos, sucs = [], []
+    for sucursal_id, pto_vta_list in SUCURSAL_PTO_VTA.items():
+        for pto_vta in pto_vta_list:
+            ptos.append(str(pto_vta))
+            sucs.append(sucursal_id)
+    return ptos, sucs
+
+
+def detectar_ventas(db_anexa: Session, db_dux: Session, hoy: date, sucursal_id: Optional[int] = None):
+    """
+    Unidades vendidas de cada producto activo (proximo/vencido) segun los line items de facturas.
+
+    Se revisan los dias completos posteriores a ventas_revisadas_hasta (o al dia de registro)
+    y hasta ayer. Las ventas de cada dia se asignan a los lotes del mismo cod_item y sucursal
+    empezando por el que vence primero. Retorna (lotes, {vencimiento_id: unidades}, hasta).
+    """
+    hasta = hoy - timedelta(days=1)
+    query = db_anexa.query(ProductoVencimiento).filter(
+        ProductoVencimiento.estado.in_(("proximo", "vencido")),
+        ProductoVencimiento.cod_item.isnot(None),
+        ProductoVencimiento.sucursal_id.in_(list(SUCURSAL_PTO_VTA)),
+    )
+    if sucursal_id:
+        query = query.filter(ProductoVencimiento.sucursal_id == sucursal_id)
+    lotes = query.order_by(ProductoVencimiento.fecha_vencimiento, ProductoVencimiento.id).all()
+
+    def desde(v):
+        return v.ventas_revisadas_hasta or v.fecha_registro.date()
+
+    lotes = [v for v in lotes if desde(v) < hasta]
+    grupos = {}
+    for v in lotes:
+        grupos.setdefault((v.sucursal_id, v.cod_item), []).append(v)
+    if not grupos:
+        return lotes, {}, hasta
+
+    # Ventas diarias por (sucursal, cod_item) desde el lote mas antiguo sin revisar del grupo.
+    # Las lineas de cada factura se expanden una sola vez (ventana: el desde mas antiguo de su
+    # sucursal, solo los cod_item buscados) y recien despues se cruzan con los grupos.
+    claves = list(grupos)
+    desde_grupo = {k: min(desde(v) for v in grupos[k]) for k in claves}
+    desde_sucursal = {}
+    for (suc_id, _), fecha in desde_grupo.items():
+        desde_sucursal[suc_id] = min(fecha, desde_sucursal.get(suc_id, fecha))
+    ptos, sucs = pto_vta_sucursales()
+    rows = db_dux.execute(text("""
+        WITH grupos AS (
+            SELECT * FROM unnest(CAST(:g_sucs AS int[]), CAST(:g_cods AS text[]), CAST(:g_desdes AS date[]))
+                AS g(sucursal_id, cod_item, desde)
+        ), ventanas AS (
+            SELECT pv.nro_pto_vta, pv.sucursal_id, s.desde
+            FROM unnest(CAST(:ptos AS text[]), CAST(:sucs AS int[])) AS pv(nro_pto_vta, sucursal_id)
+            JOIN unnest(CAST(:s_sucs AS int[]), CAST(:s_desdes AS date[])) AS s(sucursal_id, desde)
+              ON s.sucursal_id = pv.sucursal_id
+        ), lineas AS (
+            SELECT w.sucursal_id, d->>'cod_item' AS cod_item, f.fecha_comp::date AS fecha,
+                   (d->>'ctd')::numeric * CASE WHEN f.tipo_comp = 'NOTA_CREDITO' THEN -1 ELSE 1 END AS unidades
+            FROM facturas f
+            JOIN ventanas w ON w.nro_pto_vta = f.nro_pto_vta
+            CROSS JOIN LATERAL jsonb_array_elements(f.detalles::jsonb) d
+            WHERE f.fecha_comp::date > w.desde
+              AND f.fecha_comp::date <= :hasta
+              AND f.tipo_comp IN ('COMPROBANTE_VENTA', 'FACTURA', 'NOTA_CREDITO')
+              AND (f.id_personal IS NULL OR f.id_personal <> ALL(:excluidos))
+              AND (f.anulada IS NULL OR f.anulada != 'S')
+              AND (f.anulada_boolean IS NULL OR f.anulada_boolean = false)
+              AND d->>'cod_item' = ANY(:cods)
+        )
+        SELECT l.sucursal_id, l.cod_item, l.fecha, SUM(l.unidades) AS unidades
+        FROM lineas l
+        JOIN grupos g ON g.sucursal_id = l.sucursal_id AND g.cod_item = l.cod_item
+        WHERE l.fecha > g.desde
+        GROUP BY l.sucursal_id, l.cod_item, l.fecha
+        ORDER BY l.fecha
+    """), {
+        "g_sucs": [k[0] for k in claves],
+        "g_cods": [k[1] for k in claves],
+        "g_desdes": [desde_grupo[k] for k in claves],
+        "s_sucs": list(desde_sucursal),
+        "s_desdes": list(desde_sucursal.values()),
+        "cods": sorted({k[1] for k in claves}),
+        "ptos": ptos, "sucs": sucs, "hasta": hasta, "excluidos": EXCLUDED_PERSONAL,
+    }).fetchall()
+
+    vendidas = {}
+    restante = {v.id: v.cantidad for v in lotes}
+    for row in rows:
+        unidades = int(row.unidades or 0)
+        for v in grupos[(row.sucursal_id, row.cod_item)]:
+            if unidades <= 0:
+                break
+            if row.fecha <= desde(v) or restante[v.id] <= 0:
+                continue
+            asignadas = min(unidades, restante[v.id])
+            restante[v.id] -= asignadas
+            vendidas[v.id] = vendidas.get(v.id, 0) + asignadas
+            unidades -= asignadas
+    return lotes, vendidas, hasta
+
+
+def aplicar_ventas_sucursal(db_anexa: Session, db_dux: Session, hoy: date, sucursal_id: int) -> int:
+    """
+    Aplica las ventas detectadas de una sucursal y confirma. Las ventas se calculan sin
+    bloquear; recien despues se bloquean (FOR UPDATE) solo los lotes revisados y se
+    descartan los que cambiaron mientras tanto (se vuelven a revisar en la proxima pasada).
+    """
+    lotes, vendidas, hasta = detectar_ventas(db_anexa, db_dux, hoy, sucursal_id)
+    if not lotes:
+        return 0
+
+    vistos = {v.id: (v.estado, v.cantidad, v.ventas_revisadas_hasta) for v in lotes}
+    lotes = [
+        v for v in db_anexa.query(ProductoVencimiento)
+        .filter(ProductoVencimiento.id.in_(list(vistos)))
+        .order_by(ProductoVencimiento.id)
+        .with_for_update()
+        .populate_existing()
+        .all()
+        if (v.estado, v.cantidad, v.ventas_revisadas_hasta) == vistos[v.id]
+    ]
+    if not lotes:
+        db_anexa.commit()
+        return 0
+
+    cambios = []
+    registros_vendidos = []
+    for v in lotes:
+        if v.id not in vendidas:
+            continue
+        # Venta total si alcanza la cantidad del lote; si no, venta parcial (mismas reglas que el PUT)
+        data = VencimientoUpdate(
+            estado="vendido",
+            cantidad_vendida=vendidas[v.id] if vendidas[v.id] < v.cantidad else None,
+        )
+        valores, registro_vendido = calcular_cambios(v, data, hoy)
+        cambios.append({"id": v.id, **valores})
+        if registro_vendido:
+            registros_vendidos.append(registro_vendido)
+
+    if cambios:
+        db_anexa.execute(update(ProductoVencimiento), cambios)
+    if registros_vendidos:
+        db_anexa.execute(insert(ProductoVencimiento).values(registros_vendidos))
+    db_anexa.execute(
+        text("UPDATE productos_vencimientos SET ventas_revisadas_hasta = :hasta WHERE id = ANY(:ids)"),
+        {"hasta": hasta, "ids": [v.id for v in lotes]}
+    )
+    db_anexa.commit()
+    if cambios:
+        invalidar_resumen(sucursal_id)
+    return len(cambios)
+
+
+@periodica("vencimientos_detectar_ventas", cada_segundos=6 * 3600, demora_inicial=600)
+def aplicar_ventas_detectadas(sucursal_id: Optional[int] = None) -> int:
+    """
+    Marca como vendidas (total o parcialmente) las unidades detectadas en facturas.
+    Una pasada por sucursal (una transaccion corta cada una): UPDATE por clave primaria en
+    lote, INSERT multi-fila de las ventas parciales y avance de ventas_revisadas_hasta.
+    """
+    db_anexa = SessionAnexa()
+    db_dux = SessionDux()
+    try:
+        hoy = hoy_argentina()
+        sucursales = [sucursal_id] if sucursal_id else list(SUCURSAL_PTO_VTA)
+        return sum(aplicar_ventas_sucursal(db_anexa, db_dux, hoy, s) for s in sucursales)
+    except Exception:
+        db_anexa.rollback()
+        raise
+    finally:
+        db_anexa.close()
+        db_dux.close()
+
+
 # ===== Endpoints =====
 
 @router.get("/", response_model=List[VencimientoResponse])
@@ -135,34 +467,25 @@ async def listar_vencimientos(
     if not target_sucursal:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
-    # Actualizar automaticamente productos vencidos
-    actualizar_vencidos(db_anexa, target_sucursal)
-
+    hoy = hoy_argentina()
     query = db_anexa.query(ProductoVencimiento).filter(
         ProductoVencimiento.sucursal_id == target_sucursal
     )
 
     if estado:
-        query = query.filter(ProductoVencimiento.estado == estado)
+        query = query.filter(filtro_estado(estado, hoy))
     elif not incluir_archivados:
         query = query.filter(ProductoVencimiento.estado != "archivado")
 
     if dias_limite:
-        fecha_limite = hoy_argentina() + timedelta(days=dias_limite)
+        fecha_limite = hoy + timedelta(days=dias_limite)
         query = query.filter(ProductoVencimiento.fecha_vencimiento <= fecha_limite)
-        query = query.filter(ProductoVencimiento.estado == "proximo")
+        query = query.filter(filtro_estado("proximo", hoy))
 
     query = query.order_by(ProductoVencimiento.fecha_vencimiento.asc())
     vencimientos = query.offset(offset).limit(limit).all()
 
-    # Agregar dias para vencer a cada registro
-    result = []
-    for v in vencimientos:
-        response = VencimientoResponse.model_validate(v)
-        response.dias_para_vencer = calculate_dias_para_vencer(v.fecha_vencimiento)
-        result.append(response)
-
-    return result
+    return [build_vencimiento_response(v, hoy) for v in vencimientos]
 
 
 @router.post("/", response_model=VencimientoResponse)
@@ -184,18 +507,7 @@ async def crear_vencimiento(
     # Obtener precio del producto desde DUX si tiene cod_item
     precio_unitario = data.precio_unitario
     if not precio_unitario and data.cod_item:
-        try:
-            result = db_dux.execute(
-                text("SELECT costo FROM items_central WHERE cod_item = :cod_item"),
-                {"cod_item": data.cod_item}
-            ).fetchone()
-            if result and result[0]:
-                try:
-                    precio_unitario = float(result[0])
-                except (ValueError, TypeError):
-                    precio_unitario = None
-        except Exception:
-            pass
+        precio_unitario = get_costos_items(db_dux, [data.cod_item]).get(data.cod_item)
 
     # Calcular valor total
     valor_total = None
@@ -235,11 +547,10 @@ async def crear_vencimiento(
         )
 
     db_anexa.commit()
+    invalidar_resumen(current_user.sucursal_id, data.sucursal_destino_id)
     db_anexa.refresh(vencimiento)
 
-    response = VencimientoResponse.model_validate(vencimiento)
-    response.dias_para_vencer = calculate_dias_para_vencer(vencimiento.fecha_vencimiento)
-    return response
+    return build_vencimiento_response(vencimiento)
 
 
 @router.put("/{vencimiento_id}", response_model=VencimientoResponse)
@@ -262,81 +573,164 @@ async def actualizar_vencimiento(
     if not vencimiento:
         raise HTTPException(status_code=404, detail="Registro no encontrado")
 
-    # Actualizar campos si se proporcionan
-    if data.estado is not None:
-        vencimiento.estado = data.estado
-        if data.estado in ("retirado", "vendido", "enviado", "archivado"):
-            vencimiento.fecha_retiro = datetime.now()
-    if data.notas is not None:
-        vencimiento.notas = data.notas
-
-    # Acción comercial
-    if data.tiene_accion_comercial is not None:
-        vencimiento.tiene_accion_comercial = data.tiene_accion_comercial
-    if data.accion_comercial is not None:
-        vencimiento.accion_comercial = data.accion_comercial
-    if data.porcentaje_descuento is not None:
-        vencimiento.porcentaje_descuento = data.porcentaje_descuento
-
-    # Rotación
-    if data.sucursal_destino_id is not None:
-        vencimiento.sucursal_destino_id = data.sucursal_destino_id
-    if data.sucursal_destino_nombre is not None:
-        vencimiento.sucursal_destino_nombre = data.sucursal_destino_nombre
-    if data.fecha_movimiento is not None:
-        vencimiento.fecha_movimiento = data.fecha_movimiento
-
-    # Venta parcial: se vendió una parte, el resto sigue activo
-    if (data.estado == "vendido"
-            and data.cantidad_vendida is not None
-            and 1 <= data.cantidad_vendida < vencimiento.cantidad):
-        # Crear registro independiente para las unidades vendidas
-        registro_vendido = ProductoVencimiento(
-            sucursal_id=vencimiento.sucursal_id,
-            employee_id=vencimiento.employee_id,
-            cod_item=vencimiento.cod_item,
-            producto=vencimiento.producto,
-            cantidad=data.cantidad_vendida,
-            precio_unitario=vencimiento.precio_unitario,
-            valor_total=(float(vencimiento.precio_unitario) * data.cantidad_vendida
-                         if vencimiento.precio_unitario else None),
-            fecha_vencimiento=vencimiento.fecha_vencimiento,
-            estado='vendido',
-            fecha_retiro=datetime.now(),
-            notas=vencimiento.notas,
-            importado=False,
-            tiene_accion_comercial=vencimiento.tiene_accion_comercial,
-            accion_comercial=vencimiento.accion_comercial,
-            porcentaje_descuento=vencimiento.porcentaje_descuento,
-            sucursal_origen_id=vencimiento.sucursal_origen_id,
-            sucursal_origen_nombre=vencimiento.sucursal_origen_nombre,
-        )
-        db_anexa.add(registro_vendido)
-
-        # Restaurar el registro original con la cantidad restante
-        cantidad_restante = vencimiento.cantidad - data.cantidad_vendida
-        vencimiento.cantidad = cantidad_restante
-        if vencimiento.precio_unitario:
-            vencimiento.valor_total = float(vencimiento.precio_unitario) * cantidad_restante
-        # Revertir estado a activo (proximo o vencido según fecha)
-        hoy = hoy_argentina()
-        vencimiento.estado = 'vencido' if vencimiento.fecha_vencimiento < hoy else 'proximo'
-        vencimiento.fecha_retiro = None
+    valores, registro_vendido = calcular_cambios(vencimiento, data, hoy_argentina())
+    for campo, valor in valores.items():
+        setattr(vencimiento, campo, valor)
 
+    if registro_vendido:
+        db_anexa.add(ProductoVencimiento(**registro_vendido))
     # Si se envia a otra sucursal, crear registro en la sucursal destino
-    elif (data.estado == "enviado" and data.sucursal_destino_id
-            and data.sucursal_destino_id != current_user.sucursal_id):
+    elif requiere_espejo(data, current_user.sucursal_id):
         crear_vencimiento_en_destino(
             db_anexa, db_dux, vencimiento,
             data.sucursal_destino_id, current_user.sucursal_id
         )
 
     db_anexa.commit()
+    invalidar_resumen(current_user.sucursal_id, vencimiento.sucursal_destino_id)
     db_anexa.refresh(vencimiento)
 
-    response = VencimientoResponse.model_validate(vencimiento)
-    response.dias_para_vencer = calculate_dias_para_vencer(vencimiento.fecha_vencimiento)
-    return response
+    return build_vencimiento_response(vencimiento)
+
+
+@router.post("/actualizar-lote", response_model=VencimientoLoteResult)
+async def actualizar_vencimientos_lote(
+    data: VencimientoLoteRequest,
+    current_user: Employee = Depends(get_current_user),
+    db_dux: Session = Depends(get_db),
+    db_anexa: Session = Depends(get_db_anexa)
+):
+    """Aplica varios cambios de estado (retiro, venta total o parcial, envio, archivo) en una sola transaccion.
+    Mismas reglas que PUT /{id}; los items invalidos se informan sin frenar al resto."""
+    sucursal_id = current_user.sucursal_id
+    if not sucursal_id:
+        raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
+    if len(data.items) > MAX_ITEMS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Maximo {MAX_ITEMS_LOTE} items por lote")
+
+    ids = [item.id for item in data.items]
+    registros = {
+        v.id: v for v in db_anexa.query(ProductoVencimiento).filter(
+            ProductoVencimiento.id.in_(ids),
+            ProductoVencimiento.sucursal_id == sucursal_id
+        ).with_for_update().all()
+    }
+
+    hoy = hoy_argentina()
+    errores = []  # error por item, en el orden recibido (None si se aplica)
+    cambios = []
+    vendidos = []
+    envios = []
+    vistos = set()
+    for item in data.items:
+        v = registros.get(item.id)
+        if item.id in vistos:
+            errores.append("Item repetido en el lote")
+            continue
+        vistos.add(item.id)
+        if not v:
+            errores.append("Registro no encontrado")
+            continue
+        if item.estado is not None and item.estado not in ESTADOS_VENCIMIENTO:
+            errores.append(f"Estado invalido: {item.estado}")
+            continue
+        errores.append(None)
+        valores, registro_vendido = calcular_cambios(v, item, hoy)
+        if valores:
+            cambios.append({"id": v.id, **valores})
+        if registro_vendido:
+            vendidos.append(registro_vendido)
+        elif requiere_espejo(item, sucursal_id):
+            envios.append((v, item.sucursal_destino_id))
+
+    aplicados = [c["id"] for c in cambios] + [v.id for v, _ in envios]
+    if cambios or vendidos or envios:
+        try:
+            # UPDATE por clave primaria en lote (executemany agrupado por columnas)
+            if cambios:
+                db_anexa.execute(update(ProductoVencimiento), cambios)
+            if vendidos:
+                db_anexa.execute(insert(ProductoVencimiento).values(vendidos))
+            if envios:
+                origen_nombre = get_sucursal_nombre(db_dux, sucursal_id)
+                for v, destino_id in envios:
+                    crear_vencimiento_en_destino(db_anexa, db_dux, v, destino_id, sucursal_id, origen_nombre)
+            db_anexa.commit()
+        except Exception as e:
+            db_anexa.rollback()
+            raise HTTPException(status_code=500, detail=f"Error al actualizar lote: {str(e)}")
+        invalidar_resumen(sucursal_id, *[destino_id for _, destino_id in envios])
+
+    actualizados = {
+        v.id: v for v in db_anexa.query(ProductoVencimiento).filter(
+            ProductoVencimiento.id.in_(aplicados)
+        ).populate_existing().all()
+    } if aplicados else {}
+
+    resultados = []
+    for item, error in zip(data.items, errores):
+        if error:
+            resultados.append(VencimientoLoteItemResult(id=item.id, ok=False, error=error))
+        else:
+            v = actualizados.get(item.id) or registros[item.id]
+            resultados.append(VencimientoLoteItemResult(
+                id=item.id, ok=True, vencimiento=build_vencimiento_response(v, hoy)
+            ))
+
+    cantidad_errores = sum(1 for r in resultados if not r.ok)
+    return VencimientoLoteResult(
+        success=cantidad_errores == 0,
+        actualizados=len(resultados) - cantidad_errores,
+        errores=cantidad_errores,
+        resultados=resultados,
+    )
+
+
+@router.get("/ventas-detectadas", response_model=List[VentaDetectada])
+async def listar_ventas_detectadas(
+    sucursal_id: Optional[int] = Query(None, description="ID de sucursal (solo para encargados)"),
+    current_user: Employee = Depends(get_current_user),
+    db_dux: Session = Depends(get_db),
+    db_anexa: Session = Depends(get_db_anexa)
+):
+    """Propuesta de unidades vendidas segun facturas, sin aplicarla (la aplica la tarea periodica)"""
+    target_sucursal = current_user.sucursal_id
+    if sucursal_id and es_encargado(current_user):
+        target_sucursal = sucursal_id
+    if not target_sucursal:
+        raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
+
+    lotes, vendidas, _ = detectar_ventas(db_anexa, db_dux, hoy_argentina(), target_sucursal)
+    return [
+        VentaDetectada(
+            vencimiento_id=v.id,
+            cod_item=v.cod_item,
+            producto=v.producto,
+            cantidad=v.cantidad,
+            fecha_vencimiento=v.fecha_vencimiento,
+            unidades_vendidas=vendidas[v.id],
+            venta_total=vendidas[v.id] >= v.cantidad,
+        )
+        for v in lotes if v.id in vendidas
+    ]
+
+
+@router.post("/ventas-detectadas/aplicar")
+def aplicar_ventas_detectadas_sucursal(
+    sucursal_id: Optional[int] = Query(None, description="ID de sucursal (solo para encargados)"),
+    current_user: Employee = Depends(get_current_user),
+):
+    """Aplica en el momento las ventas detectadas de la sucursal"""
+    target_sucursal = current_user.sucursal_id
+    if sucursal_id and es_encargado(current_user):
+        target_sucursal = sucursal_id
+    if not target_sucursal:
+        raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
+    try:
+        actualizados = aplicar_ventas_detectadas(target_sucursal)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al aplicar ventas: {str(e)}")
+    return {"success": True, "actualizados": actualizados}
 
 
 @router.get("/resumen", response_model=VencimientoResumen)
@@ -355,93 +749,141 @@ async def resumen_vencimientos(
     if not target_sucursal:
         raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
 
-    # Actualizar automaticamente productos vencidos
-    actualizar_vencidos(db_anexa, target_sucursal)
-
     hoy = hoy_argentina()
+    cacheado = _resumen_cache.get(target_sucursal)
+    if cacheado and cacheado[0] == hoy:
+        return cacheado[1].model_copy(deep=True)
+
     en_7_dias = hoy + timedelta(days=7)
     en_30_dias = hoy + timedelta(days=30)
 
-    # Conteo por estados (usando BD anexa)
-    result = db_anexa.execute(text("""
+    # Activos (proximo/vencido): agregados por ventana de fecha; el filtro por estado
+    # coincide con el del indice parcial ix_prod_venc_activos
+    activos = db_anexa.execute(text(f"""
         SELECT
-            COUNT(CASE WHEN estado != 'archivado' THEN 1 END) as total,
-            SUM(CASE WHEN estado = 'proximo' AND fecha_vencimiento <= :en_7_dias AND fecha_vencimiento >= :hoy THEN 1 ELSE 0 END) as por_vencer_semana,
-            SUM(CASE WHEN estado = 'proximo' AND fecha_vencimiento <= :en_30_dias AND fecha_vencimiento >= :hoy THEN 1 ELSE 0 END) as por_vencer_mes,
-            SUM(CASE WHEN estado = 'vencido' OR (estado = 'proximo' AND fecha_vencimiento < :hoy) THEN 1 ELSE 0 END) as vencidos,
-            SUM(CASE WHEN estado = 'retirado' THEN 1 ELSE 0 END) as retirados,
-            SUM(CASE WHEN estado = 'archivado' THEN 1 ELSE 0 END) as archivados
+            {ESTADO_EFECTIVO_SQL} as estado_efectivo,
+            COUNT(*) as cantidad,
+            COUNT(*) FILTER (WHERE fecha_vencimiento <= :en_7_dias) as en_semana,
+            COUNT(*) FILTER (WHERE fecha_vencimiento <= :en_30_dias) as en_mes,
+            COALESCE(SUM(valor_total), 0) as valor
         FROM productos_vencimientos
         WHERE sucursal_id = :sucursal_id
+          AND estado IN ('proximo', 'vencido')
+        GROUP BY estado_efectivo
     """), {
         "sucursal_id": target_sucursal,
         "hoy": hoy,
         "en_7_dias": en_7_dias,
         "en_30_dias": en_30_dias
-    }).fetchone()
-
-    # Conteo por estado
-    estados_result = db_anexa.execute(text("""
+    }).fetchall()
+    # Resto de los estados: solo el conteo
+    retirados = db_anexa.execute(text("""
         SELECT estado, COUNT(*) as cantidad
         FROM productos_vencimientos
         WHERE sucursal_id = :sucursal_id
+          AND estado NOT IN ('proximo', 'vencido')
         GROUP BY estado
     """), {"sucursal_id": target_sucursal}).fetchall()
 
-    por_estado = {r[0]: r[1] for r in estados_result}
-
-    # Valorización de productos vencidos y próximos
-    valor_result = db_anexa.execute(text("""
-        SELECT
-            COALESCE(SUM(CASE WHEN estado = 'vencido' OR (estado = 'proximo' AND fecha_vencimiento < :hoy) THEN valor_total ELSE 0 END), 0) as valor_vencidos,
-            COALESCE(SUM(CASE WHEN estado = 'proximo' AND fecha_vencimiento >= :hoy THEN valor_total ELSE 0 END), 0) as valor_proximos
-        FROM productos_vencimientos
-        WHERE sucursal_id = :sucursal_id AND valor_total IS NOT NULL
-    """), {"sucursal_id": target_sucursal, "hoy": hoy}).fetchone()
-
-    return VencimientoResumen(
-        total_registros=result[0] or 0,
-        por_vencer_semana=result[1] or 0,
-        por_vencer_mes=result[2] or 0,
-        vencidos=result[3] or 0,
-        retirados=result[4] or 0,
-        archivados=result[5] or 0,
+    por_estado = {r.estado_efectivo: r.cantidad for r in activos}
+    por_estado.update({r.estado: r.cantidad for r in retirados})
+    proximos = next((r for r in activos if r.estado_efectivo == "proximo"), None)
+    vencidos = next((r for r in activos if r.estado_efectivo == "vencido"), None)
+
+    resumen = VencimientoResumen(
+        total_registros=sum(c for estado, c in por_estado.items() if estado != "archivado"),
+        por_vencer_semana=proximos.en_semana if proximos else 0,
+        por_vencer_mes=proximos.en_mes if proximos else 0,
+        vencidos=vencidos.cantidad if vencidos else 0,
+        retirados=por_estado.get("retirado", 0),
+        archivados=por_estado.get("archivado", 0),
         por_estado=por_estado,
-        valor_total_vencidos=float(valor_result[0]) if valor_result[0] else 0,
-        valor_total_proximos=float(valor_result[1]) if valor_result[1] else 0
+        valor_total_vencidos=float(vencidos.valor) if vencidos else 0,
+        valor_total_proximos=float(proximos.valor) if proximos else 0
     )
+    _resumen_cache[target_sucursal] = (hoy, resumen)
+    return resumen.model_copy(deep=True)
+
+
+def parse_cursor(cursor: str, convertir):
+    """(valor, ultimo_id) de un cursor "valor|id" de /buscar-todos; 400 si esta mal formado"""
+    try:
+        valor, ultimo_id = cursor.split("|")
+        valor = convertir(valor)
+        if isinstance(valor, Decimal) and not valor.is_finite():
+            raise ValueError(valor)
+        return valor, int(ultimo_id)
+    except (ValueError, InvalidOperation):
+        raise HTTPException(status_code=400, detail="Cursor invalido")
 
 
 @router.get("/buscar-todos", response_model=List[VencimientoResponse])
 async def buscar_vencimientos_todos(
-    q: str = Query("", description="Buscar por nombre de producto"),
+    response: Response,
+    q: str = Query("", description="Buscar por nombre o codigo de producto"),
+    sucursal_id: Optional[int] = Query(None, description="Filtrar por sucursal"),
+    dias_max: Optional[int] = Query(None, ge=0, description="Solo los que vencen en N dias o menos"),
+    cursor: Optional[str] = Query(None, description="Cursor de la pagina siguiente (header X-Next-Cursor)"),
+    limit: int = Query(300, ge=1, le=300),  # 300 = tope anterior; el frontend aun no pagina
     current_user: Employee = Depends(get_current_user),
     db_dux: Session = Depends(get_db),
     db_anexa: Session = Depends(get_db_anexa)
 ):
     """Busca productos por vencer (estado='proximo') en TODAS las sucursales.
+    Con q, ordena por similitud (pg_trgm) sobre producto y cod_item; sin q, por fecha de vencimiento.
+    Paginacion por keyset: si hay mas resultados se retorna el header X-Next-Cursor.
     Solo disponible para usuarios del Contact Center (sucursal_id=15)."""
     CONTACT_CENTER_SUCURSAL_ID = 15
     if current_user.sucursal_id != CONTACT_CENTER_SUCURSAL_ID and not es_encargado(current_user):
         raise HTTPException(status_code=403, detail="Acceso solo para Contact Center")
 
-    # Actualizar vencidos globalmente
     hoy = hoy_argentina()
-    db_anexa.execute(
-        text("UPDATE productos_vencimientos SET estado = 'vencido' WHERE estado = 'proximo' AND fecha_vencimiento <= :hoy"),
-        {"hoy": hoy}
-    )
-    db_anexa.commit()
-
-    # Buscar productos proximos a vencer con ORM
-    query = db_anexa.query(ProductoVencimiento).filter(
-        ProductoVencimiento.estado == "proximo"
-    )
-    if q.strip():
-        query = query.filter(ProductoVencimiento.producto.ilike(f"%{q.strip()}%"))
-
-    query = query.order_by(ProductoVencimiento.fecha_vencimiento.asc()).limit(300)
-    vencimientos = query.all()
+    query = db_anexa.query(ProductoVencimiento).filter(filtro_estado("proximo", hoy))
+    if sucursal_id:
+        query = query.filter(ProductoVencimiento.sucursal_id == sucursal_id)
+    if dias_max is not None:
+        query = query.filter(ProductoVencimiento.fecha_vencimiento <= hoy + timedelta(days=dias_max))
+
+    texto = q.strip().lower()
+    tokens = tokens_busqueda(texto)
+    if tokens:
+        # Todas las palabras en el nombre, el codigo parecido, o similitud difusa (errores de tipeo)
+        relevancia = sql_func.round(cast(sql_func.greatest(
+            sql_func.word_similarity(texto, ProductoVencimiento.producto),
+            sql_func.coalesce(sql_func.similarity(ProductoVencimiento.cod_item, texto), 0),
+        ), Numeric), 6)
+        query = query.add_columns(relevancia).filter(or_(
+            and_(*[ProductoVencimiento.producto.ilike(f"%{escapar_like(t)}%") for t in tokens]),
+            ProductoVencimiento.cod_item.ilike(f"%{escapar_like(texto)}%"),
+            literal(texto).op("<%")(ProductoVencimiento.producto),
+        ))
+        if cursor:
+            valor, ultimo_id = parse_cursor(cursor, Decimal)
+            query = query.filter(or_(
+                relevancia < valor,
+                and_(relevancia == valor, ProductoVencimiento.id > ultimo_id),
+            ))
+        query = query.order_by(relevancia.desc(), ProductoVencimiento.id.asc())
+    else:
+        if cursor:
+            valor, ultimo_id = parse_cursor(cursor, date.fromisoformat)
+            query = query.filter(
+                tuple_(ProductoVencimiento.fecha_vencimiento, ProductoVencimiento.id)
+                > tuple_(literal(valor), literal(ultimo_id))
+            )
+        query = query.order_by(ProductoVencimiento.fecha_vencimiento.asc(), ProductoVencimiento.id.asc())
+
+    rows = query.limit(limit + 1).all()
+    hay_mas = len(rows) > limit
+    rows = rows[:limit]
+    if tokens:
+        vencimientos = [r[0] for r in rows]
+        if hay_mas:
+            response.headers["X-Next-Cursor"] = f"{rows[-1][1]}|{rows[-1][0].id}"
+    else:
+        vencimientos = rows
+        if hay_mas:
+            response.headers["X-Next-Cursor"] = f"{rows[-1].fecha_vencimiento.isoformat()}|{rows[-1].id}"
 
     # Obtener nombres de sucursales desde db_dux
     from ..models.employee import SucursalInfo
@@ -453,8 +895,7 @@ async def buscar_vencimientos_todos(
 
     response_list = []
     for v in vencimientos:
-        resp = VencimientoResponse.model_validate(v)
-        resp.dias_para_vencer = calculate_dias_para_vencer(v.fecha_vencimiento)
+        resp = build_vencimiento_response(v, hoy)
         resp.sucursal_nombre = sucursal_map.get(v.sucursal_id, f"Sucursal {v.sucursal_id}")
         response_list.append(resp)
 
@@ -504,6 +945,10 @@ async def importar_csv(
         delimiter = ';' if ';' in text_content[:500] else ','
         csv_reader = csv.DictReader(io.StringIO(text_content), delimiter=delimiter)
 
+        hoy = hoy_argentina()
+        mes_importacion = mes or datetime.now().strftime("%Y-%m")
+        filas = []
+
         row_num = 0
         for row in csv_reader:
             row_num += 1
@@ -530,28 +975,37 @@ async def importar_csv(
                 except:
                     cantidad = 1
 
-                # Determinar estado
-                estado = "vencido" if fecha_vencimiento < hoy_argentina() else "proximo"
-
-                # Crear registro en BD anexa
-                vencimiento = ProductoVencimiento(
-                    sucursal_id=current_user.sucursal_id,
-                    employee_id=current_user.id,
-                    cod_item=cod_item or None,
-                    producto=producto,
-                    cantidad=cantidad,
-                    fecha_vencimiento=fecha_vencimiento,
-                    estado=estado,
-                    importado=True,
-                    mes_importacion=mes or datetime.now().strftime("%Y-%m")
-                )
-                db_anexa.add(vencimiento)
-                importados += 1
+                filas.append({
+                    "sucursal_id": current_user.sucursal_id,
+                    "employee_id": current_user.id,
+                    "cod_item": cod_item or None,
+                    "producto": producto,
+                    "cantidad": cantidad,
+                    "fecha_vencimiento": fecha_vencimiento,
+                    # Determinar estado
+                    "estado": "vencido" if fecha_vencimiento < hoy else "proximo",
+                    "tiene_accion_comercial": False,
+                    "importado": True,
+                    "mes_importacion": mes_importacion,
+                })
 
             except Exception as e:
                 errors.append(f"Fila {row_num}: Error - {str(e)}")
 
+        # Valorizar con el costo de items_central: una sola consulta para todos los codigos
+        costos = get_costos_items(db_dux, {f["cod_item"] for f in filas if f["cod_item"]})
+        for f in filas:
+            precio_unitario = costos.get(f["cod_item"])
+            f["precio_unitario"] = precio_unitario
+            f["valor_total"] = round(precio_unitario * f["cantidad"], 2) if precio_unitario else None
+
+        # Insert multi-fila (un statement por lote, por el limite de parametros de PostgreSQL)
+        for i in range(0, len(filas), LOTE_INSERT_IMPORTACION):
+            db_anexa.execute(insert(ProductoVencimiento).values(filas[i:i + LOTE_INSERT_IMPORTACION]))
+        importados = len(filas)
+
         db_anexa.commit()
+        invalidar_resumen(current_user.sucursal_id)
 
     except HTTPException:
         raise
@@ -588,6 +1042,7 @@ async def eliminar_vencimiento(
 
     db_anexa.delete(vencimiento)
     db_anexa.commit()
+    invalidar_resumen(current_user.sucursal_id)
 
     return {"success": True, "message": "Registro eliminado"}
 
@@ -616,5 +1071,6 @@ async def limpiar_vencimientos(
 
     deleted = query.delete()
     db_anexa.commit()
+    invalidar_resumen(current_user.sucursal_id)
 
     return {"success": True, "deleted_rows": deleted}
@@ -0,0 +1,243 @@
+"""
+Sugerencias de rotacion de productos por vencer entre sucursales.
+
+Cruza todos los lotes 'proximo' de productos_vencimientos con la velocidad de venta
+de cada cod_item por sucursal (line items de facturas) y el stock actual (items_central),
+y calcula en lote (NumPy) que sucursal podria vender cada lote antes de su vencimiento.
+El calculo corre periodicamente y queda en memoria; los endpoints solo leen el resultado.
+"""
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import List, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionDux, SessionAnexa
+from ..core.scheduler import periodica, ejecutar_ahora, estado_tareas
+from ..core.security import get_current_user, es_encargado
+from ..models.employee import Employee, SucursalInfo
+from ..models.vencimientos import ProductoVencimiento
+from ..schemas.vencimientos import SugerenciaRotacion, SugerenciasRotacionResponse
+from .dashboard import SUCURSAL_PTO_VTA, EXCLUDED_PERSONAL
+from .items import clave_sucursal, stock_por_sucursal
+from .vencimientos import hoy_argentina, filtro_estado, pto_vta_sucursales
+
+router = APIRouter(prefix="/api/vencimientos/rotacion", tags=["vencimientos"])
+
+# Dias de facturacion usados para estimar la velocidad de venta (unidades/dia)
+VENTANA_VELOCIDAD_DIAS = 60
+# Alternativas de destino que se informan por lote (ademas de la mejor)
+MAX_ALTERNATIVAS = 3
+
+# Ultimo calculo: {"calculado_en": datetime, "por_sucursal": {sucursal_id: [SugerenciaRotacion]}}
+_sugerencias = {"calculado_en": None, "por_sucursal": {}}
+
+
+# ===== Datos de DUX =====
+
+def ventas_items_por_sucursal(db_dux: Session, cod_items: Optional[List[str]], desde: date) -> dict:
+    """Unidades vendidas por (sucursal_id, cod_item) desde `desde`, en una sola consulta sobre facturas.
+    cod_items=None trae todos los productos."""
+    if cod_items is not None and not cod_items:
+        return {}
+    ptos, sucs = pto_vta_sucursales()
+
+    rows = db_dux.execute(text("""
+        SELECT pv.sucursal_id, d->>'cod_item' AS cod_item,
+               SUM((d->>'ctd')::numeric * CASE WHEN f.tipo_comp = 'NOTA_CREDITO' THEN -1 ELSE 1 END) AS unidades
+        FROM facturas f
+        JOIN unnest(CAST(:ptos AS text[]), CAST(:sucs AS int[])) AS pv(nro_pto_vta, sucursal_id)
+          ON pv.nro_pto_vta = f.nro_pto_vta
+        CROSS JOIN LATERAL jsonb_array_elements(f.detalles::jsonb) d
+        WHERE f.fecha_comp::date >= :desde
+          AND f.tipo_comp IN ('COMPROBANTE_VENTA', 'FACTURA', 'NOTA_CREDITO')
+          AND (f.id_personal IS NULL OR f.id_personal <> ALL(:excluidos))
+          AND (f.anulada IS NULL OR f.anulada != 'S')
+          AND (f.anulada_boolean IS NULL OR f.anulada_boolean = false)
+          AND (CAST(:cod_items AS text[]) IS NULL OR d->>'cod_item' = ANY(:cod_items))
+        GROUP BY pv.sucursal_id, d->>'cod_item'
+    """), {
+        "ptos": ptos, "sucs": sucs, "desde": desde,
+        "excluidos": EXCLUDED_PERSONAL, "cod_items": list(cod_items) if cod_items is not None else None,
+    }).fetchall()
+    return {(r.sucursal_id, r.cod_item): float(r.unidades or 0) for r in rows}
+
+
+def stock_items_por_sucursal(db_dux: Session, cod_items: List[str], sucursales: dict) -> dict:
+    """Stock disponible por (sucursal_id, cod_item) desde el JSON de depositos de items_central"""
+    if not cod_items:
+        return {}
+    claves = {sucursal_id: clave_sucursal(nombre) for sucursal_id, nombre in sucursales.items()}
+    rows = db_dux.execute(
+        text("SELECT cod_item, stock FROM items_central WHERE cod_item = ANY(:cod_items)"),
+        {"cod_items": list(cod_items)}
+    ).fetchall()
+
+    stock = {}
+    for cod_item, depositos in rows:
+        for sucursal_id, cantidad in stock_por_sucursal(depositos, claves).items():
+            stock[(sucursal_id, cod_item)] = cantidad
+    return stock
+
+
+# ===== Motor =====
+
+def calcular_sugerencias_rotacion(db_anexa: Session, db_dux: Session, hoy: date) -> dict:
+    """
+    Sugerencias de traslado por sucursal de origen, ordenadas por valor recuperable.
+
+    Para cada lote: el excedente es lo que el origen no alcanza a vender antes del vencimiento
+    (stock - velocidad * dias) y la capacidad de cada destino es lo que venderia en ese plazo
+    por encima de su propio stock. Se sugiere el destino que absorbe mas unidades.
+    La capacidad de un destino no se descuenta entre lotes distintos del mismo producto.
+    """
+    lotes = db_anexa.query(
+        ProductoVencimiento.id, ProductoVencimiento.sucursal_id, ProductoVencimiento.cod_item,
+        ProductoVencimiento.producto, ProductoVencimiento.cantidad,
+        ProductoVencimiento.fecha_vencimiento, ProductoVencimiento.precio_unitario,
+    ).filter(
+        filtro_estado("proximo", hoy),
+        ProductoVencimiento.cod_item.isnot(None),
+        ProductoVencimiento.sucursal_id.in_(list(SUCURSAL_PTO_VTA)),
+    ).all()
+    if not lotes:
+        return {}
+
+    sucursal_ids = sorted(SUCURSAL_PTO_VTA)
+    col = {sid: j for j, sid in enumerate(sucursal_ids)}
+    nombres = {
+        s.id: s.nombre for s in db_dux.query(SucursalInfo).filter(SucursalInfo.id.in_(sucursal_ids)).all()
+    }
+    cod_items = sorted({l.cod_item for l in lotes})
+    fila = {cod: i for i, cod in enumerate(cod_items)}
+
+    # Matrices producto x sucursal: velocidad (u/dia) y stock actual
+    ventas = ventas_items_por_sucursal(db_dux, cod_items, hoy - timedelta(days=VENTANA_VELOCIDAD_DIAS))
+    stock = stock_items_por_sucursal(db_dux, cod_items, nombres)
+    velocidad = np.zeros((len(cod_items), len(sucursal_ids)))
+    existencias = np.zeros((len(cod_items), len(sucursal_ids)))
+    for (sid, cod), unidades in ventas.items():
+        velocidad[fila[cod], col[sid]] = max(unidades, 0) / VENTANA_VELOCIDAD_DIAS
+    for (sid, cod), unidades in stock.items():
+        if cod in fila:
+            existencias[fila[cod], col[sid]] = max(unidades, 0)
+
+    # Vectores por lote
+    n = len(lotes)
+    idx = np.arange(n)
+    item = np.array([fila[l.cod_item] for l in lotes])
+    origen = np.array([col[l.sucursal_id] for l in lotes])
+    cantidad = np.array([l.cantidad for l in lotes], dtype=float)
+    dias = np.array([max((l.fecha_vencimiento - hoy).days, 1) for l in lotes], dtype=float)
+
+    vel = velocidad[item]          # lotes x sucursales
+    stk = existencias[item]
+    vendible = vel * dias[:, None]
+
+    # El lote es parte del stock del origen (aunque DUX aun no lo refleje)
+    stock_origen = np.maximum(stk[idx, origen], cantidad)
+    excedente = np.clip(stock_origen - vendible[idx, origen], 0, cantidad)
+
+    capacidad = np.clip(vendible - stk, 0, None)
+    capacidad[idx, origen] = 0
+    unidades = np.floor(np.minimum(capacidad, excedente[:, None]))
+
+    ranking = np.argsort(-unidades, axis=1, kind="stable")[:, :MAX_ALTERNATIVAS + 1]
+    mejores = unidades[idx, ranking[:, 0]]
+
+    por_sucursal = defaultdict(list)
+    for i in np.nonzero(mejores >= 1)[0]:
+        lote = lotes[i]
+        destino = ranking[i, 0]
+        destino_id = sucursal_ids[destino]
+        sugeridas = int(mejores[i])
+        precio = float(lote.precio_unitario) if lote.precio_unitario else None
+        alternativas = [
+            {
+                "sucursal_id": sucursal_ids[j],
+                "sucursal_nombre": nombres.get(sucursal_ids[j]),
+                "unidades": int(unidades[i, j]),
+            }
+            for j in ranking[i, 1:] if unidades[i, j] >= 1
+        ]
+        por_sucursal[lote.sucursal_id].append(SugerenciaRotacion(
+            vencimiento_id=lote.id,
+            cod_item=lote.cod_item,
+            producto=lote.producto,
+            cantidad=lote.cantidad,
+            fecha_vencimiento=lote.fecha_vencimiento,
+            dias_para_vencer=(lote.fecha_vencimiento - hoy).days,
+            unidades_sugeridas=sugeridas,
+            sucursal_origen_id=lote.sucursal_id,
+            sucursal_destino_id=destino_id,
+            sucursal_destino_nombre=nombres.get(destino_id),
+            velocidad_origen=round(float(vel[i, origen[i]]), 3),
+            velocidad_destino=round(float(vel[i, destino]), 3),
+            stock_destino=round(float(stk[i, destino]), 2),
+            valor_estimado=round(precio * sugeridas, 2) if precio else None,
+            alternativas=alternativas,
+        ))
+
+    for sugerencias in por_sucursal.values():
+        sugerencias.sort(key=lambda s: (-(s.valor_estimado or 0), -s.unidades_sugeridas, s.fecha_vencimiento))
+    return dict(por_sucursal)
+
+
+@periodica("vencimientos_sugerencias_rotacion", cada_segundos=6 * 3600, demora_inicial=300)
+def recalcular_sugerencias_rotacion() -> int:
+    """Recalcula las sugerencias de todas las sucursales (fuera de los requests)"""
+    db_anexa = SessionAnexa()
+    db_dux = SessionDux()
+    try:
+        por_sucursal = calcular_sugerencias_rotacion(db_anexa, db_dux, hoy_argentina())
+    finally:
+        db_anexa.close()
+        db_dux.close()
+    _sugerencias.update(calculado_en=datetime.now(), por_sucursal=por_sucursal)
+    return sum(len(s) for s in por_sucursal.values())
+
+
+# ===== Endpoints =====
+
+@router.get("/sugerencias", response_model=SugerenciasRotacionResponse)
+async def listar_sugerencias_rotacion(
+    sucursal_id: Optional[int] = Query(None, description="Sucursal de origen (solo encargados; sin valor y encargado = todas)"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Employee = Depends(get_current_user),
+):
+    """Traslados sugeridos para los productos por vencer, ordenados por valor recuperable"""
+    por_sucursal = _sugerencias["por_sucursal"]
+    if es_encargado(current_user):
+        if sucursal_id:
+            sugerencias = por_sucursal.get(sucursal_id, [])
+        else:
+            sugerencias = sorted(
+                (s for lista in por_sucursal.values() for s in lista),
+                key=lambda s: (-(s.valor_estimado or 0), -s.unidades_sugeridas, s.fecha_vencimiento)
+            )
+    else:
+        if not current_user.sucursal_id:
+            raise HTTPException(status_code=400, detail="Usuario sin sucursal asignada")
+        sugerencias = por_sucursal.get(current_user.sucursal_id, [])
+
+    return SugerenciasRotacionResponse(
+        calculado_en=_sugerencias["calculado_en"],
+        sugerencias=sugerencias[:limit],
+    )
+
+
+@router.post("/recalcular")
+def forzar_recalculo_rotacion(
+    current_user: Employee = Depends(get_current_user),
+):
+    """Recalcula las sugerencias en el momento (solo encargados)"""
+    if not es_encargado(current_user):
+        raise HTTPException(status_code=403, detail="Solo encargados pueden recalcular")
+    total = ejecutar_ahora("vencimientos_sugerencias_rotacion")
+    estado = estado_tareas("vencimientos_sugerencias_rotacion")
+    if estado.get("error"):
+        raise HTTPException(status_code=500, detail=f"Error al calcular sugerencias: {estado['error']}")
+    return {"success": True, "sugerencias": total, "calculado_en": _sugerencias["calculado_en"]}
@@ -22,4 +22,15 @@ class StockNegativoItem(BaseModel):
     cod_item: str
     item_nombre: str
     marca: Optional[str] = None
-    stock_actual: int
+    stock_actual: float
+    costo: Optional[float] = None
+    valorizacion: Optional[float] = None  # stock_actual * costo (negativo)
+
+
+class StockNegativoSucursal(BaseModel):
+    sucursal_id: int
+    sucursal_nombre: Optional[str] = None
+    deposito_id: int
+    productos: int
+    unidades: float
+    valorizacion: float
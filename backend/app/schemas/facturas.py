@@ -20,7 +20,7 @@ class FacturaCreate(BaseModel):
     proveedor_custom_id: Optional[int] = None  # id de proveedores_custom
     proveedor_nombre: str
     numero_factura: Optional[str] = None
-    imagen_base64: Optional[str] = None
+    imagen_base64: Optional[str] = None  # Solo clientes anteriores: la imagen va a PUT /{id}/imagen
     tiene_inconsistencia: bool = False
     detalle_inconsistencia: Optional[str] = None
     observaciones: Optional[str] = None
@@ -41,7 +41,7 @@ class FacturaResponse(BaseModel):
     fecha_factura: Optional[date] = None
     fecha_registro: datetime
     employee_nombre: Optional[str] = None
-    # imagen_base64 se excluye del listado por peso
+    tiene_imagen: bool = False  # La imagen se descarga de GET /api/facturas/{id}/imagen
 
     class Config:
         from_attributes = True
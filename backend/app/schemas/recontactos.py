@@ -64,6 +64,10 @@ class ClienteRecontactoResponse(BaseModel):
         from_attributes = True
 
 
+class ClienteRecontactoBusqueda(ClienteRecontactoResponse):
+    relevancia: float = 0
+
+
 class RegistroContactoCreate(BaseModel):
     cliente_recontacto_id: int
     medio: str  # telefono, whatsapp, email, presencial
@@ -48,6 +48,14 @@ class VencimientoUpdate(BaseModel):
     fecha_movimiento: Optional[date] = None
 
 
+class VencimientoLoteItem(VencimientoUpdate):
+    id: int
+
+
+class VencimientoLoteRequest(BaseModel):
+    items: List[VencimientoLoteItem]
+
+
 class VencimientoResponse(BaseModel):
     id: int
     sucursal_id: int
@@ -83,6 +91,20 @@ class VencimientoResponse(BaseModel):
         from_attributes = True
 
 
+class VencimientoLoteItemResult(BaseModel):
+    id: int
+    ok: bool
+    error: Optional[str] = None
+    vencimiento: Optional[VencimientoResponse] = None
+
+
+class VencimientoLoteResult(BaseModel):
+    success: bool
+    actualizados: int
+    errores: int
+    resultados: List[VencimientoLoteItemResult]
+
+
 class VencimientoResumen(BaseModel):
     total_registros: int
     por_vencer_semana: int
@@ -96,6 +118,46 @@ class VencimientoResumen(BaseModel):
     valor_total_proximos: Optional[float] = None
 
 
+class VentaDetectada(BaseModel):
+    vencimiento_id: int
+    cod_item: str
+    producto: str
+    cantidad: int
+    fecha_vencimiento: date
+    unidades_vendidas: int
+    venta_total: bool
+
+
+class AlternativaRotacion(BaseModel):
+    sucursal_id: int
+    sucursal_nombre: Optional[str] = None
+    unidades: int
+
+
+class SugerenciaRotacion(BaseModel):
+    vencimiento_id: int
+    cod_item: str
+    producto: str
+    cantidad: int
+    fecha_vencimiento: date
+    dias_para_vencer: int
+    unidades_sugeridas: int
+    sucursal_origen_id: int
+    sucursal_destino_id: int
+    sucursal_destino_nombre: Optional[str] = None
+    # Velocidad de venta en unidades/dia
+    velocidad_origen: float
+    velocidad_destino: float
+    stock_destino: float
+    valor_estimado: Optional[float] = None
+    alternativas: List[AlternativaRotacion] = []
+
+
+class SugerenciasRotacionResponse(BaseModel):
+    calculado_en: Optional[datetime] = None
+    sugerencias: List[SugerenciaRotacion]
+
+
 class ImportVencimientosResult(BaseModel):
     success: bool
     registros_importados: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -11,6 +11,26 @@ class ItemSearch(BaseModel):
     costo: Optional[float] = None  # Precio/costo unitario
 
 
+class ItemBatchRequest(BaseModel):
+    cod_items: List[str]
+    deposito_id: Optional[int] = None  # Solo este deposito (por defecto el de la sucursal)
+    todos_depositos: bool = False
+
+
+class ItemBatch(BaseModel):
+    cod_item: str
+    item: Optional[str] = None
+    marca_nombre: Optional[str] = None
+    costo: Optional[float] = None
+    habilitado: bool = False
+    stock: list = []  # [{deposito_id, nombre, stock_real, stock_disponible}]
+
+
+class ItemBatchResponse(BaseModel):
+    items: List[ItemBatch]
+    no_encontrados: List[str] = []
+
+
 class VentaPerdidaCreate(BaseModel):
     cod_item: Optional[str] = None
     item_nombre: str
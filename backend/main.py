@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.core.database import engine, Base, init_anexa_db
+from app.core.scheduler import iniciar_tareas_periodicas, detener_tareas_periodicas
 from app.routes import (
     auth_router,
     dashboard_router,
@@ -14,6 +15,7 @@ from app.routes import (
     ajustes_stock_router,
     pedidosya_router,
     vencimientos_router,
+    vencimientos_rotacion_router,
     recontactos_router,
     # Rutas para BD Anexa (mi_sucursal)
     sugerencias_router,
@@ -21,10 +23,12 @@ from app.routes import (
     auditoria_mensual_router,
     facturas_router,
     conteo_stock_router,
+    conteo_seleccion_router,
     tareas_resumen_router,
     encargos_router,
     clientes_router,
     astra_router,
+    archivos_router,
 )
 
 
@@ -33,11 +37,13 @@ async def lifespan(app: FastAPI):
     # Startup: crear tablas si no existen
 
     # 1. Tablas en BD DUX (modelos propios que se guardan junto a datos de DUX)
-    from app.models import VentaPerdida, EvaluacionAuditoria, TareaSucursal
+    from app.models import VentaPerdida, EvaluacionAuditoria, TareaSucursal, StockDeposito, StockDepositoFirma
     Base.metadata.create_all(bind=engine, tables=[
         VentaPerdida.__table__,
         EvaluacionAuditoria.__table__,
         TareaSucursal.__table__,
+        StockDeposito.__table__,
+        StockDepositoFirma.__table__,
     ])
 
     # 2. Tablas en BD Anexa (mi_sucursal) - nuevas funcionalidades
@@ -48,14 +54,20 @@ async def lifespan(app: FastAPI):
         from app.models.encargos import Encargo  # noqa: F401
         from app.models.clientes import Cliente  # noqa: F401
         init_anexa_db()
+        from app.routes.recontactos import inicializar_contadores
+        inicializar_contadores()
         print("BD Anexa (mi_sucursal) inicializada correctamente")
     except Exception as e:
         print(f"Advertencia: No se pudo inicializar BD Anexa: {e}")
         print("Las funciones de sugerencias y descargos no estarán disponibles")
 
+    # 3. Tareas periodicas (transiciones de estado, recalculos nocturnos, etc.)
+    iniciar_tareas_periodicas()
+
     print("Mi Sucursal API iniciada")
     yield
     # Shutdown
+    await detener_tareas_periodicas()
     print("Mi Sucursal API detenida")
 
 
@@ -73,6 +85,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Routers - BD DUX
@@ -86,6 +99,7 @@ app.include_router(tareas_router)
 app.include_router(ajustes_stock_router)
 app.include_router(pedidosya_router)
 app.include_router(vencimientos_router)
+app.include_router(vencimientos_rotacion_router)
 app.include_router(recontactos_router)
 
 # Routers - BD Anexa (mi_sucursal)
@@ -94,10 +108,12 @@ app.include_router(descargos_router)
 app.include_router(auditoria_mensual_router)
 app.include_router(facturas_router)
 app.include_router(conteo_stock_router)
+app.include_router(conteo_seleccion_router)
 app.include_router(tareas_resumen_router)
 app.include_router(encargos_router)
 app.include_router(clientes_router)
 app.include_router(astra_router)
+app.include_router(archivos_router)
 
 
 @app.get("/health")
@@ -275,7 +275,7 @@ export default function AuditoriaPage() {
       await controlStockApi.cerrarConteo(token!, conteoId)
       // Recargar conteos y resumen
       try {
-        const conteosList = await controlStockApi.listarConteos(token!)
+        const conteosList = await controlStockApi.listarConteos(token!, { resumen: true })
         setConteosAuditoria(conteosList || [])
         const resumen = await controlStockApi.resumenAuditoria(token!)
         if (datos) {
@@ -461,7 +461,7 @@ export default function AuditoriaPage() {
 
       // Cargar lista de conteos para auditoria (aprobados + cerrados + enviados)
       try {
-        const conteosList = await controlStockApi.listarConteos(token!)
+        const conteosList = await controlStockApi.listarConteos(token!, { resumen: true })
         setConteosAuditoria(conteosList || [])
       } catch (e) {
         console.log('Lista conteos no disponible:', e)
@@ -139,12 +139,8 @@ export default function CrearTareaControlStockPage() {
         titulo: titulo.trim(),
         descripcion: descripcion.trim() || undefined,
         fecha_vencimiento: fechaVencimiento,
-        productos: productosSeleccionados.map(p => ({
-          cod_item: p.cod_item,
-          nombre: p.nombre,
-          precio: p.precio,
-          stock_sistema: p.stock_sistema,
-        })),
+        // Nombre, precio y stock del deposito los toma el servidor al crear la tarea
+        cod_items: productosSeleccionados.map(p => p.cod_item),
       })
       setSuccess('Tarea de control de stock creada correctamente')
       setTimeout(() => router.push('/tareas'), 1500)
@@ -22,6 +22,16 @@ import Sidebar from '@/components/Sidebar'
 import { useAuthStore } from '@/stores/auth-store'
 import { facturasApi, tareasApi } from '@/lib/api'
 
+// Mismo criterio que el backend (tipo_imagen_factura en routes/facturas.py): cualquier imagen
+// salvo SVG, o PDF. Algunos navegadores no informan el tipo de los .heic/.heif
+const ACCEPT_IMAGEN_FACTURA = 'image/*,application/pdf,.heic,.heif'
+
+const esImagenFacturaValida = (file: File) => {
+  const tipo = file.type.toLowerCase()
+  if (!tipo) return /\.(heic|heif)$/i.test(file.name)
+  return tipo === 'application/pdf' || (tipo.startsWith('image/') && tipo !== 'image/svg+xml')
+}
+
 export default function FacturasPageWrapper() {
   return (
     <Suspense fallback={
@@ -65,8 +75,11 @@ function FacturasPage() {
   const [selectedProveedor, setSelectedProveedor] = useState<any>(null)
   const [showDropdown, setShowDropdown] = useState(false)
   const [numeroFactura, setNumeroFactura] = useState('')
-  const [imagenBase64, setImagenBase64] = useState<string | null>(null)
+  const [imagenArchivo, setImagenArchivo] = useState<File | null>(null)
+  const [imagenPreview, setImagenPreview] = useState<string | null>(null)
   const [imagenNombre, setImagenNombre] = useState('')
+  // Factura ya registrada cuya imagen no se pudo subir: solo se reintenta la imagen
+  const [facturaSinImagen, setFacturaSinImagen] = useState<number | null>(null)
   const [tieneInconsistencia, setTieneInconsistencia] = useState(false)
   const [detalleInconsistencia, setDetalleInconsistencia] = useState('')
   const [observaciones, setObservaciones] = useState('')
@@ -85,13 +98,37 @@ function FacturasPage() {
   // Modal detalle factura
   const [facturaDetalle, setFacturaDetalle] = useState<any>(null)
   const [loadingDetalle, setLoadingDetalle] = useState(false)
+  const [imagenDetalleUrl, setImagenDetalleUrl] = useState<string | null>(null)
+  const [imagenDetalleTipo, setImagenDetalleTipo] = useState('')
+
+  const cerrarDetalle = () => {
+    if (imagenDetalleUrl) URL.revokeObjectURL(imagenDetalleUrl)
+    setImagenDetalleUrl(null)
+    setImagenDetalleTipo('')
+    setFacturaDetalle(null)
+  }
 
   const handleVerFactura = async (id: number) => {
     setLoadingDetalle(true)
-    setFacturaDetalle(null)
+    cerrarDetalle()
     try {
       const data = await facturasApi.getOne(token!, id)
       setFacturaDetalle(data)
+      if (data.tiene_imagen) {
+        // La imagen viene en binario (con token), no dentro del JSON
+        try {
+          const res = await fetch(facturasApi.getImagenUrl(id), {
+            headers: { 'Authorization': `Bearer ${token}` },
+          })
+          if (!res.ok) throw new Error('Error al cargar la imagen')
+          const blob = await res.blob()
+          setImagenDetalleTipo(blob.type)
+          setImagenDetalleUrl(URL.createObjectURL(blob))
+        } catch (err) {
+          console.error('Error cargando imagen:', err)
+          setFacturaDetalle({ ...data, tiene_imagen: false })
+        }
+      }
     } catch (err) {
       console.error('Error cargando detalle:', err)
     } finally {
@@ -245,20 +282,63 @@ function FacturasPage() {
     const file = e.target.files?.[0]
     if (!file) return
 
+    if (!esImagenFacturaValida(file)) {
+      setError('Solo se permiten imagenes o PDF')
+      e.target.value = ''
+      return
+    }
     if (file.size > 5 * 1024 * 1024) {
       setError('La imagen no puede superar 5MB')
+      e.target.value = ''
       return
     }
 
     setImagenNombre(file.name)
-    const reader = new FileReader()
-    reader.onload = () => {
-      setImagenBase64(reader.result as string)
+    setImagenArchivo(file)
+    if (imagenPreview) URL.revokeObjectURL(imagenPreview)
+    setImagenPreview(URL.createObjectURL(file))
+  }
+
+  const quitarImagen = () => {
+    if (imagenPreview) URL.revokeObjectURL(imagenPreview)
+    setImagenArchivo(null)
+    setImagenPreview(null)
+    setImagenNombre('')
+    if (fileInputRef.current) fileInputRef.current.value = ''
+  }
+
+  const subirImagenFactura = async (facturaId: number, archivo: File) => {
+    try {
+      await facturasApi.subirImagen(token!, facturaId, archivo)
+      setFacturaSinImagen(null)
+      quitarImagen()
+      return true
+    } catch (err: any) {
+      setFacturaSinImagen(facturaId)
+      setError(`La factura se registro, pero no se pudo subir la imagen: ${err.message || 'error desconocido'}. Reintenta la subida o continua sin imagen.`)
+      return false
+    }
+  }
+
+  const handleReintentarImagen = async () => {
+    if (!facturaSinImagen || !imagenArchivo) return
+    setSubmitting(true)
+    setError('')
+    if (await subirImagenFactura(facturaSinImagen, imagenArchivo)) {
+      setSuccess('Imagen adjuntada a la factura')
+      loadFacturas()
     }
-    reader.readAsDataURL(file)
+    setSubmitting(false)
+  }
+
+  const continuarSinImagen = () => {
+    setFacturaSinImagen(null)
+    quitarImagen()
+    setError('')
   }
 
   const handleRegistrar = async () => {
+    if (facturaSinImagen) return
     if (!selectedProveedor) {
       setError('Selecciona un proveedor')
       return
@@ -275,20 +355,22 @@ function FacturasPage() {
         proveedor_custom_id: selectedProveedor.origen === 'custom' ? selectedProveedor.id : null,
         proveedor_nombre: selectedProveedor.nombre,
         numero_factura: numeroFactura || null,
-        imagen_base64: imagenBase64,
         tiene_inconsistencia: tieneInconsistencia,
         detalle_inconsistencia: tieneInconsistencia ? detalleInconsistencia : null,
         observaciones: observaciones || null,
         fecha_factura: fechaFactura || null,
       }
 
-      await facturasApi.create(token!, payload)
+      const factura = await facturasApi.create(token!, payload)
+      // La factura ya existe: se limpia el formulario (menos la imagen) para que no pueda
+      // registrarse dos veces si falla la subida de la imagen
+      resetForm(true)
       loadFacturas()
+      if (imagenArchivo && !(await subirImagenFactura(factura.id, imagenArchivo))) return
 
       setSuccess(tieneInconsistencia
         ? 'Factura registrada. Se creo un descargo en auditoria por la inconsistencia.'
         : 'Factura registrada correctamente')
-      resetForm()
     } catch (err: any) {
       setError(err.message || 'Error al registrar factura')
     } finally {
@@ -296,17 +378,15 @@ function FacturasPage() {
     }
   }
 
-  const resetForm = () => {
+  const resetForm = (conservarImagen = false) => {
     setSelectedProveedor(null)
     setProveedorQuery('')
     setNumeroFactura('')
-    setImagenBase64(null)
-    setImagenNombre('')
+    if (!conservarImagen) quitarImagen()
     setTieneInconsistencia(false)
     setDetalleInconsistencia('')
     setObservaciones('')
     setFechaFactura('')
-    if (fileInputRef.current) fileInputRef.current.value = ''
   }
 
   const loadNotasCredito = async () => {
@@ -595,21 +675,17 @@ function FacturasPage() {
                   <input
                     ref={fileInputRef}
                     type="file"
-                    accept="image/*"
+                    accept={ACCEPT_IMAGEN_FACTURA}
                     onChange={handleImageUpload}
                     className="hidden"
                   />
-                  {imagenBase64 && (
+                  {imagenPreview && (
                     <div className="flex items-center gap-2">
                       <div className="w-12 h-12 rounded-lg border border-gray-700 overflow-hidden">
-                        <img src={imagenBase64} alt="Preview" className="w-full h-full object-cover" />
+                        <img src={imagenPreview} alt="Preview" className="w-full h-full object-cover" />
                       </div>
                       <button
-                        onClick={() => {
-                          setImagenBase64(null)
-                          setImagenNombre('')
-                          if (fileInputRef.current) fileInputRef.current.value = ''
-                        }}
+                        onClick={quitarImagen}
                         className="text-gray-500 hover:text-red-400"
                       >
                         <X className="w-4 h-4" />
@@ -617,7 +693,7 @@ function FacturasPage() {
                     </div>
                   )}
                 </div>
-                <p className="text-xs text-gray-500 mt-1">Max 5MB. Formatos: JPG, PNG, PDF</p>
+                <p className="text-xs text-gray-500 mt-1">Max 5MB. Formatos: imagenes (JPG, PNG, HEIC, etc.) o PDF</p>
               </div>
 
               {/* Inconsistencia */}
@@ -655,14 +731,33 @@ function FacturasPage() {
                 />
               </div>
 
-              {/* Boton registrar */}
-              <button
-                onClick={handleRegistrar}
-                disabled={submitting || !selectedProveedor}
-                className="w-full px-6 py-3 rounded-lg bg-mascotera-turquesa text-black font-semibold hover:bg-mascotera-turquesa/90 disabled:opacity-50 transition-colors"
-              >
-                {submitting ? 'Guardando...' : 'Registrar Factura'}
-              </button>
+              {/* Boton registrar (o reintento de la imagen de una factura ya registrada) */}
+              {facturaSinImagen ? (
+                <div className="flex gap-3">
+                  <button
+                    onClick={handleReintentarImagen}
+                    disabled={submitting || !imagenArchivo}
+                    className="flex-1 px-6 py-3 rounded-lg bg-mascotera-turquesa text-black font-semibold hover:bg-mascotera-turquesa/90 disabled:opacity-50 transition-colors"
+                  >
+                    {submitting ? 'Subiendo...' : 'Reintentar subida de imagen'}
+                  </button>
+                  <button
+                    onClick={continuarSinImagen}
+                    disabled={submitting}
+                    className="px-6 py-3 rounded-lg bg-gray-800/50 border border-gray-700 text-gray-300 hover:bg-gray-700 disabled:opacity-50 transition-colors"
+                  >
+                    Continuar sin imagen
+                  </button>
+                </div>
+              ) : (
+                <button
+                  onClick={handleRegistrar}
+                  disabled={submitting || !selectedProveedor}
+                  className="w-full px-6 py-3 rounded-lg bg-mascotera-turquesa text-black font-semibold hover:bg-mascotera-turquesa/90 disabled:opacity-50 transition-colors"
+                >
+                  {submitting ? 'Guardando...' : 'Registrar Factura'}
+                </button>
+              )}
             </div>
           </div>
         )}
@@ -969,7 +1064,7 @@ function FacturasPage() {
 
       {/* Modal detalle factura */}
       {(loadingDetalle || facturaDetalle) && (
-        <div className="fixed inset-0 bg-black/70 z-50 flex items-center justify-center p-4" onClick={() => setFacturaDetalle(null)}>
+        <div className="fixed inset-0 bg-black/70 z-50 flex items-center justify-center p-4" onClick={cerrarDetalle}>
           <div className="glass rounded-2xl w-full max-w-lg border border-gray-700 max-h-[90vh] overflow-y-auto" onClick={(e) => e.stopPropagation()}>
             {loadingDetalle ? (
               <div className="p-12 flex items-center justify-center">
@@ -986,7 +1081,7 @@ function FacturasPage() {
                     }
                     <h3 className="text-lg font-semibold text-white">{facturaDetalle.proveedor_nombre}</h3>
                   </div>
-                  <button onClick={() => setFacturaDetalle(null)} className="text-gray-400 hover:text-white">
+                  <button onClick={cerrarDetalle} className="text-gray-400 hover:text-white">
                     <X className="w-5 h-5" />
                   </button>
                 </div>
@@ -1038,14 +1133,29 @@ function FacturasPage() {
                   )}
 
                   {/* Imagen */}
-                  {facturaDetalle.imagen_base64 ? (
+                  {facturaDetalle.tiene_imagen ? (
                     <div>
                       <p className="text-xs text-gray-500 mb-2">Imagen de la factura</p>
-                      <img
-                        src={facturaDetalle.imagen_base64}
-                        alt="Factura"
-                        className="w-full rounded-lg border border-gray-700 object-contain max-h-96"
-                      />
+                      {!imagenDetalleUrl ? (
+                        <div className="p-4 rounded-lg bg-gray-800/30 text-center text-gray-500 text-sm">
+                          Cargando imagen...
+                        </div>
+                      ) : imagenDetalleTipo === 'application/pdf' ? (
+                        <a
+                          href={imagenDetalleUrl}
+                          target="_blank"
+                          rel="noopener noreferrer"
+                          className="block p-4 rounded-lg bg-gray-800/30 text-center text-mascotera-turquesa text-sm"
+                        >
+                          Ver PDF de la factura
+                        </a>
+                      ) : (
+                        <img
+                          src={imagenDetalleUrl}
+                          alt="Factura"
+                          className="w-full rounded-lg border border-gray-700 object-contain max-h-96"
+                        />
+                      )}
                     </div>
                   ) : (
                     <div className="p-4 rounded-lg bg-gray-800/30 text-center text-gray-500 text-sm">
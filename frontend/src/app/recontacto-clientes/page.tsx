@@ -207,6 +207,7 @@ export default function RecontactoClientesPage() {
   })
   const [cerrandoMes, setCerrandoMes] = useState(false)
   const [cerrarMesResult, setCerrarMesResult] = useState<any>(null)
+  const [cierreMesProgreso, setCierreMesProgreso] = useState('')
 
   useEffect(() => {
     if (!isLoading && !isAuthenticated) {
@@ -357,7 +358,17 @@ export default function RecontactoClientesPage() {
     setError('')
     setCerrarMesResult(null)
     try {
-      const result = await recontactosApi.cerrarMes(token!, cerrarMesMes)
+      const { job_id } = await recontactosApi.cerrarMes(token!, cerrarMesMes)
+      let job = await recontactosApi.estadoCierreMes(token!, job_id)
+      while (job.estado === 'pendiente' || job.estado === 'en_proceso') {
+        setCierreMesProgreso(job.mensaje ? `${job.progreso}% - ${job.mensaje}` : `${job.progreso}%`)
+        await new Promise((resolve) => setTimeout(resolve, 1500))
+        job = await recontactosApi.estadoCierreMes(token!, job_id)
+      }
+      if (job.estado === 'error' || !job.resultado) {
+        throw new Error(job.error || 'Error al cerrar mes')
+      }
+      const result = job.resultado
       setCerrarMesResult(result)
       setSuccess(`Mes ${cerrarMesMes} cerrado: ${result.auditorias_guardadas} auditorias guardadas, ${result.clientes_eliminados} clientes importados eliminados`)
       loadResumenTodas()
@@ -365,6 +376,7 @@ export default function RecontactoClientesPage() {
       setError(err.message || 'Error al cerrar mes')
     } finally {
       setCerrandoMes(false)
+      setCierreMesProgreso('')
     }
   }
 
@@ -1629,7 +1641,7 @@ export default function RecontactoClientesPage() {
                       disabled={cerrandoMes}
                       className="px-4 py-2 rounded-lg bg-orange-600 text-white font-medium hover:bg-orange-500 disabled:opacity-50"
                     >
-                      {cerrandoMes ? 'Cerrando...' : 'Confirmar cierre'}
+                      {cerrandoMes ? (cierreMesProgreso ? `Cerrando... ${cierreMesProgreso}` : 'Cerrando...') : 'Confirmar cierre'}
                     </button>
                   </div>
                 </>
@@ -105,11 +105,24 @@ export const dashboardApi = {
 
 // Items
 export const itemsApi = {
-  search: (token: string, query: string) =>
-    apiFetch<any[]>(`/api/items/search?q=${encodeURIComponent(query)}`, { token }),
+  // Por defecto el stock viene solo del deposito de la sucursal del usuario
+  search: (token: string, query: string, todosDepositos = false) =>
+    apiFetch<any[]>(`/api/items/search?q=${encodeURIComponent(query)}${todosDepositos ? '&todos_depositos=true' : ''}`, { token }),
 
-  getStock: (token: string, codItem: string) =>
-    apiFetch<any>(`/api/items/stock/${codItem}`, { token }),
+  getStock: (token: string, codItem: string, todosDepositos = false) =>
+    apiFetch<any>(`/api/items/stock/${encodeURIComponent(codItem)}${todosDepositos ? '?todos_depositos=true' : ''}`, { token }),
+
+  // Resolver muchos codigos en un solo request (max 500)
+  batch: (token: string, codItems: string[], opciones?: { depositoId?: number; todosDepositos?: boolean }) =>
+    apiFetch<{ items: any[]; no_encontrados: string[] }>('/api/items/batch', {
+      method: 'POST',
+      token,
+      body: JSON.stringify({
+        cod_items: codItems,
+        deposito_id: opciones?.depositoId ?? null,
+        todos_depositos: opciones?.todosDepositos ?? false,
+      }),
+    }),
 }
 
 // Ventas Perdidas
@@ -182,8 +195,12 @@ export const ventasPerdidasApi = {
 
 // Auditoría
 export const auditoriaApi = {
-  stockNegativo: (token: string) =>
-    apiFetch<any[]>('/api/auditoria/stock-negativo', { token }),
+  stockNegativo: (token: string, sucursalId?: number) =>
+    apiFetch<any[]>(`/api/auditoria/stock-negativo${sucursalId ? `?sucursal_id=${sucursalId}` : ''}`, { token }),
+
+  // Resumen de stock negativo por sucursal (solo encargados)
+  stockNegativoResumen: (token: string) =>
+    apiFetch<any[]>('/api/auditoria/stock-negativo/resumen', { token }),
 
   pilares: (token: string) =>
     apiFetch<any[]>('/api/auditoria/pilares', { token }),
@@ -421,6 +438,27 @@ export const vencimientosApi = {
       token,
     }),
 
+  actualizarLote: (token: string, items: Array<{
+    id: number
+    estado?: string
+    notas?: string
+    cantidad_vendida?: number
+    accion_comercial?: string | null
+    sucursal_destino_id?: number | null
+    sucursal_destino_nombre?: string | null
+    fecha_movimiento?: string | null
+  }>) =>
+    apiFetch<{
+      success: boolean
+      actualizados: number
+      errores: number
+      resultados: Array<{ id: number; ok: boolean; error: string | null; vencimiento: any | null }>
+    }>('/api/vencimientos/actualizar-lote', {
+      method: 'POST',
+      body: JSON.stringify({ items }),
+      token,
+    }),
+
   resumen: (token: string, sucursalId?: number) => {
     const params = new URLSearchParams()
     if (sucursalId) params.append('sucursal_id', sucursalId.toString())
@@ -471,6 +509,15 @@ export const vencimientosApi = {
     const qs = params.toString()
     return apiFetch<any[]>(`/api/vencimientos/buscar-todos${qs ? `?${qs}` : ''}`, { token })
   },
+
+  sugerenciasRotacion: (token: string, sucursalId?: number) => {
+    const params = new URLSearchParams()
+    if (sucursalId) params.append('sucursal_id', sucursalId.toString())
+    const qs = params.toString()
+    return apiFetch<{ calculado_en: string | null; sugerencias: any[] }>(
+      `/api/vencimientos/rotacion/sugerencias${qs ? `?${qs}` : ''}`, { token }
+    )
+  },
 }
 
 // Recontactos
@@ -487,6 +534,12 @@ export const recontactosApi = {
     return apiFetch<any[]>(`/api/recontactos/${query ? `?${query}` : ''}`, { token })
   },
 
+  buscar: (token: string, q: string, sucursalId?: number) => {
+    const queryParams = new URLSearchParams({ q })
+    if (sucursalId) queryParams.append('sucursal_id', sucursalId.toString())
+    return apiFetch<any[]>(`/api/recontactos/buscar?${queryParams.toString()}`, { token })
+  },
+
   create: (token: string, data: {
     cliente_codigo?: string
     cliente_nombre: string
@@ -615,15 +668,32 @@ export const recontactosApi = {
     URL.revokeObjectURL(a.href)
   },
 
+  // El cierre corre en segundo plano: retorna un job_id para consultar con estadoCierreMes
   cerrarMes: (token: string, mes: string) =>
     apiFetch<{
       success: boolean
       mes: string
-      auditorias_guardadas: number
-      clientes_eliminados: number
-      contactos_eliminados: number
-      detalles: Array<{ sucursal: string; total_clientes: number; gestionados: number; avance: number }>
+      job_id: string
+      estado: string
     }>(`/api/recontactos/cerrar-mes?mes=${mes}`, { method: 'POST', token }),
+
+  estadoCierreMes: (token: string, jobId: string) =>
+    apiFetch<{
+      job_id: string
+      mes: string
+      estado: 'pendiente' | 'en_proceso' | 'completado' | 'error'
+      progreso: number
+      mensaje: string | null
+      error: string | null
+      resultado: {
+        success: boolean
+        mes: string
+        auditorias_guardadas: number
+        clientes_eliminados: number
+        contactos_eliminados: number
+        detalles: Array<{ sucursal: string; total_clientes: number; gestionados: number; avance: number }>
+      } | null
+    }>(`/api/recontactos/cerrar-mes/${jobId}`, { token }),
 }
 
 // Peluquería - Precios de Servicios
@@ -683,11 +753,12 @@ export const controlStockApi = {
     titulo: string
     descripcion?: string
     fecha_vencimiento: string
-    productos: Array<{
+    cod_items?: string[]
+    productos?: Array<{
       cod_item: string
-      nombre: string
-      precio: number
-      stock_sistema: number
+      nombre?: string
+      precio?: number
+      stock_sistema?: number
     }>
   }) =>
     apiFetch<any>('/api/control-stock/tareas', {
@@ -696,6 +767,15 @@ export const controlStockApi = {
       token,
     }),
 
+  // Productos sugeridos por riesgo para la proxima tarea de conteo
+  propuestaConteo: (token: string, limite: number = 30) =>
+    apiFetch<{
+      sucursal_id: number
+      calculado_en: string | null
+      calculando: boolean
+      productos: Array<{ cod_item: string; nombre: string; precio: number; stock_sistema: number; puntaje: number }>
+    }>(`/api/control-stock/seleccion/propuesta?limite=${limite}`, { token }),
+
   // Obtener conteo asociado a una tarea
   getConteo: (token: string, tareaId: number) =>
     apiFetch<any>(`/api/control-stock/conteo/${tareaId}`, { token }),
@@ -759,10 +839,11 @@ export const controlStockApi = {
     }>('/api/control-stock/auditoria/resumen', { token }),
 
   // Listar conteos para auditoría
-  listarConteos: (token: string, params?: { estado?: string; mes?: string }) => {
+  listarConteos: (token: string, params?: { estado?: string; mes?: string; resumen?: boolean }) => {
     const queryParams = new URLSearchParams()
     if (params?.estado) queryParams.append('estado', params.estado)
     if (params?.mes) queryParams.append('mes', params.mes)
+    if (params?.resumen) queryParams.append('resumen', 'true')
     const query = queryParams.toString()
     return apiFetch<any[]>(`/api/control-stock/auditoria/conteos${query ? `?${query}` : ''}`, { token })
   },
@@ -932,6 +1013,25 @@ export const facturasApi = {
   getOne: (token: string, id: number) =>
     apiFetch<any>(`/api/facturas/${id}`, { token }),
 
+  // Imagen en binario (multipart); el JSON de la factura ya no lleva base64
+  subirImagen: async (token: string, id: number, file: File) => {
+    const formData = new FormData()
+    formData.append('imagen', file)
+    const res = await fetch(`${API_URL}/api/facturas/${id}/imagen`, {
+      method: 'PUT',
+      headers: { 'Authorization': `Bearer ${token}` },
+      body: formData,
+    })
+    if (!res.ok) {
+      const error = await res.json().catch(() => ({ detail: 'Error al subir la imagen de la factura' }))
+      throw new Error(error.detail || 'Error al subir la imagen de la factura')
+    }
+    return res.json()
+  },
+
+  getImagenUrl: (id: number) =>
+    `${API_URL}/api/facturas/${id}/imagen`,
+
   crearNotaCredito: (token: string, data: {
     proveedor_nombre: string
     motivo: string
@@ -65,7 +65,40 @@ ALTER TABLE tareas_sucursal
 ADD CONSTRAINT chk_tareas_estado
 CHECK (estado IN ('pendiente', 'en_progreso', 'completada'));
 
+-- Busqueda de productos (GET /api/items/search)
+-- La expresion debe coincidir con ITEM_TEXTO_SQL de backend/app/routes/items.py
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_items_central_cod_item ON items_central(cod_item);
+CREATE INDEX IF NOT EXISTS ix_items_central_busqueda_trgm ON items_central USING gin (
+    lower(coalesce(item, '') || ' ' || coalesce(marca_nombre, '') || ' ' || coalesce(cod_item, '')) gin_trgm_ops
+);
+
+-- Stock normalizado por producto y deposito (se llena desde items_central.stock,
+-- ver refrescar_stock_depositos en backend/app/routes/items.py)
+CREATE TABLE IF NOT EXISTS stock_depositos (
+    id SERIAL PRIMARY KEY,
+    cod_item VARCHAR(100) NOT NULL,
+    deposito_id INTEGER NOT NULL,
+    deposito_nombre VARCHAR(200),
+    stock_real NUMERIC,
+    stock_disponible NUMERIC,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_stock_depositos_item_deposito ON stock_depositos(cod_item, deposito_id);
+CREATE INDEX IF NOT EXISTS ix_stock_depositos_deposito_id ON stock_depositos(deposito_id);
+CREATE INDEX IF NOT EXISTS ix_stock_depositos_negativo ON stock_depositos(deposito_id, cod_item)
+    WHERE stock_disponible < 0;
+
+-- Firma (md5 del JSON de stock) de cada producto al ultimo refresco de stock_depositos;
+-- aparte porque un producto puede quedar sin filas y no debe reprocesarse si no cambio
+CREATE TABLE IF NOT EXISTS stock_depositos_firmas (
+    cod_item VARCHAR(100) PRIMARY KEY,
+    firma VARCHAR(32) NOT NULL
+);
+
 -- Comentarios
 COMMENT ON TABLE ventas_perdidas IS 'Registro de ventas perdidas por falta de stock o producto nuevo';
 COMMENT ON TABLE evaluaciones_auditoria IS 'Evaluaciones de los pilares de auditoría por sucursal';
 COMMENT ON TABLE tareas_sucursal IS 'Tareas asignadas a cada sucursal';
+COMMENT ON TABLE stock_depositos IS 'Stock por producto y deposito, normalizado desde items_central.stock';
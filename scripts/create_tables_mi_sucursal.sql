@@ -178,6 +178,107 @@ CREATE INDEX IF NOT EXISTS idx_prod_venc_fecha ON productos_vencimientos(fecha_v
 CREATE INDEX IF NOT EXISTS idx_prod_venc_estado ON productos_vencimientos(estado);
 CREATE INDEX IF NOT EXISTS idx_prod_venc_cod_item ON productos_vencimientos(cod_item);
 
+-- 10. RECONTACTOS: clave de merge de la importacion CSV
+-- Un cliente general por (sucursal, nombre normalizado). Si falla por duplicados previos, revisarlos con:
+--   SELECT sucursal_id, lower(btrim(cliente_nombre)), COUNT(*) FROM clientes_recontacto
+--   WHERE COALESCE(tipo_servicio, 'general') = 'general' GROUP BY 1, 2 HAVING COUNT(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_recontacto_sucursal_nombre
+    ON clientes_recontacto (sucursal_id, lower(btrim(cliente_nombre)))
+    WHERE COALESCE(tipo_servicio, 'general') = 'general';
+
+-- 11. CONTADORES DE RECONTACTOS (resumenes sin recorrer clientes ni contactos)
+-- Carga inicial: al final de esta seccion (misma consulta que recalcular_contadores en routes/recontactos.py).
+-- Para reconstruirlos mas adelante: POST /api/recontactos/recalcular-contadores (admin)
+CREATE TABLE IF NOT EXISTS recontactos_contadores (
+    id SERIAL PRIMARY KEY,
+    sucursal_id INTEGER NOT NULL,
+    tipo_servicio VARCHAR(30) NOT NULL DEFAULT 'general',
+    fecha DATE NOT NULL,
+    estado VARCHAR(30) NOT NULL,
+    delta_clientes INTEGER NOT NULL DEFAULT 0,
+    contactados INTEGER NOT NULL DEFAULT 0,
+    contactados_semana INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_recontactos_contador UNIQUE (sucursal_id, tipo_servicio, fecha, estado)
+);
+CREATE INDEX IF NOT EXISTS ix_recontactos_contadores_sucursal_id ON recontactos_contadores(sucursal_id);
+
+-- Carga inicial (solo si la tabla esta vacia)
+INSERT INTO recontactos_contadores
+    (sucursal_id, tipo_servicio, fecha, estado, delta_clientes, contactados, contactados_semana)
+SELECT sucursal_id, tipo_servicio, fecha, estado,
+       SUM(delta_clientes), SUM(contactados), SUM(contactados_semana)
+FROM (
+    -- Foto actual de clientes por estado
+    SELECT sucursal_id, COALESCE(tipo_servicio, 'general') AS tipo_servicio,
+           CURRENT_DATE AS fecha, COALESCE(estado, 'pendiente') AS estado,
+           COUNT(*) AS delta_clientes, 0 AS contactados, 0 AS contactados_semana
+    FROM clientes_recontacto
+    GROUP BY 1, 2, 3, 4
+
+    UNION ALL
+
+    -- Contactos de la semana: cada cliente cuenta una vez por dia y una vez en la semana
+    SELECT cr.sucursal_id, COALESCE(cr.tipo_servicio, 'general'),
+           c.dia, COALESCE(cr.estado, 'pendiente'),
+           0, COUNT(*), COUNT(*) FILTER (WHERE c.dia = c.primer_dia)
+    FROM (
+        SELECT DISTINCT
+            cliente_recontacto_id,
+            DATE(fecha_contacto) AS dia,
+            MIN(DATE(fecha_contacto)) OVER (PARTITION BY cliente_recontacto_id) AS primer_dia
+        FROM registros_contacto
+        WHERE fecha_contacto >= date_trunc('week', CURRENT_DATE)
+    ) c
+    JOIN clientes_recontacto cr ON cr.id = c.cliente_recontacto_id
+    GROUP BY 1, 2, 3, 4
+) t
+WHERE NOT EXISTS (SELECT 1 FROM recontactos_contadores)
+GROUP BY sucursal_id, tipo_servicio, fecha, estado;
+
+-- 12. BUSQUEDA DE CLIENTES DE RECONTACTO (GET /api/recontactos/buscar)
+-- Las expresiones deben coincidir con BUSQUEDA_TSV_SQL / BUSQUEDA_TRGM_SQL de routes/recontactos.py
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_recontacto_busqueda_tsv ON clientes_recontacto USING gin (
+    to_tsvector('simple', coalesce(cliente_nombre, '') || ' ' || coalesce(mascota, '') || ' ' ||
+        coalesce(cliente_codigo, '') || ' ' || regexp_replace(coalesce(cliente_telefono, ''), '[^0-9]', '', 'g'))
+);
+CREATE INDEX IF NOT EXISTS ix_recontacto_busqueda_trgm ON clientes_recontacto USING gin (
+    lower(coalesce(cliente_nombre, '') || ' ' || coalesce(mascota, '') || ' ' ||
+        coalesce(cliente_codigo, '') || ' ' || regexp_replace(coalesce(cliente_telefono, ''), '[^0-9]', '', 'g'))
+    gin_trgm_ops
+);
+
+-- 13. VENCIMIENTOS: indice parcial de productos activos (resumen, listados por fecha, transicion a vencido)
+CREATE INDEX IF NOT EXISTS ix_prod_venc_activos
+    ON productos_vencimientos (sucursal_id, fecha_vencimiento)
+    WHERE estado IN ('proximo', 'vencido');
+
+-- 14. VENCIMIENTOS: busqueda cross-sucursal (GET /api/vencimientos/buscar-todos), solo productos proximos
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_prod_venc_producto_trgm
+    ON productos_vencimientos USING gin (producto gin_trgm_ops)
+    WHERE estado = 'proximo';
+CREATE INDEX IF NOT EXISTS ix_prod_venc_cod_item_trgm
+    ON productos_vencimientos USING gin (cod_item gin_trgm_ops)
+    WHERE estado = 'proximo';
+
+-- 15. VENCIMIENTOS: deteccion de ventas desde facturas (tarea periodica vencimientos_detectar_ventas)
+ALTER TABLE productos_vencimientos ADD COLUMN IF NOT EXISTS ventas_revisadas_hasta DATE;
+
+-- 16. ALMACEN DE ARCHIVOS: los binarios pasan a disco (backend/app/core/archivos.py), la fila guarda el sha256.
+-- Las columnas anteriores quedan nulas a medida que la tarea archivos_migrar_blobs migra cada fila.
+ALTER TABLE tareas_fotos ADD COLUMN IF NOT EXISTS archivo_hash VARCHAR(64);
+ALTER TABLE tareas_fotos ALTER COLUMN foto_data DROP NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_tareas_fotos_archivo_hash ON tareas_fotos(archivo_hash);
+
+ALTER TABLE reportes_auditoria_pdf ADD COLUMN IF NOT EXISTS archivo_hash VARCHAR(64);
+ALTER TABLE reportes_auditoria_pdf ALTER COLUMN pdf_data DROP NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_reportes_auditoria_pdf_archivo_hash ON reportes_auditoria_pdf(archivo_hash);
+
+ALTER TABLE facturas_proveedores ADD COLUMN IF NOT EXISTS imagen_hash VARCHAR(64);
+ALTER TABLE facturas_proveedores ADD COLUMN IF NOT EXISTS imagen_content_type VARCHAR(100);
+CREATE INDEX IF NOT EXISTS ix_facturas_proveedores_imagen_hash ON facturas_proveedores(imagen_hash);
+
 -- ============================================================
 -- Verificacion
 -- ============================================================